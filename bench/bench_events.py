@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+
+bench_events.py
+---------------
+
+The overhead of firing an event through :class:`pyalpmm.events.Events`: with
+a handler, without one, a plain attribute of the events object and an event
+logged into a logfile.
+
+    python bench/bench_events.py [--tree PATH]
+"""
+
+import os
+import shutil
+import tempfile
+
+from timing import parse_args, per_call, report
+
+def main():
+    options, args = parse_args("%prog [options]")
+    from pyalpmm.events import Events
+
+    class BenchEvents(Events):
+        def ProgressInstall(self, **kw):
+            self.percent = kw["percent"]
+
+    events = BenchEvents()
+    events.percent = 0
+    report("bound event", per_call(
+        lambda: events.ProgressInstall(pkgname="foo", percent=1),
+        options.repeat))
+    report("unbound event", per_call(
+        lambda: events.ProgressRemove(pkgname="foo", percent=1),
+        options.repeat))
+    report("plain attribute access", per_call(
+        lambda: events.percent, options.repeat))
+
+    logdir = tempfile.mkdtemp(prefix="pyalpmm-bench-")
+    try:
+        events.logfile = os.path.join(logdir, "events.log")
+        report("logged event", per_call(
+            lambda: events.ProgressInstall(pkgname="foo", percent=1),
+            options.repeat))
+    finally:
+        shutil.rmtree(logdir, True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+
+bench_lookup.py
+---------------
+
+The cost of looking up one package by name, the old way through a
+"name__eq" search over the whole package cache (:meth:`PackageList.search`)
+against the name index of the database (:attr:`package_index`). A synthetic
+local database with --packages packages is written to a temporary directory
+and loaded through libalpm, so the bindings have to be built.
+
+    python bench/bench_lookup.py [--tree PATH] [--packages N]
+"""
+
+import os
+import time
+import shutil
+import tempfile
+
+from timing import parse_args, per_call, report
+
+DESC = """%NAME%
+{name}
+
+%VERSION%
+{version}
+
+%DESC%
+synthetic package number {num}
+
+%ARCH%
+any
+
+%SIZE%
+1024
+
+%REASON%
+1
+
+"""
+
+def add_options(parser):
+    parser.add_option("--packages", type="int", default=10000,
+                      help="the number of synthetic packages [default: %default]")
+
+def write_database(dbpath, count):
+    """Write a local database with `count` packages below `dbpath`, returns
+    the list of the package names
+    """
+    names = []
+    for num in xrange(count):
+        name, version = "pkg{0:05d}".format(num), "1.0-1"
+        pkgdir = os.path.join(dbpath, "local", "{0}-{1}".format(name, version))
+        os.makedirs(pkgdir)
+        with open(os.path.join(pkgdir, "desc"), "w") as fd:
+            fd.write(DESC.format(name=name, version=version, num=num))
+        for fn in ("depends", "files"):
+            open(os.path.join(pkgdir, fn), "w").close()
+        names.append(name)
+    return names
+
+def main():
+    options, args = parse_args("%prog [options]", add_options)
+    import pyalpmm_raw as p
+    from pyalpmm.database import LocalDatabase
+
+    tmpdir = tempfile.mkdtemp(prefix="pyalpmm-bench-")
+    try:
+        dbpath = os.path.join(tmpdir, "db")
+        names = write_database(dbpath, options.packages)
+        target = names[len(names) // 2]
+
+        p.alpm_initialize()
+        p.alpm_option_set_root(tmpdir)
+        p.alpm_option_set_dbpath(dbpath)
+        db = LocalDatabase()
+        # let libalpm load its package cache before measuring
+        len(db.get_packages())
+
+        print "{0:30} {1:10d}".format("packages", len(names))
+        report("name__eq search (before)", per_call(
+            lambda: list(db.get_packages().search(name__eq=target)),
+            options.repeat))
+
+        if not hasattr(LocalDatabase, "package_index"):
+            print "[i] this tree has no package_index"
+            return
+        start = time.time()
+        db.package_index
+        report("building package_index", time.time() - start)
+        report("package_index lookup (after)", per_call(
+            lambda: db.get_package(target), options.repeat))
+        report("missing name (after)", per_call(
+            lambda: db.get_package("no-such-package"), options.repeat))
+    finally:
+        shutil.rmtree(tmpdir, True)
+
+if __name__ == "__main__":
+    main()
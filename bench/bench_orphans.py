@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+
+bench_orphans.py
+----------------
+
+The orphan detection of :class:`pyalpmm.graph.PackageGraph` against the old
+per-package loop of System._is_package_unneeded(), which looked up every
+package with a scan over the whole package cache and checked it against a
+dict of dependency names. Both run on the same synthetic local database:
+a random dependency DAG where a fifth of the packages is installed
+explicitly.
+
+    python bench/bench_orphans.py [--tree PATH] [--packages N]
+"""
+
+import random
+
+from timing import parse_args, per_call, report
+
+class Reason(object):
+    def __init__(self, raw):
+        self.raw = raw
+
+class Dependency(object):
+    def __init__(self, name):
+        self.name = name
+
+class Package(object):
+    """Just the attributes the graph and the old loop look at"""
+    def __init__(self, name, reason, depends):
+        self.name = name
+        self.reason = Reason(reason)
+        self.depends = [Dependency(dep) for dep in depends]
+        self.provides, self.replaces = [], []
+
+def add_options(parser):
+    parser.add_option("--packages", type="int", default=2000,
+                      help="the number of synthetic packages, the old loop "
+                           "is quadratic [default: %default]")
+
+def make_packages(count, explicit, depend):
+    """A random DAG of `count` packages, each depending on up to 4 packages
+    with a higher number, the same for every run
+    """
+    rand = random.Random(count)
+    packages = []
+    for num in xrange(count):
+        later = xrange(num + 1, count)
+        deps = rand.sample(later, min(len(later), rand.randint(0, 4)))
+        reason = explicit if rand.random() < 0.2 else depend
+        packages.append(Package("pkg{0:05d}".format(num), reason,
+                                ["pkg{0:05d}".format(dep) for dep in deps]))
+    return packages
+
+def old_unneeded(packages, depend):
+    """The loop before the package graph, get_local_package() was a scan"""
+    dependency_map = {}
+    for pkg in packages:
+        for dep in pkg.depends:
+            dependency_map.setdefault(dep.name, []).append(pkg.name)
+
+    def get_local_package(pkgname):
+        for pkg in packages:
+            if pkg.name == pkgname:
+                return pkg
+
+    def is_unneeded(pkgname):
+        pkg = get_local_package(pkgname)
+        if pkg is None:
+            return True
+        if not pkg.reason.raw == depend:
+            return False
+        names = [pkgname] + list(pkg.replaces) + list(pkg.provides)
+        return all(name not in dependency_map for name in names)
+
+    return set(pkg for pkg in packages if is_unneeded(pkg.name))
+
+def main():
+    options, args = parse_args("%prog [options]", add_options)
+    import pyalpmm_raw as p
+    from pyalpmm.graph import PackageGraph
+
+    depend = p.PM_PKG_REASON_DEPEND
+    packages = make_packages(options.packages, p.PM_PKG_REASON_EXPLICIT,
+                             depend)
+    print "{0:30} {1:10d}".format("packages", len(packages))
+
+    report("old loop (leaves only)", per_call(
+        lambda: old_unneeded(packages, depend), min(options.repeat, 3)))
+    report("building the graph", per_call(
+        lambda: PackageGraph(packages), options.repeat))
+    graph = PackageGraph(packages)
+    report("graph.unneeded() (leaves)", per_call(
+        graph.unneeded, options.repeat))
+    report("graph.orphans() (transitive)", per_call(
+        graph.orphans, options.repeat))
+    print "{0:30} {1:10d}".format("leaves", len(graph.unneeded()))
+    print "{0:30} {1:10d}".format("orphans", len(graph.orphans()))
+
+if __name__ == "__main__":
+    main()
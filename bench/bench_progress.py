@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+
+bench_progress.py
+-----------------
+
+The overhead of one :meth:`pyalpmm.tools.ProgressBar.step_to` call, the way
+mmacman's download and install callbacks use it. stdin and stdout are
+pointed to a pseudo terminal with --columns columns while measuring, so the
+terminal width is asked for like on a real console.
+
+    python bench/bench_progress.py [--tree PATH] [--columns N]
+"""
+
+import os
+import pty
+import fcntl
+import struct
+import termios
+
+from timing import parse_args, per_call, report
+
+def add_options(parser):
+    parser.add_option("--columns", type="int", default=160,
+                      help="the width of the pseudo terminal [default: %default]")
+
+def main():
+    options, args = parse_args("%prog [options]", add_options)
+
+    master, slave = pty.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ,
+                struct.pack("HHHH", 50, options.columns, 0, 0))
+    saved = os.dup(0), os.dup(1)
+    os.dup2(slave, 0)
+    os.dup2(slave, 1)
+    try:
+        # imported here, the terminal width may be asked for on import
+        from pyalpmm.tools import ProgressBar
+        bar = ProgressBar(10 ** 9, "[D] foo-1.0-1-i686.pkg.tar.xz")
+        values = iter(xrange(10 ** 9))
+        seconds = per_call(lambda: bar.step_to(next(values)), options.repeat)
+    finally:
+        os.dup2(saved[0], 0)
+        os.dup2(saved[1], 1)
+        for fd in saved + (slave, master):
+            os.close(fd)
+    report("step_to()", seconds)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+
+bench_startup.py
+----------------
+
+The cold start: the time to import pyalpmm and the number of modules it
+pulls in, each measured in a fresh interpreter. With --mmacman, also the
+wall time of a whole "mmacman -Q", which needs a working pacman setup and
+config file.
+
+    python bench/bench_startup.py [--tree PATH] [--mmacman]
+"""
+
+import os
+import sys
+import time
+import subprocess
+
+from timing import parse_args, report
+
+IMPORT_PYALPMM = """
+import sys, time
+sys.path.insert(0, sys.argv[1])
+before = set(sys.modules)
+start = time.time()
+import pyalpmm
+elapsed = time.time() - start
+print elapsed, len([name for name in set(sys.modules) - before \\
+                    if sys.modules[name] is not None])
+"""
+
+def add_options(parser):
+    parser.add_option("--mmacman", action="store_true", default=False,
+                      help="measure 'mmacman -Q', too")
+
+def import_pyalpmm(tree):
+    """Import pyalpmm in a new interpreter, returns (seconds, modules)"""
+    output = subprocess.check_output(
+        [sys.executable, "-c", IMPORT_PYALPMM, tree])
+    elapsed, modules = output.split()
+    return float(elapsed), int(modules)
+
+def run_mmacman(tree):
+    """The wall time of 'mmacman -Q' in seconds"""
+    with open(os.devnull, "w") as devnull:
+        start = time.time()
+        subprocess.check_call(
+            [sys.executable, os.path.join(tree, "mmacman"), "-Q"],
+            stdout=devnull, cwd=tree)
+        return time.time() - start
+
+def main():
+    options, args = parse_args("%prog [options]", add_options)
+
+    # the first run may have to write the .pyc files
+    import_pyalpmm(options.tree)
+    runs = [import_pyalpmm(options.tree) for i in xrange(options.repeat)]
+    report("import pyalpmm", min(elapsed for elapsed, modules in runs))
+    print "{0:30} {1:10d}".format("modules imported", runs[0][1])
+
+    if options.mmacman:
+        run_mmacman(options.tree)
+        report("mmacman -Q", min(run_mmacman(options.tree) \
+                                 for i in xrange(options.repeat)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+
+timing.py
+---------
+
+Shared helpers for the benchmarks. Every benchmark measures the pyalpmm
+tree given with --tree, the checkout containing bench/ by default. So the
+numbers before a change are taken from a second checkout, i.e.:
+
+    git worktree add /tmp/before <commit>^
+    python bench/bench_events.py --tree /tmp/before
+    python bench/bench_events.py
+"""
+
+import os
+import sys
+import timeit
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_args(usage, setup=None):
+    """Parse the commandline, the measured tree is put in front of sys.path
+
+    :param usage: the usage line for the help
+    :param setup: a callable adding more options to the parser (optional)
+    """
+    parser = OptionParser(usage=usage)
+    parser.add_option("--tree", default=ROOT,
+                      help="the pyalpmm checkout to measure [default: %default]")
+    parser.add_option("--repeat", type="int", default=5,
+                      help="take the best of this many runs [default: %default]")
+    if setup is not None:
+        setup(parser)
+    options, args = parser.parse_args()
+    options.tree = os.path.abspath(options.tree)
+    sys.path.insert(0, options.tree)
+    return options, args
+
+def per_call(fn, repeat=5, min_time=0.2):
+    """The best time in seconds of one call of `fn`, the number of calls per
+    run grows until a run takes at least `min_time` seconds
+
+    :param fn: the callable to measure, called without arguments
+    :param repeat: the number of runs
+    :param min_time: the minimal duration of one run in seconds
+    """
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    return min([elapsed] + timer.repeat(repeat - 1, number)) / number
+
+def report(label, seconds):
+    """Print `seconds` in a readable unit"""
+    if seconds >= 1e-3:
+        print "{0:30} {1:10.1f}ms".format(label, seconds * 1e3)
+    else:
+        print "{0:30} {1:10.2f}us".format(label, seconds * 1e6)
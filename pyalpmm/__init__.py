@@ -1,4 +1,5 @@
-__all__ = ["session", "item", "lists", "database", "options", "transaction", "tools"]
+__all__ = ["session", "item", "lists", "database", "options", "transaction", "tools",
+           "aur", "daemon", "download", "fileindex", "graph", "mirrors", "pkgbuild", "scheduler", "table", "textindex"]
 
 
 from pyalpmm.session import Session, System
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+
+aur.py
+------
+
+This module implements the client for the RPC interface of the AUR. Many
+package names are resolved with one "multiinfo" request, the replies are
+parsed as JSON and kept inside an on-disk cache for a configurable time. Names
+the AUR does not know are cached as well, so checking a whole set of
+packages against the AUR costs a handful of requests at most once per TTL.
+"""
+
+import os
+import time
+import json
+import marshal
+import urllib
+import urllib2
+
+class AURClient(object):
+    """A caching client for the AUR RPC interface
+
+    :param config: the :class:`pyalpmm.options.PyALPMMConfiguration` instance
+    """
+    # the number of names asked for with one request
+    batch_size = 100
+    # bump this, if the cache format changes
+    format_version = 1
+
+    def __init__(self, config):
+        self.config = config
+        self.cache_fn = config.aur_rpc_cache
+        self.ttl = config.aur_rpc_ttl
+        self.cache = self._load()
+        self.requests = 0
+
+    def _load(self):
+        """Read the cached replies, the expired ones are dropped"""
+        empty = {"version": self.format_version, "info": {}, "search": {}}
+        try:
+            with open(self.cache_fn, "rb") as fd:
+                cache = marshal.load(fd)
+        except (IOError, EOFError, ValueError, TypeError) as e:
+            return empty
+        if not isinstance(cache, dict) or \
+           cache.get("version") != self.format_version:
+            return empty
+
+        now = time.time()
+        for kind in ("info", "search"):
+            cache[kind] = dict((key, entry) for key, entry in \
+                               cache[kind].items() if now - entry[0] < self.ttl)
+        return cache
+
+    def save(self):
+        """Persist the cache, silently skipped without write access"""
+        try:
+            with open(self.cache_fn + ".tmp", "wb") as fd:
+                marshal.dump(self.cache, fd)
+            os.rename(self.cache_fn + ".tmp", self.cache_fn)
+        except (IOError, OSError) as e:
+            pass
+
+    def _request(self, query):
+        """Send one RPC request and return the list of results, an error
+        reply (i.e. "No results found") gives an empty list. Returns None if
+        the AUR could not be reached or answered garbage.
+
+        :param query: the part of the url after aur_url
+        """
+        self.requests += 1
+        try:
+            reply = json.load(urllib2.urlopen(self.config.aur_url + query))
+        except (urllib2.URLError, IOError, ValueError) as e:
+            return None
+        if not isinstance(reply, dict):
+            return None
+
+        results = reply.get("results")
+        if isinstance(results, dict):
+            # "info" replies with a single dict
+            results = [results]
+        elif not isinstance(results, list):
+            # i.e. an error message
+            return []
+        # keep plain str like everywhere else in pyalpmm
+        utf8 = lambda v: v.encode("utf-8") if isinstance(v, unicode) else v
+        return [dict((utf8(k), utf8(v)) for k, v in res.items()) \
+                for res in results if isinstance(res, dict)]
+
+    def info(self, names):
+        """Return a dict mapping each name in `names`, which is known to the
+        AUR, to its RPC result dict. Uncached names are resolved in batches.
+
+        :param names: an iterable of package names
+        """
+        names = set(names)
+        cached = self.cache["info"]
+        missing = sorted(name for name in names if name not in cached)
+
+        now = time.time()
+        for i in xrange(0, len(missing), self.batch_size):
+            batch = missing[i:i + self.batch_size]
+            args = "".join("&arg[]=" + urllib.quote(name) for name in batch)
+            results = self._request(
+                self.config.rpc_multi_command % {"args": args})
+            if results is None:
+                # don't remember the names as unknown, the AUR was not reached
+                continue
+            found = dict((res.get("Name"), res) for res in results)
+            for name in batch:
+                cached[name] = (now, found.get(name))
+        if missing:
+            self.save()
+
+        return dict((name, cached[name][1]) for name in names \
+                    if cached.get(name, (0, None))[1] is not None)
+
+    def search(self, arg):
+        """Return the list of RPC result dicts for a search after `arg`
+
+        :param arg: the search string
+        """
+        cached = self.cache["search"]
+        if arg not in cached:
+            results = self._request(self.config.rpc_command % {
+                "type": "search", "arg": urllib.quote(arg)})
+            if results is None:
+                return []
+            cached[arg] = (time.time(), results)
+            self.save()
+        return cached[arg][1]
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+
+daemon.py
+---------
+
+This module keeps one :class:`pyalpmm.session.Session` alive and answers
+read-only queries (search, info, owns, orphans and the upgrade plan) through a
+Unix socket. So the clients don't pay for the session startup, and the warm
+caches (package tables, text and file index) are shared between them.
+
+The protocol is line based JSON: the client sends one request per line like
+{"query": "search", "args": {"pkgname": "xterm"}} and gets one line back,
+either {"result": ...} or {"error": "..."}.
+
+Before each request the mtimes of the database directories are checked, if
+one of them changed the whole session is set up again.
+
+Every client connection is served by its own thread, so an idle client keeps
+nobody waiting, but the requests themselves are answered one after another.
+"""
+
+import os
+import json
+import socket
+import threading
+import SocketServer
+
+from session import Session, System
+from lists import LazyList
+from item import AbstractItem
+from tools import CriticalError, FancyOutput
+
+class DaemonError(CriticalError):
+    pass
+
+def _plain(value):
+    """Convert `value` into something JSON can represent"""
+    if isinstance(value, FancyOutput):
+        return value.raw
+    elif isinstance(value, LazyList):
+        return [_plain(item) for item in value]
+    elif isinstance(value, AbstractItem):
+        return dict((key, _plain(value.get_info(key))) \
+                    for key in value.attributes)
+    return value
+
+def _to_str(value):
+    """Turn all unicode objects inside the decoded JSON `value` into str"""
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    elif isinstance(value, list):
+        return [_to_str(item) for item in value]
+    elif isinstance(value, dict):
+        return dict((_to_str(k), _to_str(v)) for k, v in value.items())
+    return value
+
+def _record(pkg, *fields):
+    """A dict with the `fields` of `pkg`, versions as plain str"""
+    return dict((field, _plain(pkg.get_info(field))) for field in fields)
+
+class _RequestHandler(SocketServer.StreamRequestHandler):
+    """Answers the requests of one client connection, one per line"""
+    def handle(self):
+        for line in iter(self.rfile.readline, ""):
+            self.wfile.write(self.server.daemon.handle_line(line) + "\n")
+            self.wfile.flush()
+
+class _ThreadingServer(SocketServer.ThreadingMixIn,
+                       SocketServer.UnixStreamServer):
+    """One thread per client connection, see :class:`_RequestHandler`"""
+    daemon_threads = True
+
+class QueryDaemon(object):
+    """Serves read-only queries from one long-lived session
+
+    :param config: the :class:`pyalpmm.options.PyALPMMConfiguration` instance
+    :param socket_path: the Unix socket to listen on (optional, defaults to
+                        `daemon_socket` from the config)
+    """
+    # files inside the sync directory, which are no databases
+    ignored_suffixes = (".trgm", ".trgm.tmp")
+
+    def __init__(self, config, socket_path=None):
+        self.config = config
+        self.socket_path = socket_path or config.daemon_socket
+        self.session = self.system = None
+        self.signature = None
+        # libalpm is not thread-safe, only one request is handled at a time
+        self.lock = threading.Lock()
+        self.reload()
+
+    def _db_signature(self):
+        """The mtime of the local database directory and the names and mtimes
+        of all entries inside the sync directory. The search indices written
+        there (see :attr:`pyalpmm.database.SyncDatabase.text_index_path`) are
+        left out, as is the mtime of the sync directory itself, which changes
+        with them.
+        """
+        base = self.config.local_db_path
+        sync = os.path.join(base, "sync")
+        paths = [os.path.join(base, "local")]
+        try:
+            paths += [os.path.join(sync, fn) for fn in sorted(os.listdir(sync))
+                      if not fn.endswith(self.ignored_suffixes)]
+        except OSError as e:
+            paths.append(sync)
+
+        signature = []
+        for path in paths:
+            try:
+                signature.append((path, os.stat(path).st_mtime))
+            except OSError as e:
+                signature.append((path, None))
+        return signature
+
+    def reload(self):
+        """Set up the session again, unregistering all databases before"""
+        if self.session is not None:
+            self.session.release()
+        self.signature = self._db_signature()
+        self.session = Session(self.config)
+        self.system = System(self.session)
+
+    def check(self):
+        """Reload, if the databases changed on disk since the last time"""
+        if self._db_signature() != self.signature:
+            self.reload()
+
+    def handle_line(self, line):
+        """Answer the request `line`, returns the JSON encoded reply"""
+        with self.lock:
+            return self._handle_line(line)
+
+    def _handle_line(self, line):
+        try:
+            request = _to_str(json.loads(line))
+            handler = getattr(self, "query_" + request["query"], None)
+            if handler is None:
+                raise DaemonError("Unknown query: {0}".format(request["query"]))
+            self.check()
+            reply = {"result": handler(**request.get("args", {}))}
+        except Exception as e:
+            # i.e. a bad regular expression, the client gets the error and
+            # the connection (and the daemon) keeps going
+            reply = {"error": "{0}: {1}".format(e.__class__.__name__, e)}
+        return json.dumps(reply)
+
+    def query_search(self, pkgname, regex=False, ranked=False):
+        """See :meth:`pyalpmm.session.System.search_packages`"""
+        return [_record(pkg, "repo", "name", "version", "desc") \
+                for pkg in self.system.search_packages(pkgname, regex, ranked)]
+
+    def query_info(self, pkgname, local=True):
+        """All attributes of the package `pkgname`, taken from the local
+        database or (`local` set to False) from the sync repositories
+        """
+        db_man = self.session.db_man
+        pkg = db_man.get_local_package(pkgname) if local \
+              else db_man.get_sync_package(pkgname)
+        if pkg is None:
+            return None
+
+        info = {"repo": pkg.repo}
+        for key in pkg.all_attributes:
+            try:
+                info[key] = _plain(pkg.get_info(key))
+            except KeyError as e:
+                # not available with this libalpm
+                pass
+        return info
+
+    def query_owns(self, path):
+        """The package owning `path`, see
+        :meth:`pyalpmm.session.System.owner_of_file`
+        """
+        pkg = self.system.owner_of_file(path.lstrip("/"))
+        return pkg and _record(pkg, "name", "version")
+
+    def query_orphans(self, transitive=True):
+        """See :meth:`pyalpmm.session.System.get_unneeded_packages`"""
+        return sorted((_record(pkg, "name", "version") for pkg in \
+                       self.system.get_unneeded_packages(transitive)),
+                      key=lambda rec: rec["name"])
+
+    def query_plan_upgrade(self):
+        """See :meth:`pyalpmm.session.System.plan_upgrade`"""
+        plan = self.system.plan_upgrade()
+        return {
+            "upgrades": [{"name": loc_pkg.name,
+                          "version": _plain(loc_pkg.version),
+                          "new_version": _plain(sync_pkg.version),
+                          "repo": sync_pkg.repo} \
+                         for loc_pkg, sync_pkg in plan.upgrades],
+            "ignored": plan.ignored,
+            "download_size": plan.download_size,
+            "install_size": plan.install_size,
+            "size_change": plan.size_change
+        }
+
+    def serve_forever(self):
+        """Listen on the socket, each client connection gets its own thread,
+        while :meth:`handle_line` answers one request after another
+        """
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = _ThreadingServer(self.socket_path, _RequestHandler)
+        server.daemon = self
+        # the queries are read-only, so everybody may ask
+        os.chmod(self.socket_path, 0666)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.remove(self.socket_path)
+            self.session.release()
+
+class QueryClient(object):
+    """Sends queries to a running :class:`QueryDaemon`, one connection is
+    kept open for all queries
+
+    :param socket_path: the Unix socket the daemon listens on
+    :param timeout: the seconds to wait for a reply (optional)
+    """
+    def __init__(self, socket_path, timeout=60):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.sock = self.fd = None
+
+    def _connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+        self.fd = self.sock.makefile("rb")
+
+    def query(self, name, **args):
+        """Ask the daemon the query `name` with the keyword arguments `args`
+        and return the result, raises :class:`DaemonError` if the daemon
+        answers with an error and socket.error if it can't be reached
+
+        :param name: the query, i.e. "search" for :meth:`QueryDaemon.query_search`
+        """
+        if self.sock is None:
+            self._connect()
+        self.sock.sendall(json.dumps({"query": name, "args": args}) + "\n")
+        line = self.fd.readline()
+        if not line:
+            self.close()
+            raise DaemonError("The daemon closed the connection")
+
+        reply = _to_str(json.loads(line))
+        if "error" in reply:
+            raise DaemonError(reply["error"])
+        return reply["result"]
+
+    def close(self):
+        """Close the connection to the daemon"""
+        if self.sock is not None:
+            self.fd.close()
+            self.sock.close()
+            self.sock = self.fd = None
@@ -16,27 +16,106 @@ from time import time
 from itertools import chain
 import re
 import os
-import urllib
 
 import pyalpmm_raw as p
-from item import PackageItem
+from item import PackageItem, AURPackageItem
 from lists import PackageList, GroupList, AURPackageList
-from tools import CriticalError
+from table import PackageTable
+from textindex import TrigramIndex, rank
+from tools import CriticalError, CachedProperty
 
 class DatabaseError(CriticalError):
     pass
 
+class DeferredDatabase(object):
+    """Creates (and so registers with libalpm) a database on its first call,
+    every following call returns the same instance
+
+    :param tree: the name of the database
+    :param factory: a callable returning the :class:`AbstractDatabase`
+    :param previous: the DeferredDatabase registered right before, it is
+                     created first as libalpm takes the registration order as
+                     the priority of the sync databases (optional)
+    """
+    def __init__(self, tree, factory, previous=None):
+        self.tree = tree
+        self.factory = factory
+        self.previous = previous
+        self.instance = None
+
+    def __call__(self):
+        if self.instance is None:
+            if self.previous is not None:
+                self.previous()
+            self.instance = self.factory()
+            self.instance.tree = self.tree
+        return self.instance
+
+class DatabaseShelf(dict):
+    """A dict mapping the tree names to the databases. A value may be a
+    :class:`DeferredDatabase`, it is replaced by the database on the first
+    access through the values. The keys and membership tests don't create
+    anything.
+    """
+    def __getitem__(self, tree):
+        db = dict.__getitem__(self, tree)
+        if isinstance(db, DeferredDatabase):
+            db = db()
+            dict.__setitem__(self, tree, db)
+        return db
+
+    def get(self, tree, default=None):
+        return self[tree] if tree in self else default
+
+    def values(self):
+        return [self[tree] for tree in self]
+
+    def items(self):
+        return [(tree, self[tree]) for tree in self]
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def created(self):
+        """Return the databases, which exist already"""
+        out = []
+        for db in dict.values(self):
+            if isinstance(db, DeferredDatabase):
+                db = db.instance
+            if db is not None:
+                out.append(db)
+        return out
+
 class DatabaseManager(object):
     """Handles the different repositories and databases. Most use-cases will
     nicely fit into the methods this class provides, which are mainly to
     search/examine/compare different packages from different repositories.
-    """
-    dbs = {}
-    local_dbs = {}
-    sync_dbs = {}
 
-    def __init__(self, events):
+    :param events: the :class:`pyalpmm.events.Events` instance
+    :param downloader: the :class:`pyalpmm.download.Downloader` or a callable
+                       returning it, then it is created on first use
+                       (optional)
+    """
+    def __init__(self, events, downloader=None):
         self.events = events
+        if callable(downloader):
+            self.downloader_factory = downloader
+        else:
+            self.downloader_factory = lambda: downloader
+        # per instance, so a new session starts without the old databases
+        self.dbs = DatabaseShelf()
+        self.local_dbs = DatabaseShelf()
+        self.sync_dbs = DatabaseShelf()
+        # the registration order, libalpm keeps the sync databases that way
+        self.order = []
+
+    @CachedProperty
+    def downloader(self):
+        """The downloader, created by `downloader_factory` on first use"""
+        return self.downloader_factory()
 
     def __getitem__(self, tree):
         if isinstance(tree, str):
@@ -107,17 +186,28 @@ class DatabaseManager(object):
         """Register a new database to the libalpm backend
 
         :param tree: the name of the database
-        :param db: the :class:`AbstractDatabase` ancestor instance
+        :param db: the :class:`AbstractDatabase` ancestor instance or a
+                   callable returning one, then the database is created and
+                   registered on its first access (see :meth:`load_all`)
         """
         if tree in self.dbs:
             raise DatabaseError(
                 "You cannot register a database twice: {0}".format(tree)
             )
 
+        db_shelf = self.local_dbs if tree == "local" else self.sync_dbs
         if isinstance(db, AbstractDatabase):
             db.tree = tree
-            db_shelf = self.local_dbs if tree == "local" else self.sync_dbs
             self[tree] = db_shelf[tree] = db
+            self.order.append(tree)
+        elif callable(db):
+            previous = self.order and dict.get(self.dbs, self.order[-1])
+            if not isinstance(previous, DeferredDatabase):
+                previous = None
+            deferred = DeferredDatabase(tree, db, previous)
+            dict.__setitem__(self.dbs, tree, deferred)
+            dict.__setitem__(db_shelf, tree, deferred)
+            self.order.append(tree)
         else:
             raise DatabaseError("Second parameter in register() must be an \
                                 AbstractDatabase ancestor, but is: {0}".\
@@ -138,20 +228,29 @@ class DatabaseManager(object):
         repos = self._get_repositories(repos or self.sync_dbs.keys())
         force = force and 1 or 0
         out, exceptions = [], []
-        for repo in repos:
-            try:
-                ret = repo.update(force)
-            except DatabaseError as e:
-                if not collect_exceptions:
-                    raise e
-                # if collect_exceptions is True, just save exception
-                exceptions.append(e)
-                self.events.DatabaseUpdateError(repo=repo.tree)
-            else:
-                if ret:
-                    self.events.DatabaseUpdated(repo=repo.tree)
+        fetching = self._prepare_fetch(repos, force)
+        try:
+            for repo in repos:
+                try:
+                    ret = repo.update(force)
+                except DatabaseError as e:
+                    if not collect_exceptions:
+                        raise e
+                    # if collect_exceptions is True, just save exception
+                    exceptions.append(e)
+                    self.events.DatabaseUpdateError(repo=repo.tree)
                 else:
-                    self.events.DatabaseUpToDate(repo=repo.tree)
+                    if ret:
+                        self.events.DatabaseUpdated(repo=repo.tree)
+                    else:
+                        self.events.DatabaseUpToDate(repo=repo.tree)
+
+                # the cached pmpkg_t pointers are invalid after an update
+                repo.reset_caches()
+        finally:
+            if fetching:
+                p.alpm_option_set_fetchcb(None)
+                self.downloader.clear()
 
         if len(exceptions) > 0:
             print "[-] the following exceptions occured, while updating"
@@ -159,6 +258,34 @@ class DatabaseManager(object):
                 print "[e] {0}".format(ex)
 
 
+    def _prepare_fetch(self, repos, force):
+        """Download the database files of all `repos` concurrently from the
+        best mirrors up front, libalpm picks them up through the fetch
+        callback. Returns False if there is no downloader, then libalpm
+        downloads them on its own.
+
+        :param repos: the list of database instances to be updated
+        :param force: download the databases, even if they are up to date
+        """
+        if self.downloader is None:
+            return False
+
+        self.downloader.reset_stats()
+        self.downloader.stage(
+            [repo.db_urls for repo in repos if repo.db_urls],
+            os.path.join(p.alpm_option_get_dbpath(), "sync"), force)
+        p.alpm_option_set_fetchcb(self.downloader.fetch)
+        return True
+
+    def reset_caches(self, repos=None):
+        """Drop the lazily built lookup structures of all (or the given)
+        databases, they will be rebuilt on their next use
+
+        :param repos: the list of repository-names to reset (optional)
+        """
+        for repo in self._get_repositories(repos or self.dbs.keys()):
+            repo.reset_caches()
+
     def search_package(self, repos=None, **kw):
         """Search for a package (in the given repos) with given properties
         i.e. pass name="xterm"
@@ -189,26 +316,28 @@ class DatabaseManager(object):
         """
         return self.search_package(repos=self.sync_dbs.keys(), **kw)
 
-    def get_packages(self, repos=None):
+    def get_packages(self, repos=None, prefetch=None):
         """Get all packages from all databases, actually returns an iterator
 
         :param repos: a list of the repositories, which will be used for this
                       operation
+        :param prefetch: a list of attribute names to fetch for each package
+                         (optional)
         """
         repos = self._get_repositories(repos or self.dbs.keys())
         for repo in repos:
-            pkglist = repo.get_packages()
+            pkglist = repo.get_packages(prefetch=prefetch)
             for pkg in pkglist:
                 pkg.repo = repo.tree
                 yield pkg
 
-    def get_local_packages(self):
+    def get_local_packages(self, prefetch=None):
         """Returns an iterator over all local packages - shortcut"""
-        return self.get_packages(self.local_dbs.keys())
+        return self.get_packages(self.local_dbs.keys(), prefetch=prefetch)
 
-    def get_sync_packages(self):
+    def get_sync_packages(self, prefetch=None):
         """Returns an iterator over all sync repository packages - shortcut"""
-        return self.get_packages(self.sync_dbs.keys())
+        return self.get_packages(self.sync_dbs.keys(), prefetch=prefetch)
 
     def get_groups(self, repos=None):
         """Get all groups from all databases
@@ -269,12 +398,11 @@ class DatabaseManager(object):
                 )
         repos = self._get_repositories(repos or self.dbs.keys())
 
-        query = {"name__eq": pkgname}
         found = []
         for repo in repos:
-            for pkg in repo.search_package(**query):
+            pkg = repo.get_package(pkgname)
+            if pkg is not None:
                 pkg.repo = repo.tree
-                #found = sum((repo.search_package(**query) for repo in repos), [])
                 found.append(pkg)
 
         try:
@@ -311,6 +439,22 @@ class DatabaseManager(object):
             raise_ambiguous=raise_ambiguous
         )
 
+    def prefetch_aur(self, names):
+        """Resolve all `names`, which are not inside the other sync
+        databases, with batched AUR requests. Following lookups of these
+        names are answered from the cache of the AUR client.
+
+        :param names: an iterable of package names
+        """
+        if "aur" not in self.sync_dbs:
+            return
+        names = set(names)
+        for repo in self._get_repositories(self.sync_dbs.keys()):
+            if repo.tree != "aur":
+                names = set(name for name in names \
+                            if repo.get_package(name) is None)
+        self.sync_dbs["aur"].client.info(names)
+
     def get_group(self, grpname, repos=None, raise_ambiguous=False):
         """Get one group from the database
 
@@ -331,29 +475,99 @@ class DatabaseManager(object):
                     grps.append(grp)
         return grps
 
+    def load_all(self):
+        """Create all deferred databases, which were not used yet. Has to be
+        called before a transaction is initialized.
+        """
+        for tree in self.order:
+            self.dbs[tree]
+
+    def unregister_all(self):
+        """Unregister all databases from libalpm and forget them, deferred
+        ones which were never used are just dropped
+        """
+        for db in self.dbs.created():
+            db.unregister()
+        self.dbs.clear()
+        self.local_dbs.clear()
+        self.sync_dbs.clear()
+        del self.order[:]
+
     # untested
     def set_package_reason(self, pkg, reason_id):
         p.alpm_db_set_pkgreason(self.dbs["local"], pkg.name, reason_id)
 
 class AbstractDatabase(object):
     """Implements an abstract interface to one database"""
+    # the raw pmdb_t, None if there is none (anymore)
+    db = None
+
     def __del__(self):
-        p.alpm_db_unregister(self.db)
+        self.unregister()
+
+    def unregister(self):
+        """Unregister the database from libalpm, this instance can't be used
+        afterwards
+        """
+        if self.db is not None:
+            p.alpm_db_unregister(self.db)
+            self.db = None
 
     def __contains__(self, pkgname):
-        res = self.search_package(name=pkgname)
-        for pkg in res:
-            if pkg.name == pkgname:
-                return True
-        return False
+        return pkgname in self.package_index
+
+    @CachedProperty
+    def package_index(self):
+        """A dict mapping each package name inside this database to its raw
+        pmpkg_t, built with one walk over the package cache on first access
+        """
+        index = {}
+        cur = p.alpm_list_first(p.alpm_db_get_pkgcache(self.db))
+        while cur:
+            pkg = p.helper_list_getpkg(cur)
+            index[intern(p.alpm_pkg_get_name(pkg))] = pkg
+            cur = p.alpm_list_next(cur)
+        return index
+
+    @CachedProperty
+    def package_table(self):
+        """The columnar :class:`pyalpmm.table.PackageTable` snapshot of this
+        database, used to answer searches
+        """
+        return PackageTable(self.get_packages())
+
+    def reset_caches(self):
+        """Drop all lookup structures built from this database, must be called
+        whenever libalpm changed or reloaded the underlying package cache
+        """
+        del self.package_index
+        del self.package_table
+
+    def get_package(self, pkgname):
+        """Return the package called `pkgname` from this database or None
+
+        :param pkgname: the exact name of the package
+        """
+        pkg = self.package_index.get(pkgname)
+        if pkg is None:
+            return None
+        return PackageItem(pkg)
 
     def search_package(self, **kw):
-        """Search this database for a given query"""
+        """Search this database for a given query, through the columnar
+        snapshot if all queried attributes are part of it
+        """
+        if self.package_table.can_search(kw):
+            return self.package_table.search(**kw)
         return self.get_packages().search(**kw)
 
-    def get_packages(self):
-        """Get all available packages in this database"""
-        return PackageList(p.alpm_db_get_pkgcache(self.db))
+    def get_packages(self, prefetch=None):
+        """Get all available packages in this database
+
+        :param prefetch: a list of attribute names, which are fetched for each
+                         package while iterating (optional)
+        """
+        return PackageList(p.alpm_db_get_pkgcache(self.db), prefetch=prefetch)
 
     def get_groups(self):
         """Get all available groups in this database"""
@@ -367,14 +581,30 @@ class LocalDatabase(AbstractDatabase):
 
 class SyncDatabase(AbstractDatabase):
     """Represents any sync-able or remote database"""
-    def __init__(self, tree, url):
+    # the file name suffix libalpm downloads the database as
+    db_ext = ".db.tar.gz"
+
+    def __init__(self, tree, urls):
         self.db = p.alpm_db_register_sync(tree)
         self.tree = tree
-        if p.alpm_db_setserver(self.db, url) == -1:
-            raise DatabaseError(
-                "Could not connect database: {0} to url/server: {1}".format(
-                    tree, url
-                ))
+        # one url per mirror, libalpm tries them in this order
+        self.urls = [urls] if isinstance(urls, basestring) else list(urls)
+        self.url = self.urls[0]
+        for url in self.urls:
+            if p.alpm_db_setserver(self.db, url) == -1:
+                raise DatabaseError(
+                    "Could not connect database: {0} to url/server: {1}".\
+                    format(tree, url))
+
+    @property
+    def db_urls(self):
+        """The urls of the database file on all mirrors"""
+        return self.file_urls(self.tree + self.db_ext)
+
+    def file_urls(self, filename):
+        """The urls of the file `filename` (i.e. a package) on all mirrors"""
+        return ["{0}/{1}".format(url.rstrip("/"), filename) \
+                for url in self.urls]
 
     def update(self, force=None):
         """Call the underlying c-function to update the database
@@ -387,22 +617,114 @@ class SyncDatabase(AbstractDatabase):
                 "Database '{0}' could not be updated".format(self.tree))
         elif r == 1:
             return False
+
+        # the persisted search index is outdated now
+        try:
+            os.remove(self.text_index_path)
+        except OSError as e:
+            pass
+        del self.text_index
         return True
 
+    @property
+    def text_index_path(self):
+        """The search index is persisted next to the database itself"""
+        return os.path.join(p.alpm_option_get_dbpath(), "sync",
+                            self.tree + ".trgm")
+
+    @CachedProperty
+    def text_index(self):
+        """The :class:`pyalpmm.textindex.TrigramIndex` over the names and
+        descriptions, loaded from disk or (re-)built if the database changed
+        """
+        try:
+            stamp = repr(os.stat(os.path.join(
+                p.alpm_option_get_dbpath(), "sync", self.tree)).st_mtime)
+        except OSError as e:
+            stamp = None
+
+        index = TrigramIndex.load(self.text_index_path, stamp)
+        if index is None:
+            table = self.package_table
+            index = TrigramIndex(table.names, table.columns["desc"].values)
+            if stamp is not None:
+                index.save(self.text_index_path, stamp)
+        return index
+
+    def search_text(self, query, regex=False):
+        """Return a list of (rank, :class:`PackageItem`) tuples for all packages
+        containing `query` in their name or description, see
+        :meth:`pyalpmm.textindex.TrigramIndex.search`
+
+        :param query: the (case-insensitive) query string
+        :param regex: if True, `query` is a regular expression
+        """
+        table = self.package_table
+        return [(rank, table.get_item(table.index[name])) \
+                for rank, name in self.text_index.search(query, regex) \
+                if name in table.index]
+
 class AURDatabase(SyncDatabase):
     """Represents the AUR"""
+    # there is no database file to download
+    db_urls = None
+
     def __init__(self, config):
+        from aur import AURClient
+
         self.config = config
         self.tree = "aur"
+        self.client = AURClient(config)
 
-    def get_packages(self):
+    def get_packages(self, prefetch=None):
         """Just give the AURPackageList, which wrapps all queries"""
-        return AURPackageList(self.config)
+        return AURPackageList(self.config, self.client)
 
     def get_groups(self):
         """There are no groups in AUR, so just returns an empty list"""
         return []
 
+    def search_package(self, **kw):
+        """Every search is an RPC request to the AUR"""
+        return self.get_packages().search(**kw)
+
+    def get_package(self, pkgname):
+        """The AUR can't be indexed locally, so ask it through an RPC info
+        request (answered from the cache, if :meth:`get_package_map` asked
+        for this name before)
+
+        :param pkgname: the exact name of the package
+        """
+        return self.get_package_map([pkgname]).get(pkgname)
+
+    def get_package_map(self, names):
+        """Resolve many package names with as few RPC requests as possible,
+        returns a dict mapping the names found in the AUR to their
+        :class:`pyalpmm.item.AURPackageItem`
+
+        :param names: an iterable of package names
+        """
+        out = {}
+        for name, dct in self.client.info(names).items():
+            pkg = AURPackageItem(dct)
+            pkg.repo = "aur"
+            out[name] = pkg
+        return out
+
+    def reset_caches(self):
+        """Nothing is cached for the AUR"""
+        pass
+
     def update(self, force=None):
         """There is no need to update because we always send an RPC request"""
         return True
+
+    def search_text(self, query, regex=False):
+        """The AUR can only be searched for names and without regular
+        expressions, the results are ranked like for the other databases
+        """
+        if regex:
+            return []
+        query = query.lower()
+        return [(rank(query, pkg.name.lower(), True), pkg) \
+                for pkg in self.search_package(name=query)]
@@ -0,0 +1,584 @@
+# -*- coding: utf-8 -*-
+"""
+
+download.py
+-----------
+
+This module implements the downloading of remote files with a pool of worker
+threads. libalpm fetches one file after another, so refreshing several sync
+databases or downloading the packages of a big upgrade takes the sum of all
+transfer times.
+
+For the databases the Downloader first stages all needed files concurrently
+into a temporary directory, then it is set as the libalpm fetch callback.
+libalpm still updates (and registers) the databases one after another, but
+when it asks for a file, the already downloaded copy is just moved to its
+destination. The packages of a transaction are prefetched concurrently right
+into the cache directory, where libalpm finds them while committing.
+
+For every url the ETag and Last-Modified header of the last transfer are
+kept in a small state file, so the next request is a conditional one and an
+unchanged file costs one round trip. Interrupted transfers leave a ".part"
+file behind, which is resumed with a Range request the next time. The
+validator of the response the ".part" file was started from is written next
+to it right away, so the resume can be made conditional on exactly that.
+
+HTTP connections are kept alive and reused, the number of concurrent
+connections to one mirror is limited. Every file is requested with the urls
+of all mirrors, ordered by the :class:`pyalpmm.mirrors.MirrorRanker`. The
+packages are spread over the best mirrors, if one fails the next one is
+tried. All events are emitted from the calling (main) thread.
+"""
+
+import os
+import time
+import marshal
+import shutil
+import socket
+import tempfile
+import threading
+import httplib
+import urllib2
+import urlparse
+from Queue import Queue, Empty
+from email.utils import formatdate, parsedate_tz, mktime_tz
+
+from mirrors import MirrorRanker
+from tools import CriticalError
+
+class DownloadError(CriticalError):
+    pass
+
+# return values of the libalpm fetch callback
+FETCH_OK, FETCH_UP_TO_DATE, FETCH_FAILED = 0, 1, -1
+
+class Response(object):
+    """A uniform view on a httplib and an urllib2 response
+
+    :param status: the (HTTP) status code
+    :param headers: the mimetools.Message like object holding the headers
+    :param body: the file-like object to read the body from
+    :param done: called with the `reuse` flag, once the response is closed
+    """
+    def __init__(self, status, headers, body, done):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.done = done
+
+    def getheader(self, name):
+        return self.headers.getheader(name)
+
+    def read(self, size=None):
+        # httplib takes -1 literally and reads until the connection closes
+        return self.body.read() if size is None else self.body.read(size)
+
+    def close(self, reuse=False):
+        """Close the response, if `reuse` is set and the whole body was read,
+        the connection is kept for the next request
+        """
+        if self.done is not None:
+            self.done(reuse)
+            self.done = None
+
+class ConnectionPool(object):
+    """Keeps the idle HTTP connections of each mirror for reuse (keep-alive)
+    and limits the number of concurrent connections to one mirror
+
+    :param per_mirror: the maximum number of connections to one mirror
+    :param timeout: the socket timeout in seconds
+    """
+    def __init__(self, per_mirror, timeout):
+        self.per_mirror = max(per_mirror, 1)
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # (scheme, host) -> list of idle connections
+        self.idle = {}
+        # (scheme, host) -> Semaphore
+        self.slots = {}
+
+    def acquire(self, key):
+        """Get a connection for `key` = (scheme, host), waits if there are
+        already `per_mirror` connections in use
+        """
+        with self.lock:
+            slot = self.slots.setdefault(
+                key, threading.Semaphore(self.per_mirror))
+        slot.acquire()
+        with self.lock:
+            if self.idle.get(key):
+                return self.idle[key].pop()
+        scheme, host = key
+        cls = httplib.HTTPSConnection if scheme == "https" \
+              else httplib.HTTPConnection
+        return cls(host, timeout=self.timeout)
+
+    def release(self, key, conn, reuse):
+        """Give `conn` back, it is closed if `reuse` is not set"""
+        if reuse:
+            with self.lock:
+                self.idle.setdefault(key, []).append(conn)
+        else:
+            conn.close()
+        self.slots[key].release()
+
+    def close(self):
+        """Close all idle connections"""
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+            self.idle = {}
+
+class Downloader(object):
+    """Downloads files concurrently and hands them to libalpm through the
+    fetch callback (see :meth:`fetch`)
+
+    :param config: the :class:`pyalpmm.options.PyALPMMConfiguration` instance
+    """
+    chunk_size = 64 * 1024
+    max_redirects = 5
+
+    def __init__(self, config):
+        self.config = config
+        self.events = config.events
+        self.workers = config.download_workers
+        self.timeout = config.download_timeout
+        self.state_fn = config.download_state
+        self.pool = ConnectionPool(config.download_per_mirror, self.timeout)
+        self.mirrors = MirrorRanker(config, self)
+        self.spread = max(config.mirror_spread, 1)
+
+        # file name -> (path of the staged file, result, transfered, saved)
+        self.staged = {}
+        self.staging_dir = None
+        self.lock = threading.Lock()
+        self.state = self._load_state()
+        self.reset_stats()
+
+    def _load_state(self):
+        """Read the validators (ETag, Last-Modified, size) of all urls from
+        the last run and the average transfer rate seen so far
+        """
+        try:
+            with open(self.state_fn, "rb") as fd:
+                state = marshal.load(fd)
+        except (IOError, EOFError, ValueError, TypeError) as e:
+            state = None
+        if not isinstance(state, dict):
+            state = {}
+        state.setdefault("urls", {})
+        state.setdefault("rate", 0.0)
+        return state
+
+    def save_state(self):
+        """Persist the validators, silently skipped if the state file can't
+        be written (i.e. no root rights)
+        """
+        try:
+            with open(self.state_fn + ".tmp", "wb") as fd:
+                marshal.dump(self.state, fd)
+            os.rename(self.state_fn + ".tmp", self.state_fn)
+        except (IOError, OSError) as e:
+            pass
+
+    def reset_stats(self):
+        """Reset the transfer statistics, see :attr:`stats`"""
+        self.stats = {"transfered": 0, "saved": 0, "time_saved": 0.0}
+
+    def _account(self, transfered, saved):
+        """Add one transfer to the statistics, returns the estimated time it
+        would have taken to transfer the `saved` bytes
+        """
+        rate = self.state["rate"]
+        time_saved = float(saved) / rate if rate > 0 else 0.0
+        self.stats["transfered"] += transfered
+        self.stats["saved"] += saved
+        self.stats["time_saved"] += time_saved
+        return time_saved
+
+    def _remember(self, url, resp, size, transfered, elapsed):
+        """Keep the validators of a finished transfer and update the average
+        transfer rate
+        """
+        with self.lock:
+            self.state["urls"][url] = {
+                "etag": resp.getheader("ETag"),
+                "modified": resp.getheader("Last-Modified"),
+                "size": size
+            }
+            if transfered > 0 and elapsed > 0:
+                rate = transfered / elapsed
+                old = self.state["rate"]
+                self.state["rate"] = rate if old <= 0 else 0.7 * old + 0.3 * rate
+
+    def _partial_validator(self, partial):
+        """Return the ETag/Last-Modified the `partial` file was started
+        with, None if it is not known
+        """
+        try:
+            with open(partial + ".validator", "rb") as fd:
+                return fd.read().strip() or None
+        except IOError as e:
+            return None
+
+    def _start_partial(self, partial, resp):
+        """Keep the validator of `resp` for the `partial` file it is written
+        to, before the transfer starts
+        """
+        validator = resp.getheader("ETag") or resp.getheader("Last-Modified")
+        try:
+            if validator:
+                with open(partial + ".validator", "wb") as fd:
+                    fd.write(validator)
+            elif os.path.exists(partial + ".validator"):
+                os.remove(partial + ".validator")
+        except (IOError, OSError) as e:
+            pass
+
+    def _drop_partial(self, partial):
+        """Remove the `partial` file and its validator"""
+        for fn in (partial, partial + ".validator"):
+            try:
+                os.remove(fn)
+            except OSError as e:
+                pass
+
+    def _open(self, url, headers, redirects=None, retry=True):
+        """Send a GET request for `url`, returns a :class:`Response`. HTTP(S)
+        goes through the connection pool, everything else (i.e. ftp) through
+        urllib2.
+
+        :param url: the url to request
+        :param headers: a dict with the request headers
+        :param redirects: the number of redirects still to follow (optional)
+        :param retry: retry once on a fresh connection, if a kept-alive one
+                      was closed by the server in the meantime (optional)
+        """
+        if redirects is None:
+            redirects = self.max_redirects
+
+        scheme, host, path, query, fragment = urlparse.urlsplit(url)
+        if scheme not in ("http", "https"):
+            try:
+                resp = urllib2.urlopen(urllib2.Request(url, headers=headers),
+                                       timeout=self.timeout)
+            except urllib2.HTTPError as e:
+                return Response(e.code, e.info(), e, lambda reuse: e.close())
+            return Response(resp.getcode() or 200, resp.info(), resp,
+                            lambda reuse: resp.close())
+
+        key = (scheme, host)
+        conn = self.pool.acquire(key)
+        try:
+            conn.request("GET", (path or "/") + ("?" + query if query else ""),
+                         headers=headers)
+            resp = conn.getresponse()
+        except (httplib.HTTPException, socket.error) as e:
+            self.pool.release(key, conn, False)
+            if not retry:
+                raise
+            return self._open(url, headers, redirects, False)
+
+        done = lambda reuse: self.pool.release(
+            key, conn, reuse and not resp.will_close)
+        location = resp.getheader("Location")
+        if resp.status in (301, 302, 303, 307) and location and redirects:
+            resp.read()
+            done(True)
+            return self._open(urlparse.urljoin(url, location), headers,
+                              redirects - 1)
+        return Response(resp.status, resp.msg, resp, done)
+
+    def _download(self, url, target, reference=None, force=False,
+                  partial=None, immutable=False):
+        """Download `url` to the file `target`. If `reference` exists and
+        `force` is not set, a conditional request is sent (with the stored
+        ETag/Last-Modified or the mtime of `reference`). An existing `partial`
+        file is resumed, as long as the remote file did not change since the
+        partial file was started.
+
+        Returns a tuple (result, transfered bytes, saved bytes), result is
+        FETCH_OK, FETCH_UP_TO_DATE or FETCH_FAILED
+
+        :param url: the url to download
+        :param target: the path of the file to write
+        :param reference: the path of the current local copy (optional)
+        :param force: download, even if the local copy is up to date
+        :param partial: the path of the temporary file (optional), defaults to
+                        `target` + ".part"
+        :param immutable: the remote file never changes (i.e. a package), so
+                          a partial file is resumed without validator
+        """
+        partial = partial or target + ".part"
+        known = self.state["urls"].get(url, {})
+
+        headers = {}
+        if not force and reference and os.path.exists(reference):
+            if known.get("etag"):
+                headers["If-None-Match"] = known["etag"]
+            headers["If-Modified-Since"] = known.get("modified") or \
+                formatdate(os.path.getmtime(reference), usegmt=True)
+
+        offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+        validator = self._partial_validator(partial) if offset else None
+        if offset and (validator or immutable):
+            headers["Range"] = "bytes={0}-".format(offset)
+            if validator:
+                headers["If-Range"] = validator
+        else:
+            offset = 0
+
+        started = time.time()
+        try:
+            resp = self._open(url, headers)
+        except (httplib.HTTPException, urllib2.URLError, socket.error,
+                IOError) as e:
+            return FETCH_FAILED, 0, 0
+
+        if resp.status == 304:
+            resp.read()
+            resp.close(True)
+            return FETCH_UP_TO_DATE, 0, known.get("size", 0)
+        elif resp.status == 416 and offset:
+            # the partial file is useless, start over
+            resp.read()
+            resp.close(True)
+            self._drop_partial(partial)
+            return self._download(url, target, reference, force, partial,
+                                  immutable)
+        elif resp.status not in (200, 206):
+            resp.close()
+            return FETCH_FAILED, 0, 0
+
+        if resp.status == 206:
+            # only append, if the returned range continues the partial file
+            content_range = resp.getheader("Content-Range") or ""
+            start = content_range.replace("bytes", "").strip().split("-")[0]
+            if start != str(offset):
+                resp.close()
+                if not offset:
+                    return FETCH_FAILED, 0, 0
+                self._drop_partial(partial)
+                return self._download(url, target, reference, force, partial,
+                                      immutable)
+        else:
+            # a 200 answer to a Range request means: the file changed
+            offset = 0
+        if not offset:
+            self._start_partial(partial, resp)
+
+        transfered = 0
+        try:
+            with open(partial, "ab" if offset else "wb") as fd:
+                data = resp.read(self.chunk_size)
+                while data:
+                    fd.write(data)
+                    transfered += len(data)
+                    data = resp.read(self.chunk_size)
+            shutil.move(partial, target)
+            self._drop_partial(partial)
+        except (httplib.HTTPException, socket.error, IOError, OSError) as e:
+            resp.close()
+            return FETCH_FAILED, transfered, 0
+        resp.close(True)
+
+        self._remember(url, resp, offset + transfered, transfered,
+                       time.time() - started)
+
+        # keep the remote mtime, so the next check can be a conditional one
+        modified = resp.getheader("Last-Modified")
+        if modified and parsedate_tz(modified):
+            mtime = mktime_tz(parsedate_tz(modified))
+            os.utime(target, (mtime, mtime))
+        return FETCH_OK, transfered, offset
+
+    def _candidates(self, urls, slot=0):
+        """Order the mirror `urls` for the `slot`-th job: the jobs are spread
+        round robin over the best `mirror_spread` mirrors, the others follow
+        as fallback
+
+        :param urls: the urls of one file, one per mirror
+        :param slot: the number of the job (optional)
+        """
+        ranked = self.mirrors.order(urls)
+        top = [url for url in ranked[:self.spread] if self.mirrors.alive(url)]
+        if not top:
+            return ranked
+        start = slot % len(top)
+        return top[start:] + top[:start] + ranked[len(top):]
+
+    def _download_any(self, urls, *args, **kw):
+        """Try :meth:`_download` with each url in `urls` until one succeeds,
+        a failing mirror is penalized. Returns the result of the last try.
+        """
+        result = (FETCH_FAILED, 0, 0)
+        for url in urls:
+            result = self._download(url, *args, **kw)
+            if result[0] != FETCH_FAILED:
+                return result
+            self.mirrors.penalize(url)
+        return result
+
+    def _spawn(self, jobs, work):
+        """Start the worker threads, which call `work` for every element of
+        `jobs`, returns the list of started threads
+
+        :param jobs: the list of jobs
+        :param work: the callable doing one job
+        """
+        queue = Queue()
+        for job in jobs:
+            queue.put(job)
+
+        def worker():
+            while True:
+                try:
+                    job = queue.get_nowait()
+                except Empty:
+                    return
+                work(job)
+
+        threads = [threading.Thread(target=worker) \
+                   for i in xrange(min(self.workers, len(jobs)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        return threads
+
+    def stage(self, files, reference_dir, force=False):
+        """Download all `files` concurrently into a temporary staging
+        directory, to be picked up later by :meth:`fetch`. The mirrors are
+        probed (if needed) and tried from the best to the worst.
+
+        :param files: a list with the urls (one per mirror) of each file
+        :param reference_dir: the directory containing the current local
+                              copies, used to skip unchanged files
+        :param force: download all files, even if they are up to date
+        """
+        self.clear()
+        self.staging_dir = tempfile.mkdtemp(prefix="pyalpmm-")
+        for urls in files:
+            self.mirrors.order(urls, probe=True)
+
+        def work(urls):
+            fn = os.path.basename(urls[0])
+            target = os.path.join(self.staging_dir, fn)
+            reference = os.path.join(reference_dir, fn)
+            # keep partial files where they survive an interruption
+            partial = reference + ".part" \
+                      if os.access(reference_dir, os.W_OK) else None
+            self.staged[fn] = (target, ) + self._download_any(
+                self._candidates(urls), target, reference, force, partial)
+
+        for thread in self._spawn(files, work):
+            thread.join()
+        self.save_state()
+
+    def prefetch(self, jobs, pkgs=None):
+        """Download the packages in `jobs` concurrently into their cache
+        directory. The events are emitted from here, as the files complete:
+        first one ProgressDownloadTotal, then StartNewDownload and
+        ProgressDownload for each finished file, the latter also carries the
+        aggregated `total_transfered` and `total` bytes.
+
+        Returns a dict: file name -> result (FETCH_OK or FETCH_FAILED)
+
+        :param jobs: a list of (urls, cache directory, size) tuples, `urls`
+                     holds the url of the package on each mirror
+        :param pkgs: the list of :class:`pyalpmm.item.PackageItem` to be
+                     downloaded, passed to the ProgressDownloadTotal event
+        """
+        jobs = [job for job in jobs if job[0]]
+        total = sum(size for urls, cachedir, size in jobs)
+        self.events.ProgressDownloadTotal(total=total, pkgs=pkgs or [])
+        for urls, cachedir, size in jobs[:1]:
+            self.mirrors.order(urls, probe=True)
+
+        results = Queue()
+        def work(job):
+            slot, (urls, cachedir, size) = job
+            fn = os.path.basename(urls[0])
+            target = os.path.join(cachedir, fn)
+            try:
+                result = self._download_any(self._candidates(urls, slot),
+                                            target, force=True, immutable=True)
+            except Exception as e:
+                # every job has to queue a result, or the loop below waits
+                # forever
+                result = (FETCH_FAILED, 0, 0)
+            results.put((fn, target) + result)
+
+        threads = self._spawn(list(enumerate(jobs)), work)
+        out, done = {}, 0
+        for i in xrange(len(jobs)):
+            # with a timeout, the wait can be interrupted by ^C
+            fn, target, ret, transfered, saved = results.get(True, 1e9)
+            time_saved = self._account(transfered, saved)
+            out[fn] = ret
+            if ret != FETCH_OK:
+                continue
+
+            size = os.path.getsize(target)
+            done += size
+            self.events.StartNewDownload(filename=fn)
+            self.events.ProgressDownload(filename=fn, transfered=size,
+                                         filecount=size, bytes=transfered,
+                                         bytes_saved=saved,
+                                         time_saved=time_saved,
+                                         total_transfered=done, total=total)
+        for thread in threads:
+            thread.join()
+        self.save_state()
+        return out
+
+    def fetch(self, url, localpath, force):
+        """The libalpm fetch callback: place the file behind `url` inside the
+        directory `localpath`, a staged copy is used if available
+
+        :param url: the url libalpm wants to have
+        :param localpath: the directory to put the file into
+        :param force: if not set, an up-to-date local copy is not replaced
+        """
+        fn = os.path.basename(url)
+        dest = os.path.join(localpath, fn)
+
+        if fn in self.staged:
+            staged, ret, transfered, saved = self.staged.pop(fn)
+            if ret == FETCH_OK:
+                try:
+                    shutil.move(staged, dest)
+                except (IOError, OSError) as e:
+                    return FETCH_FAILED
+        elif not self.mirrors.alive(url):
+            # let libalpm move on to the next server right away
+            return FETCH_FAILED
+        else:
+            # not staged, i.e. libalpm moved on to the next server
+            ret, transfered, saved = self._download(url, dest, dest, force)
+            if ret == FETCH_FAILED:
+                self.mirrors.penalize(url)
+            self.save_state()
+
+        time_saved = self._account(transfered, saved)
+        if ret == FETCH_OK:
+            size = os.path.getsize(dest)
+            self.events.StartNewDownload(filename=fn)
+            self.events.ProgressDownload(filename=fn, transfered=size,
+                                         filecount=size, bytes=transfered,
+                                         bytes_saved=saved,
+                                         time_saved=time_saved)
+        elif ret == FETCH_UP_TO_DATE:
+            # nothing to show, but let the frontend know what was saved
+            self.events.ProgressDownload(filename=fn, transfered=0,
+                                         filecount=0, bytes=0,
+                                         bytes_saved=saved,
+                                         time_saved=time_saved)
+        return ret
+
+    def clear(self):
+        """Remove the staging directory and forget all staged files"""
+        if self.staging_dir is not None:
+            shutil.rmtree(self.staging_dir, True)
+        self.staging_dir = None
+        self.staged = {}
@@ -10,15 +10,78 @@ some methods to fit them for your needs.
 
 Every event can simply get a callback function connected by just implementing
 a method which has the exact name of the event.
+
+The handlers are looked up once and put into a table, so firing an event
+costs one attribute lookup and the call of the handler. Only with a `logfile`
+set, each handler is wrapped to log the event before.
 """
 
 import sys
+import atexit
 import datetime
+import threading
+from Queue import Queue
 
 from tools import AskUser
 
+class LogSink(object):
+    """Appends lines to a logfile through one buffered file object, which is
+    flushed at exit
+
+    :param filename: the path of the logfile
+    :param threaded: if True, a background thread does the writing (optional)
+    """
+    buffer_size = 64 * 1024
+
+    def __init__(self, filename, threaded=False):
+        self.filename = filename
+        self.threaded = threaded
+        self.fd = open(filename, "a", self.buffer_size)
+        self.queue = self.thread = None
+        if threaded:
+            self.queue = Queue()
+            self.thread = threading.Thread(target=self._writer)
+            self.thread.daemon = True
+            self.thread.start()
+        atexit.register(self.close)
+
+    def _writer(self):
+        """Write the queued lines until the None sentinel arrives"""
+        while True:
+            line = self.queue.get()
+            try:
+                if line is None:
+                    return
+                self.fd.write(line)
+            finally:
+                self.queue.task_done()
+
+    def write(self, line):
+        """Append `line` to the logfile"""
+        if self.queue is None:
+            self.fd.write(line)
+        else:
+            self.queue.put(line)
+
+    def flush(self):
+        """Wait for all queued lines and flush them to the disk"""
+        if self.queue is not None:
+            self.queue.join()
+        self.fd.flush()
+
+    def close(self):
+        """Write all pending lines and close the logfile"""
+        if self.fd.closed:
+            return
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+        self.fd.close()
+
 class Events(object):
     last_event, logfile = None, None
+    # log through a background thread, has only an effect with a logfile set
+    log_async = False
     names = (# general events
              "StartCheckingDependencies",         # ()
              "StartCheckingFileConflicts",        # ()
@@ -64,6 +127,7 @@ class Events(object):
              # progress handling
              "StartNewDownload",                  # (filename: str)
              "ProgressDownload",                  # (transfered, filecount: int, filename: str)
+                                                  # from the Downloader also: (bytes, bytes_saved: int, time_saved: float)
              "ProgressDownloadTotal",             # (total: int, pkgs: list of PackageItem)
              "ProgressInstall",                   # (pkgname: str, percent: int)
              "ProgressRemove",                    # (pkgname: str, percent: int)
@@ -95,35 +159,82 @@ class Events(object):
              "UserAbort",                         # (e: instance of UserError)
              "BuildProblem",                      # (e: instance of BuildError)
         )
+    name_set = frozenset(names)
+    # setting one of these attributes changes the dispatch table
+    _recompile_on = name_set | frozenset(["logfile", "log_async"])
+
     def __init__(self):
-        self.bound_events = [meth for meth in dir(self) if meth in self.names]
+        object.__setattr__(self, "handlers", {})
+        object.__setattr__(self, "log_sink", None)
+        self._compile()
 
     def __setattr__(self, attr, value):
-        if attr in self.names:
-            self.bound_events.append(attr)
-        return object.__setattr__(self, attr, value)
+        if attr in self._recompile_on:
+            if attr in self.name_set and attr != "Log":
+                self.handlers[attr] = value
+            else:
+                object.__setattr__(self, attr, value)
+            self._compile()
+        else:
+            object.__setattr__(self, attr, value)
+
+    def _compile(self):
+        """Build the dispatch table: every event name becomes an instance
+        attribute pointing to its handler, :meth:`doNothing` for the events
+        without one. With a `logfile` each handler is wrapped with a call to
+        :meth:`Log`.
+        """
+        sink = self.log_sink
+        if sink is not None and (sink.filename != self.logfile or
+                                 sink.threaded != self.log_async):
+            sink.close()
+            sink = None
+        if sink is None and self.logfile:
+            sink = LogSink(self.logfile, self.log_async)
+        object.__setattr__(self, "log_sink", sink)
+
+        bound = set()
+        cls = self.__class__
+        for name in self.name_set:
+            if name == "Log":
+                continue
+            handler = self.handlers.get(name)
+            if handler is None:
+                for klass in cls.__mro__:
+                    if name in klass.__dict__:
+                        handler = klass.__dict__[name].__get__(self, cls)
+                        break
+            if handler is None:
+                handler = self.doNothing
+            else:
+                bound.add(name)
+            if sink is not None:
+                handler = self._logged(name, handler)
+            object.__setattr__(self, name, handler)
+        object.__setattr__(self, "bound_events", frozenset(bound))
 
-    def __getattribute__(self, attr):
-        if attr in object.__getattribute__(self, "names"):
-            object.__getattribute__(self, "Log")(event=attr, data={})
-            if attr not in object.__getattribute__(self, "bound_events"):
-                return object.__getattribute__(self, "doNothing")
-        return object.__getattribute__(self, attr)
+    def _logged(self, name, handler):
+        """Wrap `handler` of the event `name` to log each call"""
+        log = self.Log
+        def dispatch(*v, **kw):
+            log(event=name, data=kw)
+            return handler(*v, **kw)
+        return dispatch
 
     def doNothing(self, **kw):
-        """A dummy callback function, just forwards the event to the logger"""
+        """A dummy callback function for all events without a handler"""
         pass
 
     def Log(self, **kw):
-        """The logger, this will be replaced with logger from python
-        in the near future
+        """The logger, writes one line per event into the `logfile` through
+        a buffered :class:`LogSink` (with `log_async` set, from a background
+        thread)
 
         - kw["event"]: name of the last occured event
         - kw["data"]: to-be-logged data as a dict
         """
-        if self.logfile:
-            # sometimes i am just producing this:
-            file(self.logfile, "a").write("%20s - [%25s] %s\n" % \
+        if self.log_sink is not None:
+            self.log_sink.write("%20s - [%25s] %s\n" % \
                 (datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S"),
                  kw["event"],
                  " ".join("{0}: {1}".format(k,v) for k,v in kw["data"].items())))
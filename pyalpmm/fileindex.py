@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+
+fileindex.py
+------------
+
+This module keeps an on-disk index of all files owned by the locally installed
+packages, so questions like "which package owns usr/bin/xterm" can be answered
+without walking through the filelist of every local package.
+
+The index is a small sqlite database. It is rebuilt from scratch, if the local
+database was changed behind our back (detected through the mtime of the local
+database directory) and updated package by package during the transactions
+done by pyalpmm itself.
+"""
+
+import os
+import sqlite3
+
+class FileIndex(object):
+    """A path -> package name index over the local database
+
+    :param session: the :class:`pyalpmm.session.Session` instance
+    """
+    schema = (
+        "CREATE TABLE IF NOT EXISTS files (path TEXT NOT NULL, "
+        "                                  pkgname TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS files_path ON files (path)",
+        "CREATE INDEX IF NOT EXISTS files_pkgname ON files (pkgname)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+    )
+
+    def __init__(self, session):
+        self.session = session
+        self.local_path = os.path.join(session.config.local_db_path, "local")
+        self.conn = self._connect(session.config.file_index)
+        self.check()
+
+    def _connect(self, filename):
+        """Open (and if needed create) the index at `filename`, if this is not
+        possible (i.e. no write access as user) fall back to an in-memory index
+
+        :param filename: the path to the sqlite database file
+        """
+        try:
+            conn = sqlite3.connect(filename)
+            conn.text_factory = str
+            for stmt in self.schema:
+                conn.execute(stmt)
+            conn.commit()
+        except sqlite3.Error as e:
+            if filename == ":memory:":
+                raise
+            return self._connect(":memory:")
+        return conn
+
+    def _get_local_mtime(self):
+        """The mtime of the local database directory as str"""
+        try:
+            return repr(os.stat(self.local_path).st_mtime)
+        except OSError as e:
+            return None
+
+    def _get_stored_mtime(self):
+        """The local database mtime saved with the last (re-)build"""
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'mtime'").fetchone()
+        return row and row[0]
+
+    def _store_mtime(self):
+        """Save the current local database mtime and commit the changes"""
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('mtime', ?)",
+                          (self._get_local_mtime(), ))
+        self.conn.commit()
+
+    def _normalize(self, path):
+        """libalpm keeps the paths without a leading slash"""
+        return path.lstrip("/")
+
+    def check(self):
+        """(Re-)Check, if the index still reflects the local database"""
+        self.fresh = self._get_local_mtime() is not None and \
+                     self._get_stored_mtime() == self._get_local_mtime()
+        return self.fresh
+
+    def ensure(self):
+        """Rebuild the index, if it isn't up to date anymore"""
+        if not self.fresh:
+            self.rebuild()
+
+    def rebuild(self):
+        """Build the whole index from the local database"""
+        try:
+            self.conn.execute("DELETE FROM files")
+            for pkg in self.session.db_man.get_local_packages():
+                self._insert(pkg)
+            self._store_mtime()
+        except sqlite3.OperationalError as e:
+            # most likely we are not allowed to write the index file
+            self.conn.close()
+            self.conn = self._connect(":memory:")
+            return self.rebuild()
+        self.fresh = True
+
+    def _insert(self, pkg):
+        """Insert all files from `pkg` into the index"""
+        self.conn.executemany(
+            "INSERT INTO files VALUES (?, ?)",
+            ((fn, pkg.name) for fn in (pkg.files or []))
+        )
+
+    def add_package(self, pkg):
+        """Add (or replace) the files of the freshly installed `pkg`, only
+        done if the index is up to date, a stale one is rebuilt anyway
+
+        :param pkg: the installed :class:`pyalpmm.item.PackageItem`
+        """
+        if not self.fresh:
+            return
+        self.conn.execute("DELETE FROM files WHERE pkgname = ?", (pkg.name, ))
+        self._insert(pkg)
+        self._store_mtime()
+
+    def remove_package(self, pkgname):
+        """Remove all files of the package called `pkgname` from the index
+
+        :param pkgname: the name of the removed package
+        """
+        if not self.fresh:
+            return
+        self.conn.execute("DELETE FROM files WHERE pkgname = ?", (pkgname, ))
+        self._store_mtime()
+
+    def owners(self, path):
+        """Return the names of all packages owning exactly `path`. Directories
+        are found with or without the trailing slash.
+
+        :param path: the path to look for
+        """
+        self.ensure()
+        path = self._normalize(path).rstrip("/")
+        return [row[0] for row in self.conn.execute(
+            "SELECT pkgname FROM files WHERE path IN (?, ?)",
+            (path, path + "/"))]
+
+    def find_prefix(self, prefix):
+        """Yield a (path, pkgname) tuple for each indexed path starting with
+        `prefix`, i.e. everything installed below a directory
+
+        :param prefix: the path prefix to look for
+        """
+        self.ensure()
+        prefix = self._normalize(prefix)
+        # the smallest string greater than all strings starting with prefix,
+        # trailing "\xff" bytes can't be incremented (non UTF-8 paths)
+        stripped = prefix.rstrip("\xff")
+        if not prefix:
+            query, args = "SELECT path, pkgname FROM files ORDER BY path", ()
+        elif not stripped:
+            query = ("SELECT path, pkgname FROM files "
+                     "WHERE path >= ? ORDER BY path")
+            args = (prefix,)
+        else:
+            upper = stripped[:-1] + chr(ord(stripped[-1]) + 1)
+            query = ("SELECT path, pkgname FROM files "
+                     "WHERE path >= ? AND path < ? ORDER BY path")
+            args = (prefix, upper)
+        for path, pkgname in self.conn.execute(query, args):
+            yield (path, pkgname)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+
+graph.py
+-----------
+
+This module implements a dependency graph over a set of packages, usually the
+local database or the sync repositories.
+
+Every package is interned to an integer node id. The dependencies are resolved
+once, at construction time, against the package names, their 'provides' and
+'replaces' and are stored as forward (package -> its dependencies) and reverse
+(package -> packages requiring it) adjacency arrays. All questions like "which
+packages are not needed anymore" are then simple traversals over these arrays.
+"""
+
+from array import array
+from itertools import chain
+
+import pyalpmm_raw as p
+
+def strip_version(name):
+    """Cut off a version restriction like in 'foo>=1.0' or 'foo=1.0'
+
+    :param name: the (provision/dependency) string
+    """
+    for i, char in enumerate(name):
+        if char in "<>=":
+            return name[:i]
+    return name
+
+class PackageGraph(object):
+    """The dependency graph for the given packages
+
+    :param packages: an iterable of :class:`pyalpmm.item.PackageItem`
+    """
+    def __init__(self, packages):
+        # node id -> name, reason
+        self.names, self.reasons = [], []
+        # package name -> node id
+        self.ids = {}
+        # any name a package can be required as -> list of node ids
+        self.providers = {}
+
+        dep_names = []
+        for pkg in packages:
+            if pkg.name in self.ids:
+                # the same package in a later repository is shadowed
+                continue
+            nid = len(self.names)
+            self.ids[pkg.name] = nid
+            self.names.append(pkg.name)
+            self.reasons.append(pkg.reason.raw)
+            dep_names.append([dep.name for dep in (pkg.depends or [])])
+
+            self.providers.setdefault(pkg.name, []).insert(0, nid)
+            for name in chain(pkg.provides or [], pkg.replaces or []):
+                self.providers.setdefault(strip_version(name), []).append(nid)
+
+        forward = [self._resolve_all(nid, names) \
+                   for nid, names in enumerate(dep_names)]
+        reverse = [[] for nid in xrange(len(self.names))]
+        for nid, deps in enumerate(forward):
+            for dep in deps:
+                reverse[dep].append(nid)
+
+        self._fwd_offsets, self._fwd = self._pack(forward)
+        self._rev_offsets, self._rev = self._pack(reverse)
+
+    def _resolve_all(self, nid, names):
+        """Resolve the dependency names `names` of the node `nid` to a sorted
+        list of unique node ids, dependencies which can't be resolved and
+        packages providing their own dependencies are skipped
+        """
+        out = set()
+        for name in names:
+            out.update(self.providers.get(name, ()))
+        out.discard(nid)
+        return sorted(out)
+
+    def _pack(self, adjacency):
+        """Pack the list of lists `adjacency` into an offset and a data array
+        """
+        offsets, data = array("i", [0]), array("i")
+        for targets in adjacency:
+            data.extend(targets)
+            offsets.append(len(data))
+        return offsets, data
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, pkgname):
+        return pkgname in self.ids
+
+    def node(self, pkgname):
+        """Return the node id of the package called `pkgname` or None"""
+        return self.ids.get(pkgname)
+
+    def resolve(self, depname):
+        """Return all node ids providing `depname` (name, provides, replaces)
+        """
+        return list(self.providers.get(strip_version(depname), ()))
+
+    def depends_on(self, nid):
+        """The node ids of all packages the node `nid` depends on"""
+        return self._fwd[self._fwd_offsets[nid]:self._fwd_offsets[nid + 1]]
+
+    def required_by(self, nid):
+        """The node ids of all packages depending on the node `nid`"""
+        return self._rev[self._rev_offsets[nid]:self._rev_offsets[nid + 1]]
+
+    def is_dependency(self, nid):
+        """True if the node `nid` was installed as a dependency"""
+        return self.reasons[nid] == p.PM_PKG_REASON_DEPEND
+
+    def removable_dependencies(self, targets):
+        """Return the names of all packages, which are not needed anymore once
+        the packages called like the elements of `targets` are removed. That
+        is every package installed as a dependency, which is only required by
+        packages that get removed.
+
+        :param targets: the names of the packages to be removed
+        """
+        removed = set(self.ids[name] for name in targets if name in self.ids)
+        stack = [dep for nid in removed for dep in self.depends_on(nid)]
+        found = []
+        while stack:
+            nid = stack.pop()
+            if nid in removed or not self.is_dependency(nid):
+                continue
+            if all(req in removed for req in self.required_by(nid)):
+                removed.add(nid)
+                found.append(self.names[nid])
+                stack.extend(self.depends_on(nid))
+        return found
+
+    def unneeded(self):
+        """Return the names of all packages installed as a dependency, which
+        are not required by any other package
+        """
+        return [self.names[nid] for nid in xrange(len(self.names)) \
+                if self.is_dependency(nid) and \
+                self._rev_offsets[nid] == self._rev_offsets[nid + 1]]
+
+    def orphans(self):
+        """Return the names of all packages, which can't be reached from any
+        explicitly installed package. A single mark-and-sweep pass, which also
+        finds whole chains (and cycles) of packages nobody needs anymore.
+        """
+        marked = [False] * len(self.names)
+        stack = [nid for nid in xrange(len(self.names)) \
+                 if not self.is_dependency(nid)]
+        fwd, offsets = self._fwd, self._fwd_offsets
+        while stack:
+            nid = stack.pop()
+            if marked[nid]:
+                continue
+            marked[nid] = True
+            stack.extend(dep for dep in fwd[offsets[nid]:offsets[nid + 1]] \
+                         if not marked[dep])
+        return [self.names[nid] for nid, mark in enumerate(marked) if not mark]
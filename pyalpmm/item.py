@@ -34,6 +34,8 @@ class AbstractItem(object):
     - extract: helper C function to extract the data from a list, see helper.i
     - non_pacman_attributes: list of not directly mapped attributes, which
                              are initialized to None on instance creation
+                             (each derived class has to list them in its
+                             __slots__, too)
     - cdesc: the middle part of the C function(s), which we want to map
     - local_key_map: dict of attribute names (keys) to callables (func/cls...),
                      applied to any attribute access with the given keys and the
@@ -43,16 +45,25 @@ class AbstractItem(object):
 
        "alpm_%s_get_%s" % (self.cdesc, attribute_key)
 
+    They are looked up only once per class and key, see :meth:`get_accessor`,
+    and each converted value is kept inside the instance after the first
+    access.
     """
+    __slots__ = ("raw_data", "_values", "_craw")
+
     attributes, ctype, extract, cdesc = None, None, None, None
     local_key_map, non_pacman_attributes = {}, []
-    def __init__(self, raw_data):
+    def __init__(self, raw_data, craw=None):
         """Extracts the data with 'self.extract()' from the container/list
         'raw_data' in case we got a list instead of a specific wanted type
-        defined by 'self.ctype'
+        defined by 'self.ctype'. If the raw C values of some attributes are
+        already known, pass them as the dict 'craw', they are converted on
+        their first access.
         """
         self.raw_data = self.extract(raw_data) \
             if raw_data.__class__.__name__ == "alpm_list_t" else raw_data
+        self._values = {}
+        self._craw = craw
         self.init_non_pacman_attributes()
 
     def init_non_pacman_attributes(self):
@@ -82,6 +93,35 @@ class AbstractItem(object):
     def __getitem__(self, key):
         return self.get_info(key)
 
+    @classmethod
+    def get_accessor(cls, key):
+        """Return the C function and the converter (None, if the type of the
+        returned value decides) for the attribute `key`. Both are resolved
+        only once for each class and key.
+        """
+        try:
+            return _ACCESSOR_CACHE[cls, key]
+        except KeyError:
+            pass
+
+        func = getattr(p, "alpm_%s_get_%s" % (cls.cdesc, key), None)
+        if func is None:
+            raise KeyError("An instance of %s contains info for: '%s' "
+                           "but not: '%s'" % \
+                (cls.__name__, ", ".join(cls.attributes), key))
+        acc = _ACCESSOR_CACHE[cls, key] = (func, cls.local_key_map.get(key))
+        return acc
+
+    def convert(self, key, craw):
+        """Map the raw C value `craw` for the attribute `key` to a python
+        object according to local_map by key or respectivly GLOBAL_MAP by type
+        """
+        # (the keys in GLOBAL_TYPE_MAP are the c-types used in the library)
+        try:
+            return self.local_key_map[key](craw)
+        except KeyError as e:
+            return GLOBAL_TYPE_MAP[craw.__class__.__name__](craw)
+
     def get_info(self, key):
         """Called from __getattr__ to ask for item-data. This method gets the
         data directly from the backend and maps it to a python object according
@@ -90,24 +130,32 @@ class AbstractItem(object):
         """
         # catch non c-lib/pacman attributes
         if key in self.non_pacman_attributes:
-            craw = object.__getattribute__(self, key)
-        else:
-            # get data from c-lib
-            try:
-                func = "alpm_%s_get_%s" % (self.cdesc, key)
-                craw = getattr(p, func)(self.raw_data)
-            except AttributeError as e:
-                raise KeyError("An instance of %s contains info for: '%s' "
-                               "but not: '%s'" % \
-                    (self.__class__.__name__, ", ".join(self.attributes), key))
-
-        # return manipulated value if key in local_key_map
-        # if not found, use more general GLOBAL_TYPE_MAP to manipulate value
-        # (the keys in GLOBAL_TYPE_MAP are the c-types used in the library)
+            return self.convert(key, object.__getattribute__(self, key))
+
+        # already asked for this one?
         try:
-            return self.local_key_map[key](craw)
-        except KeyError as e:
-            return GLOBAL_TYPE_MAP[craw.__class__.__name__](craw)
+            return self._values[key]
+        except KeyError:
+            pass
+
+        # get data from the passed raw values or the c-lib and convert it
+        func, conv = self.get_accessor(key)
+        if self._craw and key in self._craw:
+            craw = self._craw.pop(key)
+        else:
+            craw = func(self.raw_data)
+        val = self._values[key] = conv(craw) if conv is not None \
+              else GLOBAL_TYPE_MAP[craw.__class__.__name__](craw)
+        return val
+
+    def prefetch(self, keys):
+        """Ask the backend for all attributes in `keys` at once, later
+        accesses to them are just lookups inside this instance
+
+        :param keys: a list of attribute names
+        """
+        for key in keys:
+            self.get_info(key)
 
 
 class PackageItem(AbstractItem):
@@ -124,6 +172,7 @@ class PackageItem(AbstractItem):
 
     attributes = ["name", "arch", "version", "size"]
     non_pacman_attributes = ["repo"]
+    __slots__ = ("repo", )
     ctype = "pmpkg_t"
     extract = p.helper_list_getpkg
     cdesc = "pkg"
@@ -144,15 +193,20 @@ class AURPackageItem(AbstractItem):
                         "OutOfDate":"outofdate", "NumVotes":"votes", "ID":"id",
                         "CategoryID":"category_id", "LocationID":"location_id"}
     non_pacman_attributes = __aur_attributes.values() + ["repo"]
+    __slots__ = tuple(non_pacman_attributes)
     attributes = ["name", "version"]
     def __init__(self, dct):
+        self._values, self._craw = {}, None
         self.init_non_pacman_attributes()
 
         for k,v in dct.items():
-            setattr(self, self.__aur_attributes[k], v)
+            # newer AUR replies carry more fields, than we know about
+            if k in self.__aur_attributes:
+                setattr(self, self.__aur_attributes[k], v)
 
 class GroupItem(AbstractItem):
     """Keeps all the information about a group, especially their '.pkgs'"""
+    __slots__ = ()
     attributes = ["name", "pkgs"]
     #non_pacman_attributes = ["repo"]
     ctype = "pmgrp_t"
@@ -170,6 +224,7 @@ class GroupItem(AbstractItem):
 
 class DependencyItem(AbstractItem):
     """Stands for a single dependency and its string represantation"""
+    __slots__ = ()
     attributes = ["name", "mod", "version"]
     ctype = "pmdepend_t"
     extract = p.helper_list_getdep
@@ -177,6 +232,7 @@ class DependencyItem(AbstractItem):
 
 class MissItem(AbstractItem):
     """Represents a missing dependency and the causing package"""
+    __slots__ = ()
     attributes = ["target", "dep", "causingpkg"]
     ctypes = "pmdepmissing_t"
     extract = p.helper_list_getmiss
@@ -187,6 +243,7 @@ class FileConflictItem(AbstractItem):
     """Describes a file conflict 'file' between two packages 'target' and 'ctarget'
     with 'type' holding the type of the conflict
     """
+    __slots__ = ()
     attributes = ["target", "type", "file", "ctarget"]
     ctypes = "pmfileconflicttype_t"
     extract = p.helper_list_getfileconflict
@@ -204,7 +261,5 @@ GLOBAL_TYPE_MAP   = { "pmgrp_t"          : GroupItem,
                       "long"             : long,
                       "NoneType"         : lambda a: None }
 
-
-
-
-
+# (class, attribute name) -> (C function, converter), see get_accessor()
+_ACCESSOR_CACHE = {}
@@ -15,7 +15,6 @@ C function call.
 import os, sys
 import heapq
 from itertools import chain
-import urllib
 import re
 import operator as ops
 
@@ -32,7 +31,11 @@ class LazyList(object):
     search_endings = {
         "__eq": ops.eq,
         "__in": lambda q, s: s.find(q) != -1,
-        "__ne": ops.ne
+        "__ne": ops.ne,
+        "__lt": lambda q, s: s < q,
+        "__le": lambda q, s: s <= q,
+        "__gt": lambda q, s: s > q,
+        "__ge": lambda q, s: s >= q
     }
 
     def __init__(self, raw_list):
@@ -65,6 +68,9 @@ class LazyList(object):
                         You never have to use this, as this is the (default)
         "__eq"    =>    check query for equality against the string
         "__ne"    =>    check for in-equality
+        "__lt", "__le", "__gt", "__ge"
+                  =>    numeric filters, i.e. size__lt=1024 is true for all
+                        sizes below 1024
         """
         query = {}
         for k, v in kw.items():
@@ -124,11 +130,61 @@ class DependencyList(LazyList):
         )
 
 class PackageList(LazyList):
-    """Holds PackageItem objects"""
+    """Holds PackageItem objects
+
+    If all prefetched attributes are in `bulk_fields`, they are extracted for
+    the whole list with a single C call (see helper_pkglist_extract() inside
+    pyalpmm_raw/helper.i) instead of one call per package and attribute.
+
+    :param raw_list: the alpm_list_t holding the pmpkg_t
+    :param prefetch: a list of attribute names, which are fetched for each
+                     item while iterating over the list (optional)
+    """
+    bulk_fields = frozenset(["name", "version", "desc", "url", "arch",
+                             "packager", "md5sum", "filename", "size", "isize",
+                             "builddate", "installdate", "reason"])
+    prefetch = None
+
+    def __init__(self, raw_list, prefetch=None):
+        super(PackageList, self).__init__(raw_list)
+        self.prefetch = prefetch
+
+    def __iter__(self):
+        fields = self.prefetch
+        if not fields or not self.bulk_fields.issuperset(fields):
+            for pkg in super(PackageList, self).__iter__():
+                yield pkg
+            return
+
+        for row in self.extract(fields):
+            yield Item.PackageItem(row[0], dict(zip(fields, row[1:])))
+
+    def extract(self, fields):
+        """Return a list of tuples, one for each package, looking like:
+        (raw pmpkg_t, raw value of fields[0], raw value of fields[1], ...)
+
+        :param fields: a list of attribute names from `bulk_fields`
+        """
+        return p.helper_pkglist_extract(self.raw_list, list(fields))
+
+    def iter_extract(self, fields):
+        """Like :meth:`extract`, but yield the tuples one by one while walking
+        the list, so the memory needed stays constant
+
+        :param fields: a list of attribute names from `bulk_fields`
+        """
+        fields = list(fields)
+        cur = p.alpm_list_first(self.raw_list)
+        while cur:
+            yield p.helper_pkglist_extract_one(cur, fields)
+            cur = p.alpm_list_next(cur)
 
     def create_item(self, raw_data):
         """Creates a PackageItem from the passed raw_data"""
-        return Item.PackageItem(raw_data)
+        pkg = Item.PackageItem(raw_data)
+        if self.prefetch:
+            pkg.prefetch(self.prefetch)
+        return pkg
 
     def search(self, **kw):
         """This search checks if the given query `kw` matches one of the
@@ -139,9 +195,17 @@ class PackageList(LazyList):
         :param kw: keyword arguments with the actual query,
                    magic endings are supported
         """
-        res = set()
         kw = self._parse_keywords(kw)
-        for pkg in self:
+        if self.bulk_fields.issuperset(kw):
+            # compare the raw values, only matches become a PackageItem
+            keys, query = kw.keys(), kw.values()
+            return [Item.PackageItem(row[0], dict(zip(keys, row[1:]))) \
+                    for row in self.extract(keys) \
+                    if any(op(v, craw or "") \
+                           for (v, op), craw in zip(query, row[1:]))]
+
+        res = set()
+        for pkg in PackageList(self.raw_list, prefetch=kw.keys()):
             if any(op(v, pkg.get_info(k) or "") \
                    for k, (v, op) in kw.items()):
                 res.add(pkg)
@@ -153,7 +217,7 @@ class PackageList(LazyList):
 
         :param k: the key-column, which should be used to order the output
         """
-        lst = [(v.get_info(k),v) for v in self]
+        lst = [(v.get_info(k),v) for v in PackageList(self.raw_list, [k])]
         heapq.heapify(lst)
         pop = heapq.heappop
         out = []
@@ -167,11 +231,13 @@ class AURPackageList(PackageList):
     through RPC.
 
     :param config: a :class:`pyalpmm.options.PyALPMMConfiguration` instance
+    :param client: the :class:`pyalpmm.aur.AURClient` to send the requests
     """
     _package_database_cache = None
     _package_list_pattern = re.compile(r'a href\=\"([^\"]+)\"')
-    def __init__(self, config):
+    def __init__(self, config, client):
         self.config = config
+        self.client = client
 
     def __len__(self):
         return len(self.package_database)
@@ -192,14 +258,11 @@ class AURPackageList(PackageList):
         if "name" not in kw:
             return []
 
-        data = {"type": "search", "arg": kw["name"][0]}
-        rpc_url = self.config.aur_url + self.config.rpc_command
-        res = eval(urllib.urlopen(rpc_url % data).read())["results"]
-        out = []
-
-        # if result is just a string, we got an error
-        if isinstance(res, str):
-            return []
+        # an exact name is resolved through the (batched) info request
+        if kw.keys() == ["name"] and kw["name"][1] is self.search_endings["__eq"]:
+            res = self.client.info([kw["name"][0]]).values()
+        else:
+            res = self.client.search(kw["name"][0])
 
         candidates = [self.create_item(data_dct) for data_dct in res]
 
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+
+mirrors.py
+----------
+
+This module ranks the mirrors from the mirrorlist by a measured probe. Each
+mirror host is asked for the first bytes of a database file, the time this
+takes (latency plus transfer) is its score, a dead mirror gets an infinite
+one. The scores are cached on disk and only measured again after a TTL, a
+dead mirror already after a few minutes. Only the first mirrors of the list
+are probed, the others keep their order behind them.
+
+A mirror failing during a download is penalized for the rest of the run, so
+the following downloads go to the next best mirror right away.
+"""
+
+import os
+import time
+import marshal
+import socket
+import threading
+import httplib
+import urllib2
+import urlparse
+
+# the score of a dead mirror
+DEAD = float("inf")
+
+def mirror_host(url):
+    """The mirror a `url` belongs to, i.e. "http://mirror.example.org" """
+    scheme, host = urlparse.urlsplit(url)[:2]
+    return "{0}://{1}".format(scheme, host)
+
+class MirrorRanker(object):
+    """Ranks mirror urls by the probed score of their host
+
+    :param config: the :class:`pyalpmm.options.PyALPMMConfiguration` instance
+    :param downloader: the :class:`pyalpmm.download.Downloader`, whose
+                       connections are used for probing
+    """
+    # the number of bytes requested from each mirror
+    probe_size = 64 * 1024
+    # the seconds a mirror found dead is not probed again
+    dead_ttl = 300
+
+    def __init__(self, config, downloader):
+        self.downloader = downloader
+        self.cache_fn = config.mirror_cache
+        self.ttl = config.mirror_ttl
+        # twice the mirrors the downloads are spread over
+        self.probe_count = max(config.mirror_spread, 1) * 2
+        self.lock = threading.Lock()
+        # mirror host -> (score, time of the probe)
+        self.scores = self._load()
+
+    def _load(self):
+        """Read the cached scores, the expired ones are dropped"""
+        try:
+            with open(self.cache_fn, "rb") as fd:
+                scores = marshal.load(fd)
+        except (IOError, EOFError, ValueError, TypeError) as e:
+            return {}
+        if not isinstance(scores, dict):
+            return {}
+        now = time.time()
+        return dict((host, entry) for host, entry in scores.items() \
+                    if now - entry[1] < (self.dead_ttl if entry[0] == DEAD \
+                                         else self.ttl))
+
+    def _save(self):
+        """Persist the scores, silently skipped without write access"""
+        try:
+            with open(self.cache_fn + ".tmp", "wb") as fd:
+                marshal.dump(self.scores, fd)
+            os.rename(self.cache_fn + ".tmp", self.cache_fn)
+        except (IOError, OSError) as e:
+            pass
+
+    def probe(self, url):
+        """Return the seconds it takes to get the first `probe_size` bytes
+        of `url` or DEAD, if the mirror does not answer properly
+        """
+        started = time.time()
+        try:
+            resp = self.downloader._open(url, {
+                "Range": "bytes=0-{0}".format(self.probe_size - 1)})
+        except (httplib.HTTPException, urllib2.URLError, socket.error,
+                IOError) as e:
+            return DEAD
+        try:
+            if resp.status not in (200, 206):
+                return DEAD
+            # a server ignoring the Range header sends the whole file
+            resp.read(self.probe_size)
+        except (httplib.HTTPException, socket.error, IOError) as e:
+            return DEAD
+        finally:
+            resp.close()
+        return time.time() - started
+
+    def penalize(self, url):
+        """Mark the mirror of `url` as dead for the rest of this run"""
+        with self.lock:
+            self.scores[mirror_host(url)] = (DEAD, 0)
+
+    def alive(self, url):
+        """False, if the mirror of `url` is known to be dead"""
+        return self.scores.get(mirror_host(url), (0, ))[0] != DEAD
+
+    def order(self, urls, probe=False):
+        """Return `urls` ordered by the score of their mirror, best first.
+        The mirrors without a score follow in their order, the dead ones come
+        last. If `probe` is set, the unknown mirrors among the first
+        `probe_count` urls are probed concurrently before.
+
+        :param urls: the list of urls to the same file, one per mirror
+        :param probe: probe the mirrors without a (cached) score (optional)
+        """
+        unknown = [url for url in urls[:self.probe_count] \
+                   if mirror_host(url) not in self.scores]
+        if probe and len(urls) > 1 and unknown:
+            def work(url):
+                score = self.probe(url)
+                with self.lock:
+                    self.scores[mirror_host(url)] = (score, time.time())
+            for thread in self.downloader._spawn(unknown, work):
+                thread.join()
+            self._save()
+
+        def key(url):
+            score = self.scores.get(mirror_host(url))
+            if score is None:
+                return (1, 0)
+            elif score[0] == DEAD:
+                return (2, 0)
+            return (0, score[0])
+
+        # sorted() is stable, so the mirrorlist order breaks ties
+        return sorted(urls, key=key)
@@ -16,14 +16,21 @@ should be used (optional).
 After these definitions, the __init__ has to construct the filename for the
 config file and then just call the super().__init__() and the ConfigMapper
 instance gets populated with the data from the input file.
+
+Each ConfigMapper instance works on its own copies of the ConfigItems, so
+several configurations can be used side by side. The parsed configuration
+can be cached as a snapshot, which is used as long as the config files keep
+their mtime and size.
 """
 
 import os
+import marshal
 from StringIO import StringIO
+from collections import OrderedDict
 from ConfigParser import RawConfigParser
 
 import pyalpmm_raw as p
-from pyalpmm.tools import CriticalError
+from pyalpmm.tools import CriticalError, CachedProperty
 
 class ConfigError(CriticalError):
     pass
@@ -49,18 +56,33 @@ class ConfigItem(object):
     outconv = lambda s, v: v
 
     default = None
+    # the ConfigMapper attribute holding the copies of this kind of item
+    shelf = "config_items"
 
     def __init__(self, section, default_value=None):
         self.section = section
         self.value = default_value \
             if default_value is not None else self.default
-        # this is set inside ConfigMapper.__init__
+        # this is set inside ConfigMapper.get_class_items()
         self.name = None
 
     def __get__(self, obj, owner):
-        return self.value
+        if obj is None:
+            return self
+        return getattr(obj, self.shelf)[self.name].value
     def __set__(self, obj, val):
-        self.value = val
+        getattr(obj, self.shelf)[self.name].value = val
+
+    def copy(self):
+        """Return a copy of this item, holding the value for one
+        ConfigMapper instance
+        """
+        item = object.__new__(self.__class__)
+        item.__dict__.update(self.__dict__)
+        # the lists are changed in place sometimes
+        if isinstance(self.value, list):
+            item.value = list(self.value)
+        return item
 
     def __repr__(self):
         return "<{0} name={1} val=\"{2}\" section=\"{3}\">".format(
@@ -109,6 +131,7 @@ class YesNoConfigItem(ConfigItem):
 class CommandlineItem(ConfigItem):
     """A special ConfigItem, which is passed through the commandline"""
     default = False
+    shelf = "cmdline_items"
 
     def __init__(self, default_value=None):
         super(CommandlineItem, self).__init__(None, default_value)
@@ -133,42 +156,74 @@ class ConfigMapper(object):
     options object from 'optparse', or something that behaves like it. You will
     get a fully populated CustomConfigMapper object already up-to-date with
     your config file.
-    """
-    config_items = {}
-    cmdline_items =  {}
 
+    If `snapshot_fn` is set, the values read from the config file are cached
+    there and the file is only parsed again after it changed, see
+    :meth:`snapshot_sources`.
+    """
     # if strict is True, _all_ config options MUST be set in the config
     strict = False
 
-    def __init__(self, stream=None, cmd_args=None):
-        # all ConfigurationItems in class
-        all_confs = ((name, attr) \
-                     for name, attr in self.__class__.__dict__.items() \
-                     if isinstance(attr, ConfigItem))
+    # the file caching the parsed configuration, None disables the cache
+    snapshot_fn = None
+    # bump this, if the snapshot format changes
+    snapshot_version = 2
 
-        # as an attribute doesn't know his own name automaticly, set it!
-        # further append all Items to their appropriate lists:
+    def __init__(self, stream=None, cmd_args=None):
+        # each instance gets its own copies of the class' items:
         #    - config_items for ConfigItems
         #    - cmdline_items for CommandlineItems
-        for name, attr in all_confs:
-            attr.name = name
-            if isinstance(attr, CommandlineItem):
-                self.cmdline_items[name] = attr
-            elif isinstance(attr, ConfigItem):
-                self.config_items[name] = attr
-            else:
-                assert False, "Something went terribly wrong"
+        self.config_items = {}
+        self.cmdline_items = {}
+        for name, attr in self.get_class_items():
+            getattr(self, attr.shelf)[name] = attr.copy()
 
         self.cmd_args = cmd_args
         self.stream = stream or StringIO()
-        self.confobj = RawConfigParser()
-        self.confobj.readfp(self.stream)
+        # the values, which were actually read from the config file
+        self.file_values = {}
 
         # take commandline options into account
         self.handle_cmdline_args(self.cmd_args)
 
-        # actually read the data from the file
-        self.read_from_file()
+        # actually read the data from the file, if there is no snapshot
+        key = self._snapshot_key()
+        snapshot = self.load_snapshot(key)
+        if snapshot is None:
+            self.read_from_file()
+            self.save_snapshot(key, self.make_snapshot())
+        else:
+            self.restore_snapshot(snapshot)
+
+    @classmethod
+    def get_class_items(cls):
+        """Return a list of (name, item) for all ConfigItems defined in the
+        class and its bases, an item of a subclass overrides the one of its
+        base. Each class is only walked once
+        """
+        items = cls.__dict__.get("_class_items")
+        if items is None:
+            found = {}
+            for klass in reversed(cls.__mro__):
+                for name, attr in klass.__dict__.items():
+                    if isinstance(attr, ConfigItem):
+                        found[name] = attr
+                    elif name in found:
+                        # a plain attribute hides the item of the base
+                        del found[name]
+            items = found.items()
+            # as an attribute doesn't know his own name automaticly, set it!
+            for name, attr in items:
+                attr.name = name
+            cls._class_items = items
+        return items
+
+    @CachedProperty
+    def confobj(self):
+        """The RawConfigParser for `stream`, parsed on first access"""
+        confobj = RawConfigParser()
+        confobj.readfp(self.stream)
+        return confobj
 
     def __getitem__(self, key):
         if key in self:
@@ -200,12 +255,73 @@ class ConfigMapper(object):
         for item in self.config_items.values():
             if self.confobj.has_option(item.section, item.name):
                 item.value = item.inconv(self.confobj.get(item.section, item.name).strip())
+                self.file_values[item.name] = item.value
             elif self.strict:
                 raise ConfigError("Didn't find section: %s with option: %s" % (
                     item.section,
                     item.name
                 ))
 
+    def snapshot_sources(self):
+        """The files the configuration is read from, a snapshot is valid
+        as long as none of them changed
+        """
+        return [getattr(self.stream, "name", None)]
+
+    def _snapshot_key(self):
+        """Identify the current state of the snapshot sources"""
+        key = [self.__class__.__name__, self.snapshot_version]
+        for fn in self.snapshot_sources():
+            try:
+                st = os.stat(fn)
+                key.append((os.path.abspath(fn), st.st_mtime, st.st_size))
+            except (TypeError, OSError) as e:
+                key.append((fn, None, None))
+        return key
+
+    def load_snapshot(self, key):
+        """Return the snapshot saved for `key`, None if there is none or the
+        sources changed since
+
+        :param key: the state of the sources, see :meth:`_snapshot_key`
+        """
+        if self.snapshot_fn is None:
+            return None
+        try:
+            with open(self.snapshot_fn, "rb") as fd:
+                saved_key, snapshot = marshal.load(fd)
+        except (IOError, EOFError, ValueError, TypeError) as e:
+            return None
+        return snapshot if saved_key == key else None
+
+    def save_snapshot(self, key, snapshot):
+        """Save `snapshot` for `key`, silently skipped without write access
+
+        :param key: the state of the sources, taken before they were read
+        :param snapshot: the dict returned by :meth:`make_snapshot`
+        """
+        if self.snapshot_fn is None:
+            return
+        try:
+            with open(self.snapshot_fn + ".tmp", "wb") as fd:
+                marshal.dump((key, snapshot), fd)
+            os.rename(self.snapshot_fn + ".tmp", self.snapshot_fn)
+        except (IOError, OSError, ValueError) as e:
+            pass
+
+    def make_snapshot(self):
+        """Return the parsed configuration as a dict, which marshal can
+        write
+        """
+        return {"values": self.file_values}
+
+    def restore_snapshot(self, snapshot):
+        """Set the values from `snapshot` instead of reading the file"""
+        for name, value in snapshot["values"].items():
+            if name in self.config_items:
+                self.config_items[name].value = value
+                self.file_values[name] = value
+
     def create_default_config(self, fn="pyalpmm.conf"):
         """Write the default config settings to a file"""
         conf_obj = RawConfigParser()
@@ -236,19 +352,39 @@ class PyALPMMConfiguration(ConfigMapper):
     local_db_path = StringConfigItem("paths", "/var/lib/pacman")
     rootpath = StringConfigItem("paths", "/")
     logfile = StringConfigItem("paths", "/tmp/alpm.log")
+    daemon_socket = StringConfigItem("paths", "/var/run/pyalpmmd.sock")
+    file_index = StringConfigItem("paths",
+                                  "/var/cache/pacman/pyalpmm-files.db")
 
     repos = ListConfigItem("repositories", ["core", "extra", "community"])
 
     aur_support = YesNoConfigItem("aur", True)
     build_quiet = YesNoConfigItem("aur", False)
     build_dir = StringConfigItem("aur", "/var/cache/pacman/src/")
+    build_jobs = IntegerConfigItem("aur", 2)
     abs_dir = StringConfigItem("aur", "/var/abs")
     aur_url = StringConfigItem("aur", "http://aur.archlinux.org/")
     aur_pkg_dir = StringConfigItem("aur", "packages/")
     rpc_command = StringConfigItem("aur", "rpc.php?type=%(type)s&arg=%(arg)s")
+    rpc_multi_command = StringConfigItem("aur", "rpc.php?type=multiinfo%(args)s")
+    aur_rpc_cache = StringConfigItem("aur",
+                                     "/var/cache/pacman/pyalpmm-aur.cache")
+    aur_rpc_ttl = IntegerConfigItem("aur", 3600)
     build_uid = IntegerConfigItem("aur", 1000)
     build_gid = IntegerConfigItem("aur", 100)
     editor_command = StringConfigItem("aur", "vim")
+    aur_cache_dir = StringConfigItem("aur", "/var/cache/pacman/aur/")
+    aur_max_size = IntegerConfigItem("aur", 16 * 1024 * 1024)
+
+    download_workers = IntegerConfigItem("download", 4)
+    download_timeout = IntegerConfigItem("download", 30)
+    download_per_mirror = IntegerConfigItem("download", 2)
+    mirror_spread = IntegerConfigItem("download", 3)
+    mirror_ttl = IntegerConfigItem("download", 86400)
+    mirror_cache = StringConfigItem("download",
+                                    "/var/cache/pacman/pyalpmm-mirrors.state")
+    download_state = StringConfigItem("download",
+                                      "/var/cache/pacman/pyalpmm-download.state")
 
     # commandline options
     download_only = CommandlineItem(0)
@@ -275,11 +411,16 @@ class PyALPMMConfiguration(ConfigMapper):
     # where to find the mirrorlistst
     mirror_fn = "/etc/pacman.d/mirrorlist"
 
+    # the parsed config and mirrorlist are cached here
+    snapshot_fn = "/var/cache/pacman/pyalpmm-config.cache"
+
     # set by __init__
     events = None
 
-    # set in read_from_file() {"reponame": "url"}
-    available_repositories = {}
+    # set in read_from_file() {"reponame": ["url", ...]}, one url per mirror.
+    # An OrderedDict: the repos from 'repos' first, then the custom ones, in
+    # the order of the config file. It is the priority of the repositories.
+    available_repositories = None
 
     def __init__(self, events, config_fn=None, cmd_args=None):
         self.events = events
@@ -290,7 +431,8 @@ class PyALPMMConfiguration(ConfigMapper):
         parentdir = os.path.join("..", os.path.basename(config_fn))
 
         if os.path.exists(config_fn):
-            pass # found regular config, all fine, go on...
+            # found regular config, all fine, go on...
+            self.configfile = config_fn
         else:
             if os.path.exists(thisdir):
                 print "[i] %s isn't there - took ./%s as configfile" % \
@@ -346,24 +488,42 @@ class PyALPMMConfiguration(ConfigMapper):
         of course custom repositories from the config file, too
         """
         super(PyALPMMConfiguration, self).read_from_file()
+        self.available_repositories = OrderedDict()
 
-        # reading repos from /etc/pacman.d/mirrorlist
+        # reading all mirrors from /etc/pacman.d/mirrorlist
+        repo_tmpls = []
         for line in file(self.mirror_fn):
             if line.strip().startswith("Server"):
-                repo_tmpl = line[line.find("=")+1:].strip()
-                break
+                repo_tmpls.append(line[line.find("=")+1:].strip())
 
         for repo in self.repos:
-            self.available_repositories[repo] = repo_tmpl. \
-                replace("$repo", repo).replace("$arch", self.architecture)
+            self.available_repositories[repo] = [
+                tmpl.replace("$repo", repo).replace("$arch", self.architecture)
+                for tmpl in repo_tmpls
+            ]
 
-        # reading additional repos from configfile
+        # reading additional repos from configfile, mirrors separated by ","
         for k,v in self.confobj.items("repositories"):
             if k != "repos":
-                self.available_repositories[k] = v
+                self.available_repositories[k] = \
+                    [url.strip() for url in v.split(",") if url.strip()]
 
         self.events.DoneReadingConfigFile(filename=(self.configfile))
 
+    def snapshot_sources(self):
+        """The config file and the mirrorlist"""
+        return [self.configfile, self.mirror_fn]
 
+    def make_snapshot(self):
+        """Add the repositories with their mirrors to the snapshot"""
+        snapshot = super(PyALPMMConfiguration, self).make_snapshot()
+        # marshal can't write an OrderedDict
+        snapshot["repositories"] = self.available_repositories.items()
+        return snapshot
 
+    def restore_snapshot(self, snapshot):
+        """Take the repositories from the snapshot, too"""
+        super(PyALPMMConfiguration, self).restore_snapshot(snapshot)
+        self.available_repositories = OrderedDict(snapshot["repositories"])
 
+        self.events.DoneReadingConfigFile(filename=(self.configfile))
@@ -7,13 +7,17 @@ pbuilder.py
 This module handles the building of packages directly from the source. As there
 is no libalpm interface for building packages the fastest solution was wrapping
 _makepkg_ to accomplish automated building of packages.
+
+The AUR tarballs are streamed straight from the HTTP response into tarfile,
+while being hashed and written to a local cache, keyed by name and version.
+A rebuild of an unchanged package extracts the (verified) cached copy.
 """
 
 import os, sys
 import shutil
 import tarfile
-import urllib
-from StringIO import StringIO
+import urllib2
+import hashlib
 from subprocess import Popen, PIPE, STDOUT, call
 from time import sleep
 import signal
@@ -25,6 +29,43 @@ from tools import CriticalError
 class BuildError(CriticalError):
     pass
 
+# runs a command as another user: argv = uid, gid, command...
+# used instead of a preexec_fn, which is unsafe while other threads run
+_RUN_AS = ("import os, sys; os.setgroups([]); os.setgid(int(sys.argv[2])); "
+           "os.setuid(int(sys.argv[1])); os.execvp(sys.argv[3], sys.argv[3:])")
+
+class StreamReader(object):
+    """A file-like wrapper around `fileobj`, which hashes all read data,
+    optionally copies it to `copy_to` and raises :class:`BuildError` if more
+    than `max_size` bytes are read
+
+    :param fileobj: the file-like object to read from
+    :param max_size: the maximum number of bytes allowed
+    :param copy_to: a file object, all read data is written to (optional)
+    """
+    def __init__(self, fileobj, max_size, copy_to=None):
+        self.fileobj = fileobj
+        self.max_size = max_size
+        self.copy_to = copy_to
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise BuildError("The tarball is bigger than the allowed {0} "
+                             "bytes".format(self.max_size))
+        self.hash.update(data)
+        if self.copy_to is not None:
+            self.copy_to.write(data)
+        return data
+
+    def drain(self):
+        """Read the rest of the stream, i.e. the padding after the tar data"""
+        while self.read(64 * 1024):
+            pass
+
 class PackageBuilder(object):
     """Manages the building process
 
@@ -72,13 +113,9 @@ class PackageBuilder(object):
         elif isinstance(self.pkg, AURPackageItem):
             self.events.StartAURBuildPrepare()
 
-            # get and extract
-            url = c.aur_url + c.aur_pkg_dir + self.pkg.name + "/" + \
-                self.pkg.name + ".tar.gz"
-            # we hold the whole thing in RAM, hmm FIXME
-            to = tarfile.open(fileobj=StringIO(urllib.urlopen(url).read()))
-            to.extractall(os.path.dirname(self.path))
-            to.close()
+            # extract from the cache or stream it from the AUR
+            if not self._extract_cached():
+                self._extract_remote()
         else:
             raise BuildError(("The passed pkg was not an instance of "
                               "(AUR)PackageItem, more a '{0}'").format(
@@ -86,56 +123,168 @@ class PackageBuilder(object):
 
         self.events.DoneBuildPrepare()
 
+    @property
+    def cache_path(self):
+        """The path of the cached AUR tarball for this name and version"""
+        key = "{0}-{1}.tar.gz".format(self.pkg.name, self.pkg.version)
+        return os.path.join(self.session.config.aur_cache_dir,
+                            key.replace("/", "_"))
+
+    def _check_member(self, member, root):
+        """Raise :class:`BuildError`, if the tarball `member` would be
+        written outside of `root` or is a link pointing outside of it. The
+        paths are resolved against what was extracted so far, so nothing can
+        be written through a link either. Devices and fifos are refused.
+
+        :param member: the TarInfo to be extracted next
+        :param root: the real path of the directory to extract into
+        """
+        def inside(path):
+            path = os.path.realpath(path)
+            return path == root or path.startswith(root + os.sep)
+
+        dest = os.path.join(root, member.name)
+        valid = not os.path.isabs(member.name) and \
+                inside(os.path.dirname(dest)) and inside(dest) and \
+                (member.isfile() or member.isdir() or member.issym() or \
+                 member.islnk())
+        if valid and member.issym():
+            # relative to the directory of the link
+            valid = not os.path.isabs(member.linkname) and inside(
+                os.path.join(os.path.dirname(dest), member.linkname))
+        elif valid and member.islnk():
+            # relative to the root of the tarball
+            valid = not os.path.isabs(member.linkname) and inside(
+                os.path.join(root, member.linkname))
+
+        if not valid:
+            raise BuildError("Refusing the tarball member: {0}".format(
+                member.name))
+
+    def _extract(self, reader):
+        """Extract the tarball streamed through `reader` into the build dir,
+        members leaving the build dir are refused (see :meth:`_check_member`)
+
+        :param reader: the file-like object to read the tarball from
+        """
+        root = os.path.realpath(os.path.dirname(self.path))
+        try:
+            to = tarfile.open(fileobj=reader, mode="r|gz")
+            for member in to:
+                self._check_member(member, root)
+                to.extract(member, root)
+            to.close()
+            if hasattr(reader, "drain"):
+                reader.drain()
+        except (tarfile.TarError, IOError, OSError, EOFError) as e:
+            raise BuildError("Could not extract the tarball of {0}: {1}".\
+                             format(self.pkg.name, e))
+
+    def _extract_cached(self):
+        """Extract the cached tarball, if there is one with a matching
+        checksum. The checksum is verified before anything is extracted.
+        Returns False if there is no (valid) cached tarball.
+        """
+        path = self.cache_path
+        try:
+            with open(path + ".sha256") as fd:
+                checksum = fd.read().strip()
+            with open(path, "rb") as fd:
+                reader = StreamReader(fd, self.session.config.aur_max_size)
+                reader.drain()
+        except (IOError, BuildError) as e:
+            reader = None
+
+        if reader is None or reader.hash.hexdigest() != checksum:
+            # a broken cache entry, get a fresh copy
+            if os.path.exists(path):
+                os.remove(path)
+            return False
+
+        try:
+            with open(path, "rb") as fd:
+                self._extract(fd)
+        except (IOError, BuildError) as e:
+            shutil.rmtree(self.path, True)
+            return False
+        return True
+
+    def _extract_remote(self):
+        """Stream the tarball from the AUR, extract it on the fly and keep it
+        inside the cache
+        """
+        c = self.session.config
+        url = c.aur_url + c.aur_pkg_dir + self.pkg.name + "/" + \
+            self.pkg.name + ".tar.gz"
+        try:
+            resp = urllib2.urlopen(url)
+        except (urllib2.URLError, IOError) as e:
+            raise BuildError("Could not download {0}: {1}".format(url, e))
+
+        length = resp.info().getheader("Content-Length")
+        if length and int(length) > c.aur_max_size:
+            raise BuildError("The tarball is bigger than the allowed {0} "
+                             "bytes".format(c.aur_max_size))
+
+        path = self.cache_path
+        try:
+            if not os.path.isdir(c.aur_cache_dir):
+                os.makedirs(c.aur_cache_dir)
+            cache_fd = open(path + ".part", "wb")
+        except (IOError, OSError) as e:
+            # no cache without write access
+            cache_fd = None
+
+        reader = StreamReader(resp, c.aur_max_size, cache_fd)
+        try:
+            self._extract(reader)
+        finally:
+            resp.close()
+            if cache_fd is not None:
+                cache_fd.close()
+
+        if length and int(length) != reader.size:
+            raise BuildError("The tarball of {0} was truncated".format(
+                self.pkg.name))
+
+        if cache_fd is not None:
+            with open(path + ".sha256", "w") as fd:
+                fd.write(reader.hash.hexdigest() + "\n")
+            os.rename(path + ".part", path)
+
     def build(self):
-        """Building is done with the given uid inside a fork,
-        only if PKGBUILD is found and we can change into the directory.
+        """Building is done with the given uid inside a child process,
+        only if PKGBUILD is found inside the build directory.
         If successful, set self.pkgfile_path to built package
         """
-
         self.events.StartBuild(pkg=self.pkg)
+        self.makepkg()
+        self.events.DoneBuild()
+
+    def makepkg(self):
+        """Run makepkg as the build user inside the build directory and set
+        self.pkgfile_path. Neither the working directory nor the uid of this
+        process are changed, so several builds can run concurrently.
+        """
         c = self.session.config
 
         if not os.path.exists(os.path.join(self.path, "PKGBUILD")):
             raise BuildError("PKGBUILD not found at {0}".format(self.path))
 
-        try:
-            os.chdir(self.path)
-        except OSError as e:
-            raise BuildError("Could not change directory to: {0}".\
-                             format(self.path))
-
-        makepkg = "makepkg {1} {0}".format(
-            "> /dev/null 2>&1" if c.build_quiet else "",
-            "-f" if c.force else ""
-        ).strip()
-
         # if run as root, setuid to other user
-        if os.getuid() == 0:
-            os.chown(self.path, c.build_uid, c.build_gid)
-            recv, send = os.pipe()
-            pid = os.fork()
-            if pid == 0:
-                os.close(recv)
-                os.setuid(c.build_uid)
-                ret = str(call(makepkg.split(" ")))
-                send = os.fdopen(send, "w")
-                send.write(ret)
-                send.close()
-                sys.exit(0)
-            else:
-                os.close(send)
-                recv = os.fdopen(recv)
-                ret = recv.read()
-                os.waitpid(pid, 0)
-                recv.close()
-
-                if ret != "0":
-                    raise BuildError("The build failed with the makepkg "
-                           "returncode: {0}".format(ret))
-        else:
+        if os.getuid() != 0:
             raise BuildError("you are not root!")
 
-        self.events.DoneBuild()
+        os.chown(self.path, c.build_uid, c.build_gid)
+        cmd = [sys.executable, "-c", _RUN_AS, str(c.build_uid),
+               str(c.build_gid), "makepkg"] + (["-f"] if c.force else [])
+        with open(os.devnull, "w") as devnull:
+            ret = call(cmd, cwd=self.path,
+                       stdout=devnull if c.build_quiet else None,
+                       stderr=STDOUT if c.build_quiet else None)
+        if ret != 0:
+            raise BuildError("The build failed with the makepkg "
+                             "returncode: {0}".format(ret))
 
         # kinda ugly
         for fn in os.listdir(self.path):
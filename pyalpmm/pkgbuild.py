@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+
+pkgbuild.py
+-----------
+
+This module extracts the metadata (mainly the dependencies) of AUR packages
+from their PKGBUILD or .SRCINFO, without executing anything.
+
+The PKGBUILD parser understands the bash subset used for metadata: scalar
+and array assignments, arrays spanning several lines, single/double quoting,
+comments and the expansion of already assigned scalars like $pkgver.
+
+The parsed metadata is cached on disk, keyed by the package name and version,
+so each AUR package version is fetched only once.
+"""
+
+import os
+import re
+import shlex
+import marshal
+import urllib2
+
+from tools import vercmp
+
+# the metadata we are interested in
+ARRAY_FIELDS = ("depends", "makedepends", "checkdepends", "optdepends",
+                "provides", "conflicts", "replaces")
+SCALAR_FIELDS = ("pkgbase", "pkgname", "pkgver", "pkgrel", "epoch")
+
+_assign_re = re.compile(r"^[ \t]*([A-Za-z_][A-Za-z0-9_]*)=", re.M)
+_var_re = re.compile(r"\$\{([A-Za-z_][A-Za-z0-9_]*)\}|\$([A-Za-z_][A-Za-z0-9_]*)")
+_dep_re = re.compile(r"^([^<>=]+)(<=|>=|=|<|>)?(.*)$")
+
+def split_dependency(dep):
+    """Split a dependency like 'foo>=1.0' into ('foo', '>=', '1.0'), the
+    operator and version are None for an unversioned one
+
+    :param dep: the dependency string
+    """
+    name, op, version = _dep_re.match(dep.strip()).groups()
+    return name, op, (version if op else None)
+
+def satisfies(version, op, required):
+    """True, if `version` fulfills the restriction `op` `required`, i.e.
+    satisfies("1.2-1", ">=", "1.0")
+
+    :param version: the available version
+    :param op: the comparison operator (or None for no restriction)
+    :param required: the required version
+    """
+    if op is None:
+        return True
+    if "-" not in required:
+        # without a pkgrel, the pkgrel is not compared
+        version = version.rsplit("-", 1)[0]
+    res = vercmp(version, required)
+    return {"=": res == 0, "<": res < 0, "<=": res <= 0,
+            ">": res > 0, ">=": res >= 0}[op]
+
+def _find_array_end(text, pos):
+    """Return the position of the ")" closing the array starting at `pos`
+    (right behind the "("), quotes, escapes and comments are skipped
+    """
+    quote = None
+    while pos < len(text):
+        char = text[pos]
+        if quote is not None:
+            if char == "\\" and quote == '"':
+                pos += 1
+            elif char == quote:
+                quote = None
+        elif char == "\\":
+            pos += 1
+        elif char in "'\"":
+            quote = char
+        elif char == "#" and (pos == 0 or text[pos - 1].isspace()):
+            pos = text.find("\n", pos)
+            if pos == -1:
+                return len(text)
+        elif char == ")":
+            return pos
+        pos += 1
+    return pos
+
+def _split(text, scalars):
+    """shlex-split `text` after expanding the known `scalars`"""
+    expand = lambda m: scalars.get(m.group(1) or m.group(2), m.group(0))
+    try:
+        return shlex.split(_var_re.sub(expand, text), comments=True)
+    except ValueError as e:
+        # unbalanced quotes, take what we can get
+        return _var_re.sub(expand, text).replace("'", " ").\
+               replace('"', " ").split()
+
+def parse_pkgbuild(text):
+    """Parse the metadata out of the PKGBUILD `text`, returns a dict with
+    a list for each of ARRAY_FIELDS and a str (or None) for each of
+    SCALAR_FIELDS
+
+    :param text: the content of the PKGBUILD
+    """
+    meta = dict((field, []) for field in ARRAY_FIELDS)
+    scalars = {}
+
+    pos = 0
+    while True:
+        match = _assign_re.search(text, pos)
+        if match is None:
+            break
+        name, pos = match.group(1), match.end()
+
+        if text.startswith("(", pos):
+            end = _find_array_end(text, pos + 1)
+            if name in ARRAY_FIELDS:
+                # skip empty entries like depends=('')
+                meta[name].extend(value for value in \
+                                  _split(text[pos + 1:end], scalars) \
+                                  if value.strip())
+            pos = end + 1
+        else:
+            end = text.find("\n", pos)
+            end = len(text) if end == -1 else end
+            values = _split(text[pos:end], scalars)
+            scalars[name] = values[0] if values else ""
+            pos = end
+
+    for field in SCALAR_FIELDS:
+        meta[field] = scalars.get(field)
+    return meta
+
+def parse_srcinfo(text):
+    """Parse the .SRCINFO `text`, the dependencies of all split packages are
+    merged, returns the same dict as :func:`parse_pkgbuild`
+
+    :param text: the content of the .SRCINFO
+    """
+    meta = dict((field, []) for field in ARRAY_FIELDS)
+    meta.update((field, None) for field in SCALAR_FIELDS)
+    for line in text.splitlines():
+        key, sep, value = line.strip().partition(" = ")
+        if not sep:
+            continue
+        if key in ARRAY_FIELDS:
+            if value.strip() and value not in meta[key]:
+                meta[key].append(value)
+        elif key in SCALAR_FIELDS and meta[key] is None:
+            meta[key] = value
+    return meta
+
+class PKGBUILDCache(object):
+    """Fetches, parses and caches the metadata of AUR packages
+
+    :param config: the :class:`pyalpmm.options.PyALPMMConfiguration` instance
+    """
+    # bump this, if the parsed format changes
+    format_version = 1
+
+    def __init__(self, config):
+        self.config = config
+        self.memory = {}
+
+    def _path(self, pkg):
+        """The cache file for the name and version of `pkg`"""
+        key = "{0}-{1}.meta".format(pkg.name, pkg.version)
+        return os.path.join(self.config.aur_cache_dir, key.replace("/", "_"))
+
+    def _fetch(self, pkg):
+        """Download and parse the .SRCINFO or (if there is none) PKGBUILD"""
+        c = self.config
+        base = c.aur_url + c.aur_pkg_dir + pkg.name + "/" + pkg.name + "/"
+        for fn, parse in ((".SRCINFO", parse_srcinfo),
+                          ("PKGBUILD", parse_pkgbuild)):
+            try:
+                return parse(urllib2.urlopen(base + fn).read())
+            except urllib2.HTTPError as e:
+                if e.code != 404:
+                    raise
+        raise IOError("No PKGBUILD found for {0}".format(pkg.name))
+
+    def get(self, pkg):
+        """Return the metadata dict of the AUR package `pkg`, see
+        :func:`parse_pkgbuild`
+
+        :param pkg: the :class:`pyalpmm.item.AURPackageItem`
+        """
+        path = self._path(pkg)
+        if path in self.memory:
+            return self.memory[path]
+
+        try:
+            with open(path, "rb") as fd:
+                version, meta = marshal.load(fd)
+            if version != self.format_version:
+                raise ValueError("outdated cache entry")
+        except (IOError, EOFError, ValueError, TypeError) as e:
+            meta = self._fetch(pkg)
+            try:
+                if not os.path.isdir(self.config.aur_cache_dir):
+                    os.makedirs(self.config.aur_cache_dir)
+                with open(path + ".tmp", "wb") as fd:
+                    marshal.dump((self.format_version, meta), fd)
+                os.rename(path + ".tmp", path)
+            except (IOError, OSError) as e:
+                pass
+
+        self.memory[path] = meta
+        return meta
+
+    def dependencies(self, pkg):
+        """All build and runtime dependencies of `pkg` as list of
+        (name, operator, version) tuples, see :func:`split_dependency`
+        """
+        meta = self.get(pkg)
+        out = []
+        for dep in meta["depends"] + meta["makedepends"]:
+            if not dep.strip():
+                # cached before empty entries were skipped
+                continue
+            dep = split_dependency(dep)
+            if dep not in out:
+                out.append(dep)
+        return out
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+
+scheduler.py
+------------
+
+This module schedules the building of several AUR packages. The packages and
+their dependencies among each other form a DAG, which is cut into topological
+levels: the first level depends on no other package to be built, every
+following level only on packages from the levels before.
+
+All packages of one level are built concurrently (each inside its own build
+directory), then installed together with one transaction, before the next
+level is started.
+"""
+
+import threading
+from Queue import Queue, Empty
+
+from pbuilder import PackageBuilder, BuildError
+
+class BuildScheduler(object):
+    """Builds (and installs) a set of AUR packages level by level
+
+    :param session: the :class:`pyalpmm.session.Session` instance
+    :param pkgs: the list of :class:`pyalpmm.item.AURPackageItem` to build
+    :param deps: a dict mapping a package name to the names of the packages
+                 it needs, only those inside `pkgs` are taken into account
+    """
+    def __init__(self, session, pkgs, deps):
+        self.session = session
+        self.events = session.config.events
+        self.pkgs = dict((pkg.name, pkg) for pkg in pkgs)
+        self.deps = deps
+
+    def levels(self):
+        """Return the package names grouped into topological levels, raises
+        :class:`BuildError` if the dependencies are cyclic
+        """
+        remaining = dict(
+            (name, set(dep for dep in self.deps.get(name, ()) \
+                       if dep in self.pkgs and dep != name))
+            for name in self.pkgs
+        )
+
+        levels = []
+        while remaining:
+            ready = sorted(name for name, deps in remaining.items() if not deps)
+            if not ready:
+                raise BuildError("The AUR packages depend on each other in a "
+                                 "cycle: {0}".format(", ".join(remaining)))
+            levels.append(ready)
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return levels
+
+    def _prepare(self, name):
+        """Get the :class:`pyalpmm.pbuilder.PackageBuilder` for the package
+        `name` ready, done serially as editing may ask the user
+        """
+        c = self.session.config
+        builder = PackageBuilder(self.session, self.pkgs[name])
+        if c.build_cleanup:
+            builder.cleanup()
+        if c.build_prepare:
+            builder.prepare()
+        if c.build_edit:
+            builder.edit()
+        return builder
+
+    def build_level(self, names):
+        """Build all packages called like the elements of `names`
+        concurrently, returns their
+        :class:`pyalpmm.pbuilder.PackageBuilder` instances
+
+        :param names: the names of the packages to build
+        """
+        builders = [self._prepare(name) for name in names]
+
+        jobs, results = Queue(), Queue()
+        for builder in builders:
+            jobs.put(builder)
+
+        def worker():
+            while True:
+                try:
+                    builder = jobs.get_nowait()
+                except Empty:
+                    return
+                try:
+                    builder.makepkg()
+                    results.put((builder, None))
+                except Exception as e:
+                    # i.e. an OSError, every builder has to queue a result
+                    # or the loop below waits forever
+                    results.put((builder, e))
+
+        for builder in builders:
+            self.events.StartBuild(pkg=builder.pkg)
+        jobs_limit = max(self.session.config.build_jobs, 1)
+        threads = [threading.Thread(target=worker) \
+                   for i in xrange(min(jobs_limit, len(builders)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        errors = []
+        for i in xrange(len(builders)):
+            # with a timeout, the wait can be interrupted by ^C
+            builder, error = results.get(True, 1e9)
+            if error is None:
+                self.events.DoneBuild()
+            else:
+                errors.append("{0}: {1}".format(builder.pkg.name, error))
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise BuildError("Building failed for: {0}".format(
+                "; ".join(errors)))
+        return builders
+
+    def run(self, install):
+        """Build all packages level by level, after each level `install` is
+        called with the list of the built package files. Raises
+        :class:`BuildError` if a level fails to build or to install.
+
+        :param install: a callable installing the given package files
+        """
+        db_man = self.session.db_man
+        for names in self.levels():
+            builders = self.build_level(names)
+            if not self.session.config.build_install:
+                continue
+
+            install([builder.pkgfile_path for builder in builders])
+            missing = [name for name in names \
+                       if db_man.get_local_package(name) is None]
+            if missing:
+                raise BuildError("Stopping, the following packages were not "
+                                 "installed: {0}".format(", ".join(missing)))
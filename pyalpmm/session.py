@@ -12,18 +12,18 @@ DatabaseManager instance as 'db_man'.
 """
 
 import os, sys
-import urllib
+from functools import partial
 
 import pyalpmm_raw as p
 
 from database import DatabaseManager, LocalDatabase, SyncDatabase, AURDatabase
-from tools import CriticalError, CachedProperty, UserError
-from transaction  import DatabaseUpdateTransaction, AURTransaction, \
-     UpgradeTransaction, SysUpgradeTransaction, RemoveTransaction, \
-     SyncTransaction, DatabaseError, NotFoundError, \
-     UnsatisfiedDependenciesError, FileConflictError, NothingToBeDoneError, \
-     ConflictingDependenciesError
-from pbuilder import PackageBuilder, BuildError
+from item import PackageItem
+from tools import CriticalError, CachedProperty, UserError, vercmp
+from graph import PackageGraph
+
+# the transaction, build and download modules (and with them subprocess,
+# tarfile, urllib2, ...) are imported, when they are needed the first time.
+# Read-only use like "mmacman -Q" never loads them.
 
 class SessionError(CriticalError):
     pass
@@ -50,23 +50,39 @@ class Session(object):
             raise SessionError("Could not open the database path: %s" % \
                                config.local_db_path)
 
-        self.db_man = DatabaseManager(config.events)
+        self.db_man = DatabaseManager(config.events, self._create_downloader)
 
+        # the sync databases and the AUR are set up on their first access
         self.db_man.register("local", LocalDatabase())
-        for repo, url in config.available_repositories.items():
-            self.db_man.register(repo, SyncDatabase(repo, url))
+        for repo, urls in config.available_repositories.items():
+            self.db_man.register(repo, partial(SyncDatabase, repo, urls))
 
         if config.aur_support:
-            self.db_man.register("aur", AURDatabase(config))
+            self.db_man.register("aur", partial(AURDatabase, config))
 
         self.apply_config()
 
         self.config.events.DoneInitSession()
 
+    def _create_downloader(self):
+        from download import Downloader
+        return Downloader(self.config)
+
     def release(self):
-        """Release the session"""
+        """Release the session, the databases are unregistered before as
+        libalpm frees them with the handle
+        """
+        self.db_man.unregister_all()
         p.alpm_release()
 
+    @CachedProperty
+    def file_index(self):
+        """The :class:`pyalpmm.fileindex.FileIndex` for the local database,
+        opened on first access
+        """
+        from fileindex import FileIndex
+        return FileIndex(self)
+
 
     def apply_config(self):
         """Apply some special options to the libalpm session at the end of
@@ -91,6 +107,29 @@ class SystemError(CriticalError):
 class NotRootError(SystemError):
     pass
 
+class UpgradePlan(object):
+    """The outcome of a system upgrade, as computed by
+    :meth:`System.plan_upgrade` without any transaction
+
+    :param upgrades: a list of (local pkg, sync pkg) tuples ordered by name
+    :param ignored: the names of the packages, which have a new version but
+                    are ignored through `ignorepkgs` or `ignoregrps`
+    :param download_size: the bytes to download, cached packages excluded
+    :param install_size: the installed size of all new package versions
+    :param size_change: the installed size of the new minus the one of the
+                        old package versions
+    """
+    def __init__(self, upgrades, ignored, download_size, install_size,
+                 size_change):
+        self.upgrades = upgrades
+        self.ignored = ignored
+        self.download_size = download_size
+        self.install_size = install_size
+        self.size_change = size_change
+
+    def __len__(self):
+        return len(self.upgrades)
+
 class System(object):
     """The highest-level API from pyalpmm, changing the system entirely
     with just some lines of code.
@@ -128,12 +167,26 @@ class System(object):
             self._init_signal_handler(global_sig_cb)
 
     @CachedProperty
-    def dependency_map(self):
-        dm = {}
-        for pkg in self.session.db_man.get_local_packages():
-            for dep in pkg.depends:
-                dm.setdefault(dep.name, []).append(pkg.name)
-        return dm
+    def pkgbuilds(self):
+        """The :class:`pyalpmm.pkgbuild.PKGBUILDCache` for resolving the
+        dependencies of AUR packages
+        """
+        from pkgbuild import PKGBUILDCache
+        return PKGBUILDCache(self.config)
+
+    @CachedProperty
+    def local_graph(self):
+        """The :class:`pyalpmm.graph.PackageGraph` of all local packages"""
+        return PackageGraph(self.session.db_man.get_local_packages())
+
+    @CachedProperty
+    def sync_graph(self):
+        """The :class:`pyalpmm.graph.PackageGraph` of all packages inside the
+        sync repositories, they are walked in the configured order, so like in
+        libalpm earlier repositories shadow later ones
+        """
+        return PackageGraph(self.session.db_man.get_packages(
+            repos=list(self.config.available_repositories)))
 
     def _is_root(self, critical=True):
         if self.session.config.rights == "root":
@@ -143,6 +196,11 @@ class System(object):
         return False
 
     def _handle_transaction(self, tcls, return_if_not_found=False, **kw):
+        from transaction import DatabaseUpdateTransaction, NotFoundError, \
+             UnsatisfiedDependenciesError, FileConflictError, \
+             ConflictingDependenciesError, NothingToBeDoneError
+        from pbuilder import BuildError
+
         self.transaction_active = True
         try:
             self._is_root()
@@ -176,6 +234,8 @@ class System(object):
             self.events.UserAbort(e=e)
         finally:
             self.transaction_active = False
+            # the graph may not reflect the database anymore
+            del self.local_graph
 
     def _is_package_installed(self, pkgname):
         """Check if the given package defined by `pkgname` is
@@ -193,24 +253,20 @@ class System(object):
         needed as a dependency
 
         :param pkgname: name of the package as a string
-
+        :param exclude_packages: names of packages, which should not be
+                                 taken into account as requiring packages
         """
-        exclude_packages = set(exclude_packages or set())
-        pkg = self.session.db_man.get_local_package(pkgname)
-        if pkg is None:
+        graph = self.local_graph
+        nid = graph.node(pkgname)
+        if nid is None:
             return True
 
         # was not installed as dependency, so wanted by the user, is NEEDED
-        if not pkg.reason == p.PM_PKG_REASON_DEPEND:
+        if not graph.is_dependency(nid):
             return False
 
-        names = [pkgname] + list(pkg.replaces or []) + list(pkg.provides or [])
-        return all(
-            name not in self.dependency_map or
-            (name in self.dependency_map and
-             len(set(self.dependency_map[name]) - exclude_packages) == 0)
-            for name in names
-        )
+        exclude = set(graph.node(name) for name in (exclude_packages or []))
+        return all(req in exclude for req in graph.required_by(nid))
 
     def _init_global_exception_handler(self, callback):
         def exceptionhooker(exception_type, exception_value, traceback_obj):
@@ -231,41 +287,18 @@ class System(object):
 
         :param targets: pkgnames as a list of str
         """
-        db = self.session.db_man
-
         if recursive:
-            # collect dependencies of the target packages
-            deps = set()
-            for pkgname in targets:
-                pkg = db.get_local_package(pkgname)
-                if pkg is None:
-                    continue
-                deps.update(dep.name for dep in pkg.depends)
-            # delete dependencies, which are already inside targets
-            deps -= set(targets)
-
-            # resolving dependencies and deciding if we delete dependency
-            dep_targets = set()
-            while len(deps) > 0:
-                dep = deps.pop()
-                if self._is_package_unneeded(dep, targets):
-                    pkg = db.get_local_package(dep)
-
-                    if not pkg:
-                        print "[-] The dependency: {0} is not installed".\
-                              format(dep)
-                        continue
-
-                    deps |= set([d.name for d in pkg.depends])
-                    dep_targets.add(dep)
-
-                    print ("[+] added package: {0} to targets, " \
-                           "isn't needed anymore").format(dep)
+            # all dependencies, which are only needed by removed packages
+            dep_targets = self.local_graph.removable_dependencies(targets)
+            for dep in dep_targets:
+                print ("[+] added package: {0} to targets, " \
+                       "isn't needed anymore").format(dep)
 
-            all_targets = targets + list(dep_targets)
+            all_targets = targets + dep_targets
         else:
             all_targets = targets
 
+        from transaction import RemoveTransaction
         self._handle_transaction(RemoveTransaction, targets=all_targets)
 
     def upgrade_packages(self, targets):
@@ -282,12 +315,14 @@ class System(object):
             pkg = self._is_package_installed(pkgname)
             if pkg: self.events.ReInstallingPackage(pkg=pkg)
 
+        from transaction import UpgradeTransaction
         self._handle_transaction(UpgradeTransaction, targets=targets)
 
     def build_packages(self, targets):
         """Build the given targets either from AUR or through ABS.
 
         :param targets: pkgnames as a list of str"""
+        from transaction import AURTransaction
         self._handle_transaction(AURTransaction, targets=targets)
 
     def sync_packages(self, targets):
@@ -295,6 +330,12 @@ class System(object):
 
         :param targets: pkgnames as a list of str
         """
+        from transaction import SyncTransaction, UpgradeTransaction, \
+             NotFoundError
+        from pkgbuild import satisfies
+        from scheduler import BuildScheduler
+        from pbuilder import BuildError
+
         db_man = self.session.db_man
         c = self.session.config
 
@@ -314,6 +355,7 @@ class System(object):
             return
 
         # find repositories for all remaining packages
+        db_man.prefetch_aur(not_found_targets)
         pkg_map = dict((
             k,
             db_man.get_sync_package(k, raise_ambiguous=True)
@@ -328,35 +370,44 @@ class System(object):
         stack = [pkg for pkg in pkg_map.values() if pkg.repo == "aur"]
         aur_targets = [k for k, v in pkg_map.items() if v.repo == "aur"]
         targets = [tar for tar in targets if tar not in aur_targets]
+        # AUR package name -> names of the AUR packages it needs
+        aur_deps = {}
 
         while len(stack) > 0:
             pkg = stack.pop()
-            url = c.aur_url + c.aur_pkg_dir + pkg.name + "/" + pkg.name + \
-                "/" +"PKGBUILD"
-            deps = []
-            for line in urllib.urlopen(url).read().split("\n"):
-                if "depends" in line.lower() or "makedepends" in line.lower():
-                    deps.extend(line[line.find("(")+1:line.find(")")].split())
-
-            # IGNORING VERSIONS HERE !!! FIXME!!!!!!!!!
-            for dep in deps:
-                dep = dep.strip("'")
-                if dep.find("<") != -1: dep = dep[:dep.find("<")]
-                elif dep.find("==") != -1: dep = dep[:dep.find("==")]
-                elif dep.find(">") != -1: dep = dep[:dep.find(">")]
-
-                if dep in targets or self.session.db_man.get_local_package(dep):
+            pkg_deps = aur_deps.setdefault(pkg.name, set())
+
+            deps = self.pkgbuilds.dependencies(pkg)
+            # ask the AUR for all unknown dependencies at once
+            db_man.prefetch_aur(dep for dep, op, version in deps \
+                if dep not in aur_targets and dep not in targets and \
+                   db_man.get_local_package(dep) is None)
+            for dep, op, version in deps:
+                if dep in aur_targets:
+                    pkg_deps.add(dep)
+                    continue
+                elif dep in targets:
+                    continue
+
+                # an installed package is fine, if its version fits
+                loc_pkg = db_man.get_local_package(dep)
+                if loc_pkg and satisfies(str(loc_pkg.version), op, version):
                     continue
 
-                pkg = self.session.db_man.get_sync_package(dep)
-                if pkg is None:
+                dep_pkg = db_man.get_sync_package(dep)
+                if dep_pkg is None:
                     raise SystemError(
                         "Could not find the package anywhere: {0}".format(dep))
-                elif pkg.repo == "aur":
-                    stack.append(pkg)
-                    aur_targets.append(pkg.name)
+                elif not satisfies(str(dep_pkg.version), op, version):
+                    raise SystemError(
+                        "No version of {0} satisfies: {0}{1}{2}".format(
+                            dep, op, version))
+                elif dep_pkg.repo == "aur":
+                    stack.append(dep_pkg)
+                    aur_targets.append(dep_pkg.name)
+                    pkg_deps.add(dep_pkg.name)
                 else:
-                    targets.append(pkg.name)
+                    targets.append(dep_pkg.name)
 
         if len(targets) > 0:
             self.events.StartPreAURTransaction(
@@ -368,44 +419,178 @@ class System(object):
                 [db_man.get_sync_package(name) for name in aur_targets]
             self.events.ProcessingAURPackages(add=aur_pkg_objs)
 
+            # independent packages are built concurrently, level by level
             c.build_install = True;
-            for aur_target in reversed(aur_targets):
-                self.build_packages([aur_target])
-            # reversing the list here is not precisely correct
-            # (no problems yet, but who knows) WRONG - there are problems:
-            # we have to build one package after another to make sure
-            # the dependencies are fullfilled, a dependency map would bring
-            # the luxury of making "bundles" of un-dependend packages!
-            # TODO: building a dependency map here
+            scheduler = BuildScheduler(self.session, aur_pkg_objs, aur_deps)
+            try:
+                scheduler.run(install=lambda pkgfiles: self._handle_transaction(
+                    UpgradeTransaction, targets=pkgfiles))
+            except BuildError as e:
+                self.events.BuildProblem(e=e)
 
     def sys_upgrade(self):
         """Upgrade the whole system with the latest available packageversions"""
+        from transaction import SysUpgradeTransaction
         self._handle_transaction(SysUpgradeTransaction)
 
+    def plan_upgrade(self):
+        """Compute what :meth:`sys_upgrade` would do, without a transaction.
+        So neither root nor the database lock is needed, the versions of the
+        local and sync packages are compared in bulk by name. Replacements
+        ("replaces" of sync packages) are not taken into account.
+
+        Returns an :class:`UpgradePlan`
+        """
+        c, db_man = self.config, self.session.db_man
+        local = dict((row[1], row) for row in db_man["local"].get_packages().\
+                     extract(["name", "version", "isize"]))
+
+        # like libalpm, the first sync repository having the package wins,
+        # available_repositories is in the configured order
+        fields = ["name", "version", "size", "isize", "filename"]
+        candidates, ignored_grp_members = {}, set()
+        for repo in c.available_repositories:
+            db = db_man.sync_dbs.get(repo)
+            if db is None:
+                continue
+            for row in db.get_packages().extract(fields):
+                if row[1] in local and row[1] not in candidates:
+                    candidates[row[1]] = (repo, row)
+            for grp in db.get_groups():
+                if grp.name in c.ignoregrps:
+                    ignored_grp_members.update(
+                        (repo, pkg.name) for pkg in grp.pkgs)
+
+        upgrades, ignored = [], []
+        download_size = install_size = size_change = 0
+        for name in sorted(candidates):
+            repo, row = candidates[name]
+            loc_row = local[name]
+            res = vercmp(row[2], loc_row[2])
+            if res == 0 or (res < 0 and not c.allow_downgrade):
+                continue
+            elif name in c.ignorepkgs or (repo, name) in ignored_grp_members:
+                ignored.append(name)
+                continue
+
+            loc_pkg = PackageItem(loc_row[0], {"name": name,
+                                               "version": loc_row[2],
+                                               "isize": loc_row[3]})
+            loc_pkg.repo = "local"
+            sync_pkg = PackageItem(row[0], dict(zip(fields, row[1:])))
+            sync_pkg.repo = repo
+            upgrades.append((loc_pkg, sync_pkg))
+
+            if not row[5] or not any(os.path.exists(
+                    os.path.join(cachedir, row[5])) for cachedir in c.cachedirs):
+                download_size += row[3]
+            install_size += row[4]
+            size_change += row[4] - loc_row[3]
+
+        return UpgradePlan(upgrades, ignored, download_size, install_size,
+                           size_change)
+
     def update_databases(self):
         """Update the package database indexes"""
+        from transaction import DatabaseUpdateTransaction
         self._handle_transaction(DatabaseUpdateTransaction)
+        # only an update changes the sync databases
+        del self.sync_graph
 
     def get_local_packages(self):
         """Get all local installed packages"""
         return self.session.db_man["local"].get_packages()
 
-    def get_unneeded_packages(self):
+    def get_unneeded_packages(self, transitive=True):
         """Get all packages, which have not been installed explicitly and are
-        not a dependency from some other package."""
-        return set(pkg for pkg in self.session.db_man.get_local_packages() \
-                   if self._is_package_unneeded(pkg.name))
+        not a dependency from some other package.
 
-    def search_packages(self, pkgname):
-        """Search for a query/pkgname in the repositories. Behave like
-        pacman and also search inside the package descriptions.
+        :param transitive: if True, also report packages only needed by other
+                           unneeded packages, if False only the direct leaves
+        """
+        graph, db_man = self.local_graph, self.session.db_man
+        names = graph.orphans() if transitive else graph.unneeded()
+        return set(db_man.get_local_package(name) for name in names)
+
+    def iter_unneeded(self, fields, transitive=True):
+        """Like :meth:`get_unneeded_packages`, but yield the raw values of
+        `fields` for each package ordered by the name. The values are taken
+        from the package table of the local database, no
+        :class:`pyalpmm.item.PackageItem` is created.
+
+        :param fields: a list of column names of
+                       :class:`pyalpmm.table.PackageTable`
+        :param transitive: see :meth:`get_unneeded_packages`
+        """
+        graph = self.local_graph
+        table = self.session.db_man["local"].package_table
+        names = graph.orphans() if transitive else graph.unneeded()
+        for name in sorted(names):
+            yield table.get_values(name, fields)
+
+    def get_foreign_packages(self, check_aur=False):
+        """Get all installed packages, which are not inside any of the sync
+        repositories (like "pacman -Qm"). The names of the package indices
+        are compared as sets in one pass, instead of looking up each
+        installed package in every repository.
+
+        Returns a list of (pkg, aur_pkg) tuples ordered by the name, `aur_pkg`
+        is the :class:`pyalpmm.item.AURPackageItem` with the same name or None
+
+        :param check_aur: if True, all foreign packages are looked up in the
+                          AUR with batched requests (optional)
+        """
+        names = self.get_foreign_names()
+        aur_pkgs = self.get_aur_packages(names) if check_aur else {}
+        return [(self.session.db_man.get_local_package(name),
+                 aur_pkgs.get(name)) for name in sorted(names)]
+
+    def get_foreign_names(self):
+        """The set of the names of all installed packages, which are not
+        inside any of the sync repositories, see :meth:`get_foreign_packages`
+        """
+        db_man = self.session.db_man
+        names = set(db_man["local"].package_index)
+        for tree in db_man.sync_dbs.keys():
+            # don't set up the AUR, if it is not asked
+            if tree != "aur":
+                names.difference_update(db_man.sync_dbs[tree].package_index)
+        return names
+
+    def get_aur_packages(self, names):
+        """Look up all `names` in the AUR with batched requests, returns a
+        dict mapping the names found to their
+        :class:`pyalpmm.item.AURPackageItem`, empty without AUR support
+
+        :param names: an iterable of package names
+        """
+        db_man = self.session.db_man
+        if "aur" not in db_man.sync_dbs:
+            return {}
+        return db_man.sync_dbs["aur"].get_package_map(names)
 
-        :param pkgname: the query which should be searched for"""
-        query = {"name": pkgname.lower(), "desc": pkgname.lower()}
-        return sorted(
-            self.session.db_man.search_sync_package(**query),
-            key=lambda p: (p.repo, p.name)
-        )
+    def search_packages(self, pkgname, regex=False, ranked=False):
+        """Search for a query/pkgname in the repositories. Behave like
+        pacman and also search inside the package descriptions. The search
+        is answered from the trigram index of each sync database.
+
+        :param pkgname: the query which should be searched for
+        :param regex: if True, `pkgname` is taken as a regular expression
+        :param ranked: if True, order the results by relevance (exact name,
+                       name prefix, part of the name, only in description)
+                       instead of repository and name
+        """
+        hits = []
+        for tree, db in self.session.db_man.sync_dbs.items():
+            for rank, pkg in db.search_text(pkgname, regex):
+                pkg.repo = tree
+                hits.append((rank, pkg))
+
+        if ranked:
+            key = lambda (rank, pkg): (rank, pkg.name, pkg.repo)
+        else:
+            key = lambda (rank, pkg): (pkg.repo, pkg.name)
+        return [pkg for rank, pkg in sorted(hits, key=key)]
 
     def get_package_files(self, pkgname):
         """Return a full list of all files inside a local package.
@@ -420,8 +605,18 @@ class System(object):
 
         :param filepath: the full and absolut path of the loner
         """
-        for pkg in self.get_local_packages():
-            if pkg.files and filepath in pkg.files:
-                return pkg
+        for pkgname in self.session.file_index.owners(filepath):
+            return self.session.db_man.get_local_package(pkgname)
+
+    def owners_of_directory(self, dirpath):
+        """Determine all packages which installed something below `dirpath`
+
+        :param dirpath: the full and absolut path of the directory
+        """
+        dirpath = dirpath.rstrip("/") + "/"
+        names = set(pkgname for path, pkgname in \
+                    self.session.file_index.find_prefix(dirpath))
+        db_man = self.session.db_man
+        return [db_man.get_local_package(name) for name in sorted(names)]
 
 
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+
+table.py
+-----------
+
+This module implements a columnar snapshot of a package cache. Instead of
+asking libalpm for every attribute of every package on each search, the
+searchable attributes are extracted once (see PackageList.extract()) into
+parallel columns:
+
+- interned names (plus a name -> row dict)
+- versions
+- the sizes and the install reasons, as NumPy arrays if NumPy is installed
+- all names and all descriptions concatenated into one string each ("blob")
+  together with the offset of each entry
+
+A search then runs batched over whole columns, a substring query on a blob is
+one str.find() per hit instead of one interpreted comparison per package.
+"""
+
+from bisect import bisect_right
+import operator as ops
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from item import PackageItem
+from lists import LazyList
+
+class TextColumn(object):
+    """All values of one string column joined into one blob, the entries are
+    separated by a NUL byte, which never occurs in a query
+
+    :param values: the list of (possibly None) strings
+    """
+    def __init__(self, values):
+        self.values = values
+        self.blob = "\0".join(v or "" for v in values) + "\0"
+        offsets, pos = [], 0
+        for value in values:
+            offsets.append(pos)
+            pos += len(value or "") + 1
+        self.offsets = numpy.array(offsets) if numpy is not None else offsets
+
+    def find(self, query):
+        """Return the sorted row numbers containing `query`"""
+        if not query:
+            return range(len(self.values))
+
+        blob, offsets, positions = self.blob, self.offsets, []
+        pos = blob.find(query)
+        while pos != -1:
+            positions.append(pos)
+            # skip the rest of this entry, one hit per row is enough
+            pos = blob.find(query, blob.find("\0", pos) + 1)
+
+        if numpy is not None:
+            return list(numpy.searchsorted(offsets, positions, "right") - 1)
+        return [bisect_right(offsets, pos) - 1 for pos in positions]
+
+    def equals(self, query):
+        """Return the sorted row numbers equal to `query`"""
+        return [i for i, value in enumerate(self.values) \
+                if (value or "") == query]
+
+class NumberColumn(object):
+    """A column of integers
+
+    :param values: the list of (possibly None) numbers
+    """
+    comparators = {"__eq": ops.eq, "__ne": ops.ne, "__lt": ops.lt,
+                   "__le": ops.le, "__gt": ops.gt, "__ge": ops.ge}
+
+    def __init__(self, values):
+        self.values = [v or 0 for v in values]
+        if numpy is not None:
+            self.values = numpy.array(self.values, dtype=numpy.int64)
+
+    def compare(self, ending, query):
+        """Return the sorted row numbers, which compare to `query` like
+        described by the search ending `ending`, i.e. "__lt" means: value < query
+        """
+        cmp = self.comparators[ending]
+        if numpy is not None:
+            return list(numpy.flatnonzero(cmp(self.values, query)))
+        return [i for i, value in enumerate(self.values) if cmp(value, query)]
+
+class PackageTable(object):
+    """The columnar snapshot of all packages inside a
+    :class:`pyalpmm.lists.PackageList`
+
+    :param pkglist: the :class:`pyalpmm.lists.PackageList` to take the
+                    snapshot from
+    """
+    text_columns = ["name", "version", "desc"]
+    number_columns = ["size", "isize", "reason"]
+    # the search endings find() supports for the text columns
+    text_endings = ("__in", "__eq", "__ne")
+
+    def __init__(self, pkglist):
+        fields = self.text_columns + self.number_columns
+        rows = pkglist.extract(fields)
+
+        self.fields = fields
+        self.raw = [row[0] for row in rows]
+        self.names = [intern(row[1]) for row in rows]
+        self.index = dict((name, i) for i, name in enumerate(self.names))
+        self.columns = {}
+        for pos, field in enumerate(fields):
+            values = [row[pos + 1] for row in rows]
+            self.columns[field] = TextColumn(values) \
+                if field in self.text_columns else NumberColumn(values)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _parse_key(self, key):
+        """Split the search key `key` into the column name and the ending"""
+        for ending in LazyList.search_endings:
+            if key.endswith(ending):
+                return key[:-len(ending)], ending
+        return key, "__in"
+
+    def can_search(self, kw):
+        """True, if the whole query `kw` can be answered by this table"""
+        for key in kw:
+            name, ending = self._parse_key(key)
+            if name not in self.columns:
+                return False
+            elif name in self.text_columns and ending not in self.text_endings:
+                return False
+        return True
+
+    def find(self, key, value):
+        """Return a sorted list of all row numbers matching one search
+        condition, i.e. key="desc__in" value="xterm"
+
+        :param key: the column name, maybe with a search ending attached
+        :param value: the value to compare against
+        """
+        name, ending = self._parse_key(key)
+        col = self.columns[name]
+        if isinstance(col, NumberColumn):
+            return col.compare("__eq" if ending == "__in" else ending, value)
+
+        if ending == "__in":
+            return col.find(value)
+        elif ending == "__eq":
+            if name == "name":
+                return [self.index[value]] if value in self.index else []
+            return col.equals(value)
+        elif ending == "__ne":
+            hits = set(self.find(name + "__eq", value))
+            return [i for i in xrange(len(self)) if i not in hits]
+        raise KeyError("The search ending {0} is not supported for the text "
+                       "column: {1}".format(ending, name))
+
+    def get_values(self, name, fields):
+        """Return a tuple with the values of the columns `fields` for the
+        package called `name`, None if there is no such package
+        """
+        row = self.index.get(name)
+        if row is None:
+            return None
+        values = []
+        for field in fields:
+            value = self.columns[field].values[row]
+            # no numpy integers for the callers
+            values.append(value if field in self.text_columns else int(value))
+        return tuple(values)
+
+    def get_item(self, row):
+        """Create the :class:`pyalpmm.item.PackageItem` for the row `row`"""
+        return PackageItem(self.raw[row], dict(
+            (field, self.columns[field].values[row]) \
+            for field in self.text_columns))
+
+    def search(self, **kw):
+        """Return all packages matching at least one of the conditions in `kw`
+        in the order of the package cache, just like PackageList.search()
+
+        :param kw: keyword arguments with the actual query,
+                   magic endings are supported
+        """
+        rows = set()
+        for key, value in kw.items():
+            rows.update(self.find(key, value))
+        return [self.get_item(row) for row in sorted(rows)]
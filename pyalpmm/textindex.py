@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+
+textindex.py
+------------
+
+This module implements a trigram index over the names and descriptions of the
+packages inside one sync database. A substring query is answered by
+intersecting the posting lists of all trigrams inside the query, only the
+remaining candidates are checked with a real substring test (or regular
+expression match).
+
+The index is persisted next to the sync database with marshal, stamped with
+the mtime of the database, so it is built only once per database update.
+"""
+
+import os
+import re
+import marshal
+import sre_parse
+import sre_constants
+from array import array
+
+def trigrams(text):
+    """Return the set of all trigrams inside `text`"""
+    return set(text[i:i+3] for i in xrange(len(text) - 2))
+
+def rank(query, name, in_name):
+    """Rank one hit, lower is better: exact name, name prefix, somewhere in
+    the name, only in the description
+
+    :param query: the lowercased query
+    :param name: the lowercased package name
+    :param in_name: True, if the query matched the name
+    """
+    if not in_name:
+        return 3
+    elif name == query:
+        return 0
+    elif name.startswith(query):
+        return 1
+    return 2
+
+def required_literals(pattern):
+    """Return the literal strings, every match of the regular expression
+    `pattern` must contain. Only top-level literal runs are taken, so
+    "foo.*bar" gives ["foo", "bar"] and "foo|bar" gives nothing.
+    """
+    out, cur = [], []
+    try:
+        parsed = sre_parse.parse(pattern)
+    except sre_constants.error as e:
+        return out
+    for op, arg in parsed:
+        if op == sre_constants.LITERAL:
+            cur.append(unichr(arg) if arg > 255 else chr(arg))
+            continue
+        if cur:
+            out.append("".join(cur))
+        cur = []
+    if cur:
+        out.append("".join(cur))
+    return out
+
+class TrigramIndex(object):
+    """The trigram index over the given packages
+
+    :param names: the package names
+    :param descs: the package descriptions (same order as `names`)
+    """
+    # bump this, if the persisted format changes
+    format_version = 1
+
+    def __init__(self, names, descs):
+        self.names = list(names)
+        self.lower_names = [name.lower() for name in self.names]
+        self.texts = [(name + "\n" + (desc or "")).lower() \
+                      for name, desc in zip(self.names, descs)]
+
+        postings = {}
+        for doc, text in enumerate(self.texts):
+            for gram in trigrams(text):
+                postings.setdefault(gram, array("I")).append(doc)
+        self.postings = postings
+
+    @classmethod
+    def load(cls, filename, stamp):
+        """Load the index from `filename`, returns None if it doesn't exist,
+        is broken or its stamp is not equal to `stamp`
+        """
+        try:
+            with open(filename, "rb") as fd:
+                data = marshal.load(fd)
+            version, file_stamp, names, texts, postings = data
+        except (IOError, EOFError, ValueError, TypeError) as e:
+            return None
+        if version != cls.format_version or file_stamp != stamp:
+            return None
+
+        obj = cls.__new__(cls)
+        obj.names, obj.texts = names, texts
+        obj.lower_names = [name.lower() for name in names]
+        # the posting lists are kept as strings until they are asked for
+        obj.postings = postings
+        return obj
+
+    def save(self, filename, stamp):
+        """Persist the index to `filename`, silently skipped if the file can't
+        be written (i.e. no root rights)
+        """
+        data = (self.format_version, stamp, self.names, self.texts,
+                dict((gram, self._get_posting(gram).tostring()) \
+                     for gram in self.postings))
+        try:
+            with open(filename + ".tmp", "wb") as fd:
+                marshal.dump(data, fd)
+            os.rename(filename + ".tmp", filename)
+        except (IOError, OSError) as e:
+            pass
+
+    def _get_posting(self, gram):
+        """Return the posting array for the trigram `gram`"""
+        posting = self.postings.get(gram)
+        if posting is None:
+            return array("I")
+        elif isinstance(posting, str):
+            posting = self.postings[gram] = array("I", posting)
+        return posting
+
+    def _candidates(self, literals):
+        """Return the sorted ids of all documents, which might contain all
+        strings in `literals`, or None if every document is a candidate
+        """
+        grams = set()
+        for literal in literals:
+            grams.update(trigrams(literal))
+        if not grams:
+            return None
+
+        postings = sorted((self._get_posting(gram) for gram in grams), key=len)
+        docs = set(postings[0])
+        for posting in postings[1:]:
+            if not docs:
+                break
+            docs.intersection_update(posting)
+        return sorted(docs)
+
+    def search(self, query, regex=False):
+        """Return a list of (rank, name) tuples for all packages matching
+        `query` in their name or description, ordered by rank and name. The
+        search is case-insensitive.
+
+        :param query: the substring to look for or a regular expression
+        :param regex: if True, `query` is a regular expression
+        """
+        if regex:
+            expr = re.compile(query, re.I | re.M)
+            docs = self._candidates(
+                [lit.lower() for lit in required_literals(query)])
+            matches = lambda text: expr.search(text) is not None
+        else:
+            query = query.lower()
+            docs = self._candidates([query])
+            matches = lambda text: query in text
+
+        out = []
+        for doc in (docs if docs is not None else xrange(len(self.names))):
+            if not matches(self.texts[doc]):
+                continue
+            name = self.lower_names[doc]
+            out.append((rank(query, name, matches(name)), self.names[doc]))
+        out.sort()
+        return out
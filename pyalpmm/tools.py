@@ -10,7 +10,12 @@ to fancy-fy some of the output made by mmacman/pyalpmm
 
 import time
 import sys, os
+import re
 import math
+import signal
+import struct
+import json
+from collections import OrderedDict
 from functools import update_wrapper
 from operator import le, lt, eq, ne, ge, gt
 import pyalpmm_raw as p
@@ -24,7 +29,10 @@ def CachedProperty(method):
     """
     name = method.__name__
     def _get(self):
-        return self.__dict__.setdefault(name, method(self))
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            return self.__dict__.setdefault(name, method(self))
     update_wrapper(_get, method)
 
     def _del(self):
@@ -32,6 +40,54 @@ def CachedProperty(method):
     return property(_get, None, _del)
 
 
+_terminal_width = None
+_sigwinch_installed = False
+
+def _install_sigwinch_handler():
+    """Forget the cached terminal width whenever the window is resized, a
+    SIGWINCH handler installed before keeps being called
+    """
+    global _sigwinch_installed
+    if _sigwinch_installed or not hasattr(signal, "SIGWINCH"):
+        return
+    previous = signal.getsignal(signal.SIGWINCH)
+    def handler(signum, frame):
+        global _terminal_width
+        _terminal_width = None
+        if callable(previous):
+            previous(signum, frame)
+    try:
+        signal.signal(signal.SIGWINCH, handler)
+        _sigwinch_installed = True
+    except ValueError as e:
+        # only possible from the main thread, until then the width just stays
+        pass
+
+def terminal_width():
+    """The width of the terminal in columns, asked once and then cached until
+    the next SIGWINCH. Falls back to $COLUMNS or 80, if stdout is no tty.
+    """
+    global _terminal_width
+    if _terminal_width is not None:
+        return _terminal_width
+
+    width = 0
+    try:
+        import fcntl, termios
+        rows, width = struct.unpack("hh", fcntl.ioctl(
+            sys.stdout.fileno(), termios.TIOCGWINSZ, "\0" * 4))
+    except (ImportError, AttributeError, IOError, ValueError) as e:
+        pass
+    if width <= 0:
+        try:
+            width = int(os.environ.get("COLUMNS", 80))
+        except ValueError as e:
+            width = 80
+
+    _install_sigwinch_handler()
+    _terminal_width = width
+    return width
+
 class ProgressBar(object):
     """This is a Quick-Shot on a ProgressBar to make `mmacman` a little
     more charming.
@@ -49,14 +105,15 @@ class ProgressBar(object):
     }
     prefix = "[i] "
     pad_right = 0
+    # the minimal number of seconds between two redraws
+    min_interval = 0.05
 
     def __init__(self, endvalue=None, label=None):
         self.endvalue = endvalue
         self.label = label or ""
         self.percent = 0
         self.tick = 0
-        self.last_step = time.time() - 20
-        self.last_sleep = 0.020
+        self.last_draw = 0
 
     def _get_bar(self, filled):
         """Return the :class:`ProgressBar` directly ready to write it on the
@@ -107,18 +164,17 @@ class ProgressBar(object):
 
     def step_to(self, value):
         """This is the method called from outside to feed the
-        :class:`ProgressBar` instance with new data. Also the process is sent
-        to sleep for some ms, but guess what: i don't think thats the right way
-        to lower the cputime needed by the process without sleep.
+        :class:`ProgressBar` instance with new data. It never blocks, instead
+        the bar is redrawn at most every `min_interval` seconds: in between
+        None is returned and there is nothing to write.
 
         :param value: the now reached value
         """
-        # dynamicly optimize the sleep duration for maximal speed
-        time.sleep(self.last_sleep)
-        self.last_sleep = int(self.last_sleep*0.5) \
-            if (time.time() - self.last_step < self.last_sleep*1.1) else \
-            int(self.last_sleep*1.3)
-        self.last_step = time.time()
+        now = time.time()
+        finished = self.endvalue and value >= self.endvalue
+        if now - self.last_draw < self.min_interval and not finished:
+            return None
+        self.last_draw = now
 
         if self.endvalue:
             self.percent = min((value / (self.endvalue/100.)), 100)
@@ -139,7 +195,7 @@ class ProgressBar(object):
     @property
     def max_width(self):
         """Maximum available width in this console window"""
-        return int(os.popen('stty size', 'r').read().split()[1]) - 3
+        return terminal_width() - 3
 
     @property
     def bar_width(self):
@@ -164,6 +220,52 @@ class ProgressBar(object):
                 if self.endvalue else 0)
 
 
+class RecordWriter(object):
+    """Write records in a machine readable format, one line per record and
+    straight to the file object, nothing is collected in between
+
+    - "jsonl": one JSON object per line
+    - "tsv": a header line with the field names, then tab-separated values
+      with backslash, tab and newline escaped as \\\\, \\t and \\n
+
+    :param fields: the list of field names of each record
+    :param format: one of `formats`
+    :param fd: the file object to write to (optional, default is sys.stdout)
+    """
+    formats = ("jsonl", "tsv")
+    _tsv_escapes = (("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"))
+
+    def __init__(self, fields, format, fd=None):
+        if format not in self.formats:
+            raise ValueError("Unknown output format: {0}".format(format))
+        self.fields = list(fields)
+        self.fd = fd or sys.stdout
+        if format == "tsv":
+            self.write = self._write_tsv
+            self.fd.write("\t".join(self.fields) + "\n")
+        else:
+            self.write = self._write_jsonl
+            self._encode = json.JSONEncoder().encode
+
+    def _write_jsonl(self, values):
+        """Write the record `values` (ordered like `fields`) as JSON"""
+        self.fd.write(self._encode(OrderedDict(zip(self.fields, values))))
+        self.fd.write("\n")
+
+    def _write_tsv(self, values):
+        """Write the record `values` (ordered like `fields`) as a TSV line"""
+        out = []
+        for value in values:
+            if value is None:
+                value = ""
+            elif not isinstance(value, basestring):
+                value = str(value)
+            for char, escaped in self._tsv_escapes:
+                if char in value:
+                    value = value.replace(char, escaped)
+            out.append(value)
+        self.fd.write("\t".join(out) + "\n")
+
 class AskUser(object):
     """Ask the user on the console - can be answered only with the given
     possibilities - save the valid, entered value in :attr:`self.answer`
@@ -270,25 +372,143 @@ class FancyPackage(FancyOutput):
         self.raw = pkg
         self.out = o
 
+# the classes of the character following a version part, see _compare_part
+_END, _SEP, _ALPHA, _DIGIT = range(4)
+_segment_re = re.compile(r"([^0-9A-Za-z]*)([0-9]+|[A-Za-z]+)")
+_epoch_re = re.compile(r"^([0-9]*):")
+
+def _parse_part(part):
+    """Split one part of a version (epoch, version or release) into its
+    segments, each one a (separator length, is numeric, length, text) tuple.
+    Numbers lose their leading zeros and alpha segments get the length 0, so
+    comparing these tuples (without the separator length) matches
+    rpmvercmp. Returns the segments and the length of the trailing separators.
+    """
+    segments, pos = [], 0
+    for match in _segment_re.finditer(part):
+        sep, seg = match.groups()
+        if seg[0].isdigit():
+            seg = seg.lstrip("0")
+            segments.append((len(sep), True, len(seg), seg))
+        else:
+            segments.append((len(sep), False, 0, seg))
+        pos = match.end()
+    return tuple(segments), len(part) - pos
+
+def parse_version(version):
+    """Parse `version` once into the key used by :func:`compare_versions`,
+    split like libalpm does: [epoch:]version[-release]
+
+    :param version: the version string, i.e. "1:2.3.4-1"
+    """
+    epoch, rest = "0", version
+    match = _epoch_re.match(version)
+    if match is not None:
+        epoch, rest = match.group(1) or "0", version[match.end():]
+    # like libalpm, the release starts after the last "-" behind the epoch
+    if "-" in rest:
+        rest, release = rest.rsplit("-", 1)
+        return _parse_part(epoch), _parse_part(rest), _parse_part(release)
+    return _parse_part(epoch), _parse_part(rest), None
+
+def _next_class(segments, i, trail, skip):
+    """The class of the character behind the first `i` segments, with `skip`
+    the separators in front of the next segment are skipped
+    """
+    if i < len(segments):
+        if segments[i][0] and not skip:
+            return _SEP
+        return _DIGIT if segments[i][1] else _ALPHA
+    return _SEP if trail and not skip else _END
+
+def _compare_part(a, b):
+    """rpmvercmp for two parts returned by :func:`_parse_part`"""
+    (segs1, trail1), (segs2, trail2) = a, b
+    n1, n2 = len(segs1), len(segs2)
+    i = 0
+    while True:
+        if not ((i < n1 or trail1) and (i < n2 or trail2)):
+            # one of them ended right behind the last compared segment
+            skip = False
+            break
+        if i >= n1 or i >= n2:
+            # one of them has only separators left
+            skip = True
+            break
+        seg1, seg2 = segs1[i], segs2[i]
+        if seg1 != seg2:
+            if seg1[0] != seg2[0]:
+                # separators of a different length
+                return -1 if seg1[0] < seg2[0] else 1
+            if seg1[1:] != seg2[1:]:
+                return -1 if seg1[1:] < seg2[1:] else 1
+        i += 1
+
+    next1 = _next_class(segs1, i, trail1, skip)
+    next2 = _next_class(segs2, i, trail2, skip)
+    if next1 == _END and next2 == _END:
+        return 0
+    # a remaining alpha segment never beats the end of the version
+    if (next1 == _END and next2 != _ALPHA) or next1 == _ALPHA:
+        return -1
+    return 1
+
+def compare_versions(a, b):
+    """Compare two keys returned by :func:`parse_version`, the result is the
+    same as the one of libalpm's alpm_pkg_vercmp() for the versions
+    """
+    for part1, part2 in zip(a[:2], b[:2]):
+        res = _compare_part(part1, part2)
+        if res != 0:
+            return res
+    if a[2] is not None and b[2] is not None:
+        return _compare_part(a[2], b[2])
+    return 0
+
+_alpm_vercmp = getattr(p, "alpm_pkg_vercmp", None)
+
+def vercmp(a, b):
+    """Compare the version strings `a` and `b` like pacman, returns -1, 0 or
+    1. Uses libalpm, if the bindings provide alpm_pkg_vercmp(), otherwise
+    the pure python implementation.
+
+    :param a: the first version
+    :param b: the second version
+    """
+    if _alpm_vercmp is not None:
+        res = _alpm_vercmp(a, b)
+        return (res > 0) - (res < 0)
+    if a == b:
+        return 0
+    return compare_versions(parse_version(a), parse_version(b))
+
 class FancyVersion(FancyOutput):
-    """Provide a convenient way to store and compare different version labels"""
+    """Provide a convenient way to store and compare different version labels.
+    The comparison is done by libalpm like :func:`vercmp`, only without it
+    the pure python implementation is used, then each version is parsed just
+    once, no matter how often it is compared (i.e. while sorting).
+    """
     def __init__(self, version):
-        self.raw = d = version
-        self.data = version.split(".") if "." in version else d
-        #d = sum([sub_version.split("-") for sub_version in d], [])
+        self.raw = self.out = version
 
-        self.out = self.raw
+    @CachedProperty
+    def key(self):
+        """The parsed version, see :func:`parse_version`"""
+        return parse_version(self.raw)
 
     def _general_compare(self, other, operator):
         if isinstance(other, str):
-            return operator(self.raw, other)
+            other = FancyVersion(other)
         elif not isinstance(other, FancyVersion):
             raise TypeError("You can only compare a FancyVersion "
                             "against another FancyVersion")
-        for i in range(min(len(other.data), len(self.data))):
-            if operator(self.data[i], other.data[i]):
-                return True
-        return False
+        if self.raw == other.raw:
+            return operator(0, 0)
+        if _alpm_vercmp is not None:
+            # the same comparison as everywhere else, i.e. in pkgbuild
+            return operator(vercmp(self.raw, other.raw), 0)
+        return operator(compare_versions(self.key, other.key), 0)
+
     def __lt__(self, other):
         return self._general_compare(other, lt)
     def __le__(self, other):
@@ -298,16 +518,12 @@ class FancyVersion(FancyOutput):
     def __ge__(self, other):
         return self._general_compare(other, ge)
     def __ne__(self, other):
-        return not self.__eq__(other)
+        return self._general_compare(other, ne)
     def __eq__(self, other):
-        if isinstance(other, str):
-            return self.raw == other
-        elif not isinstance(other, FancyVersion):
-            raise TypeError("You can only compare a FancyVersion "
-                            "against another FancyVersion")
-        if self.raw == other.raw:
-            return True
-        return False
+        return self._general_compare(other, eq)
+    def __hash__(self):
+        # equal versions may differ in a missing release only
+        return hash((self.key[0], self.key[1]))
 
 
 class CriticalError(Exception):
@@ -88,14 +88,14 @@ class Transaction(object):
         if self.session.config.rights != "root":
             raise TransactionError(
                 "You must be root to initialize a transaction")
+        # libalpm takes the registration order as priority, so set up all
+        # deferred databases before the transaction needs them
+        self.session.db_man.load_all()
 
         # set callbacks for download and totaldownload
         p.alpm_option_set_dlcb(self.__callback_download_progress)
         p.alpm_option_set_totaldlcb(self.__callback_download_total_progress)
 
-        # this one to set alernative downloader
-        #p.alpm_cb_fetch(const char *url, const char *localpath, int force)
-
         # init transaction, including the rest of the callbacks
         if p.alpm_trans_init(
             self.session.config.transaction_flags,
@@ -160,16 +160,22 @@ class Transaction(object):
         elif event == p.PM_TRANS_EVT_ADD_START:
             self.events.StartInstallingPackage(pkg=PackageItem(data1))
         elif event == p.PM_TRANS_EVT_ADD_DONE:
-            self.events.DoneInstallingPackage(pkg=PackageItem(data1))
+            pkg = PackageItem(data1)
+            self.session.file_index.add_package(pkg)
+            self.events.DoneInstallingPackage(pkg=pkg)
         elif event == p.PM_TRANS_EVT_REMOVE_START:
             self.events.StartRemovingPackage(pkg=PackageItem(data1))
         elif event == p.PM_TRANS_EVT_REMOVE_DONE:
-            self.events.DoneRemovingPackage(pkg=PackageItem(data1))
+            pkg = PackageItem(data1)
+            self.session.file_index.remove_package(pkg.name)
+            self.events.DoneRemovingPackage(pkg=pkg)
         elif event == p.PM_TRANS_EVT_UPGRADE_START:
             self.events.StartUpgradingPackage(pkg=PackageItem(data1))
         elif event == p.PM_TRANS_EVT_UPGRADE_DONE:
-            self.events.DoneUpgradingPackage(
-                pkg=PackageItem(data1), from_pkg=PackageItem(data2))
+            pkg, from_pkg = PackageItem(data1), PackageItem(data2)
+            self.session.file_index.remove_package(from_pkg.name)
+            self.session.file_index.add_package(pkg)
+            self.events.DoneUpgradingPackage(pkg=pkg, from_pkg=from_pkg)
         elif event == p.PM_TRANS_EVT_INTEGRITY_START:
             self.events.StartCheckingPackageIntegrity()
         elif event == p.PM_TRANS_EVT_RETRIEVE_START:
@@ -267,11 +273,53 @@ class Transaction(object):
         if len(self.targets["add"]) + len(self.targets["remove"]) == 0:
             raise NothingToBeDoneError("Nothing to be done...")
 
-        if p.alpm_trans_commit(self.__backend_data) == -1:
-            self.handle_error(p.get_errno())
+        # only an up to date file index is updated while committing
+        self.session.file_index.check()
+
+        fetching = self.prefetch_packages()
+        try:
+            if p.alpm_trans_commit(self.__backend_data) == -1:
+                self.handle_error(p.get_errno())
+        finally:
+            if fetching:
+                p.alpm_option_set_fetchcb(None)
+
+        # the local package cache was changed, drop what was built from it
+        db_man = self.session.db_man
+        db_man.reset_caches(repos=db_man.local_dbs.keys())
 
         self.events.DoneTransactionCommit()
 
+    def prefetch_packages(self):
+        """Download all packages to be installed, which are not inside a cache
+        directory yet, concurrently into the first writable one. libalpm
+        finds them there while committing, anything left is downloaded
+        through the :class:`pyalpmm.download.Downloader` fetch callback.
+        Returns True, if the fetch callback was set.
+        """
+        downloader = self.session.db_man.downloader
+        if downloader is None or self.trans_type not in ("sync", "sysupgrade"):
+            return False
+
+        cachedirs = self.session.config.cachedirs
+        writable = [d for d in cachedirs if os.access(d, os.W_OK)]
+        jobs, pkgs = [], []
+        for pkg in self.targets["add"]:
+            fn = pkg.filename
+            if not writable or \
+               any(os.path.exists(os.path.join(d, fn)) for d in cachedirs):
+                continue
+            db = self.session.db_man[
+                p.alpm_db_get_name(p.alpm_pkg_get_db(pkg.raw_data))]
+            if getattr(db, "urls", None):
+                jobs.append((db.file_urls(fn), writable[0], int(pkg.size.raw)))
+                pkgs.append(pkg)
+
+        if jobs:
+            downloader.prefetch(jobs, pkgs)
+        p.alpm_option_set_fetchcb(downloader.fetch)
+        return True
+
     def handle_error(self, errno):
         """Handle specific error types, if errno is unknown - show errno and
         alpm_strerror
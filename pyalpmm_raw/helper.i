@@ -1,3 +1,79 @@
+%{
+
+/* the pmpkg_t fields known to helper_pkglist_extract() */
+static const char *helper_pkg_fields[] = {
+    "name", "version", "desc", "url", "arch", "packager", "md5sum",
+    "filename", "size", "isize", "builddate", "installdate", "reason", NULL
+};
+
+static int helper_pkg_field_id(const char *name){
+    int i;
+    for(i=0; helper_pkg_fields[i] != NULL; ++i){
+        if(strcmp(helper_pkg_fields[i], name) == 0)
+            return i;
+    }
+    return -1;
+}
+
+static PyObject *helper_pkg_field(pmpkg_t *pkg, int field){
+    const char *str = NULL;
+
+    switch(field) {
+        case 0: str = alpm_pkg_get_name(pkg); break;
+        case 1: str = alpm_pkg_get_version(pkg); break;
+        case 2: str = alpm_pkg_get_desc(pkg); break;
+        case 3: str = alpm_pkg_get_url(pkg); break;
+        case 4: str = alpm_pkg_get_arch(pkg); break;
+        case 5: str = alpm_pkg_get_packager(pkg); break;
+        case 6: str = alpm_pkg_get_md5sum(pkg); break;
+        case 7: str = alpm_pkg_get_filename(pkg); break;
+        case 8: return PyLong_FromLong((long) alpm_pkg_get_size(pkg));
+        case 9: return PyLong_FromLong((long) alpm_pkg_get_isize(pkg));
+        case 10: return PyLong_FromLong((long) alpm_pkg_get_builddate(pkg));
+        case 11: return PyLong_FromLong((long) alpm_pkg_get_installdate(pkg));
+        case 12: return PyInt_FromLong((long) alpm_pkg_get_reason(pkg));
+    }
+    if(str == NULL) {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+    return PyString_FromString(str);
+}
+
+/* Fill 'ids' with the field ids of the names inside the 'fields' list,
+ * returns the number of fields or -1 with a Python exception set */
+static int helper_pkg_field_ids(PyObject *fields, int *ids) {
+    int i, nfields;
+    const char *name;
+
+    nfields = PyList_Size(fields);
+    if(nfields < 0 || nfields > 32) {
+        PyErr_SetString(PyExc_ValueError, "Need a list of up to 32 fields");
+        return -1;
+    }
+    for(i=0; i<nfields; ++i){
+        name = PyString_AsString(PyList_GetItem(fields, i));
+        ids[i] = name ? helper_pkg_field_id(name) : -1;
+        if(ids[i] == -1) {
+            PyErr_SetString(PyExc_KeyError, "Unknown package field");
+            return -1;
+        }
+    }
+    return nfields;
+}
+
+/* The row for one package: (pmpkg_t, field_1, field_2, ...) */
+static PyObject *helper_pkg_row(pmpkg_t *pkg, int *ids, int nfields) {
+    int i;
+    PyObject *row = PyTuple_New(nfields + 1);
+    PyTuple_SET_ITEM(row, 0, SWIG_NewPointerObj(SWIG_as_voidptr(pkg), SWIGTYPE_p___pmpkg_t, 0));
+    for(i=0; i<nfields; ++i)
+        PyTuple_SET_ITEM(row, i + 1, helper_pkg_field(pkg, ids[i]));
+    return row;
+}
+
+%}
+
 %inline %{
 
 
@@ -58,5 +134,35 @@ int get_errno(){
     return (int) pm_errno;
 }
 
+/* Walk the whole alpm_list_t of pmpkg_t and return a list of tuples, one
+ * for each package: (pmpkg_t, field_1, field_2, ...) with the fields named
+ * by the strings inside the 'fields' list, see helper_pkg_fields */
+PyObject *helper_pkglist_extract(alpm_list_t *list, PyObject *fields) {
+    int nfields, ids[32];
+    alpm_list_t *cur;
+    PyObject *out, *row;
+
+    if((nfields = helper_pkg_field_ids(fields, ids)) == -1)
+        return NULL;
+
+    out = PyList_New(0);
+    for(cur = alpm_list_first(list); cur; cur = alpm_list_next(cur)){
+        row = helper_pkg_row((pmpkg_t*) alpm_list_getdata(cur), ids, nfields);
+        PyList_Append(out, row);
+        Py_DECREF(row);
+    }
+    return out;
+}
+
+/* Like helper_pkglist_extract(), but only the row of the package inside the
+ * list item 'cur', for walking a list without building all rows at once */
+PyObject *helper_pkglist_extract_one(alpm_list_t *cur, PyObject *fields) {
+    int nfields, ids[32];
+
+    if((nfields = helper_pkg_field_ids(fields, ids)) == -1)
+        return NULL;
+    return helper_pkg_row((pmpkg_t*) alpm_list_getdata(cur), ids, nfields);
+}
+
 
 %}
@@ -12,6 +12,7 @@ static PyObject *py_cb_conv = NULL;
 static PyObject *py_cb_progress = NULL;
 static PyObject *py_cb_dl_progress = NULL;
 static PyObject *py_cb_dl_total_progress = NULL;
+static PyObject *py_cb_fetch = NULL;
 
 void cb_python_event_wrap(pmtransevt_t event, void *data1, void *data2){
 	PyObject *arglist = NULL;
@@ -105,6 +106,22 @@ void cb_python_dl_progress_wrap(const char *filename, off_t file_xfered, off_t f
 	Py_DECREF(arglist);
 }
 
+int cb_python_fetch_wrap(const char *url, const char *localpath, int force){
+	PyObject *arglist = NULL;
+	PyObject *result = NULL;
+	int ret = -1;
+	arglist = Py_BuildValue("(s,s,i)", url, localpath, force);
+	result = PyEval_CallObject(py_cb_fetch, arglist);
+	Py_DECREF(arglist);
+	if (result) {
+		ret = (int) PyInt_AsLong(result);
+		Py_DECREF(result);
+	} else {
+		PyErr_Print();
+	}
+	return ret;
+}
+
 %}
 
 /*************************************************************/
@@ -170,6 +187,24 @@ void cb_python_dl_progress_wrap(const char *filename, off_t file_xfered, off_t f
     $1 = cb_python_dl_total_progress_wrap;
 }
 
+%typemap(in) alpm_cb_fetch cb (const char *url, const char *localpath, int force) {
+    if ($input == Py_None) {
+        /* passing None switches back to the internal downloader */
+        Py_XDECREF(py_cb_fetch);
+        py_cb_fetch = NULL;
+        $1 = NULL;
+    } else {
+        if (!PyCallable_Check($input)) {
+		PyErr_SetString(PyExc_TypeError, "Need a callable object!");
+		$1 = NULL;
+        }
+        Py_XINCREF($input);
+        Py_XDECREF(py_cb_fetch);
+        py_cb_fetch = $input;
+        $1 = cb_python_fetch_wrap;
+    }
+}
+
 %include "alpm_list.h"
 %include "alpm.h"
 
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+
+helpers.py
+----------
+
+Shared stand-ins for the tests: a local HTTP server answering with canned
+replies, a config object with just the needed attributes and an events
+object recording what was emitted.
+
+The tests import pyalpmm from the source tree, so the pyalpmm_raw bindings
+have to be built before (``make build``).
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import BaseHTTPServer
+import SocketServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        headers = dict((k.lower(), v) for k, v in self.headers.items())
+        self.server.requests.append((self.path, headers))
+        status, reply_headers, body = self.server.respond(self.path, headers)
+        self.send_response(status)
+        for key, value in reply_headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """A HTTP server on localhost, every GET request is answered by
+    `respond(path, headers)`, which returns (status, headers, body). All
+    requests are kept in `requests` as (path, lowercased headers) tuples.
+
+    :param respond: the callable answering the requests
+    """
+    daemon_threads = True
+
+    def __init__(self, respond):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), _Handler)
+        self.respond = respond
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.05, ))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def handle_error(self, request, client_address):
+        # i.e. a client closing a kept-alive connection
+        pass
+
+    def url(self, path=""):
+        return "http://127.0.0.1:{0}/{1}".format(self.server_port, path)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def unused_url(path=""):
+    """An url on localhost, nobody listens on"""
+    server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), _Handler)
+    port = server.server_port
+    server.server_close()
+    return "http://127.0.0.1:{0}/{1}".format(port, path)
+
+class RecordingEvents(object):
+    """Records every emitted event as (name, kwargs) inside `emitted`"""
+    def __init__(self):
+        self.emitted = []
+
+    def __getattr__(self, name):
+        return lambda **kw: self.emitted.append((name, kw))
+
+    def names(self):
+        return [name for name, kw in self.emitted]
+
+class Config(object):
+    """Holds just the attributes given as keyword arguments"""
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+class TempDirTestCase(unittest.TestCase):
+    """Provides a fresh temporary directory as `self.dir`"""
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="pyalpmm-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def path(self, *parts):
+        return os.path.join(self.dir, *parts)
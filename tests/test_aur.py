@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+
+test_aur.py
+-----------
+
+Tests for :class:`pyalpmm.aur.AURClient` against a local HTTP stand-in for
+the AUR RPC interface.
+"""
+
+import json
+import time
+import urlparse
+import unittest
+
+from helpers import StubServer, Config, TempDirTestCase, unused_url
+from pyalpmm.aur import AURClient
+
+# the packages the stand-in AUR knows
+KNOWN = set(["pkg{0}".format(i) for i in xrange(0, 300, 2)])
+
+class AURClientTest(TempDirTestCase):
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.server = StubServer(self.respond)
+
+    def tearDown(self):
+        self.server.stop()
+        TempDirTestCase.tearDown(self)
+
+    def respond(self, path, headers):
+        query = urlparse.parse_qs(urlparse.urlsplit(path).query)
+        if query["type"] == ["multiinfo"]:
+            results = [{"Name": name, "Version": "1.0-1"} \
+                       for name in query.get("arg[]", []) if name in KNOWN]
+            reply = {"type": "multiinfo", "results": results}
+        elif query["type"] == ["search"]:
+            results = [{"Name": name, "Version": "1.0-1"} \
+                       for name in sorted(KNOWN) if query["arg"][0] in name]
+            reply = {"type": "search", "results": results[:3]}
+        else:
+            reply = {"type": "error", "results": "Incorrect request type"}
+        return 200, {"Content-Type": "application/json"}, json.dumps(reply)
+
+    def client(self, url=None, ttl=3600):
+        return AURClient(Config(
+            aur_url=url or self.server.url(), aur_rpc_ttl=ttl,
+            aur_rpc_cache=self.path("aur.cache"),
+            rpc_command="rpc.php?type=%(type)s&arg=%(arg)s",
+            rpc_multi_command="rpc.php?type=multiinfo%(args)s"))
+
+    def asked_names(self):
+        return [urlparse.parse_qs(urlparse.urlsplit(path).query)["arg[]"] \
+                for path, headers in self.server.requests]
+
+    def test_names_are_batched(self):
+        names = ["pkg{0}".format(i) for i in xrange(250)]
+        found = self.client().info(names)
+        self.assertEqual(sorted(found), sorted(KNOWN.intersection(names)))
+        self.assertEqual(found["pkg2"]["Version"], "1.0-1")
+        self.assertEqual([len(batch) for batch in self.asked_names()],
+                         [100, 100, 50])
+
+    def test_unknown_names_are_cached(self):
+        client = self.client()
+        self.assertEqual(client.info(["pkg1", "pkg2"]).keys(), ["pkg2"])
+        self.assertEqual(client.info(["pkg1", "pkg2"]).keys(), ["pkg2"])
+        # a new client reads the cache from disk
+        self.assertEqual(self.client().info(["pkg1"]), {})
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_only_missing_names_are_asked(self):
+        client = self.client()
+        client.info(["pkg1", "pkg2"])
+        client.info(["pkg1", "pkg2", "pkg4"])
+        self.assertEqual(self.asked_names(), [["pkg1", "pkg2"], ["pkg4"]])
+
+    def test_expired_entries_are_asked_again(self):
+        self.client(ttl=1).info(["pkg2"])
+        time.sleep(1.1)
+        self.assertEqual(self.client(ttl=1).info(["pkg2"]).keys(), ["pkg2"])
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_unreachable_aur_is_not_cached(self):
+        client = self.client(url=unused_url())
+        self.assertEqual(client.info(["pkg1", "pkg2"]), {})
+        self.assertEqual(client.search("pkg"), [])
+        self.assertEqual(client.cache["info"], {})
+
+        client.config.aur_url = self.server.url()
+        self.assertEqual(client.info(["pkg1", "pkg2"]).keys(), ["pkg2"])
+        self.assertEqual(len(client.search("pkg")), 3)
+
+    def test_search_is_cached(self):
+        client = self.client()
+        self.assertEqual([res["Name"] for res in client.search("pkg1")],
+                         ["pkg10", "pkg100", "pkg102"])
+        client.search("pkg1")
+        self.assertEqual(len(self.server.requests), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+
+test_daemon.py
+--------------
+
+Tests for the connection handling, the errors and the database signature
+of :mod:`pyalpmm.daemon`, the session is left out.
+"""
+
+import os
+import re
+import threading
+
+import helpers
+from pyalpmm.daemon import QueryDaemon, QueryClient, DaemonError, \
+     _ThreadingServer, _RequestHandler
+
+class EchoDaemon(QueryDaemon):
+    """Without a session, answers 'echo' queries"""
+    def reload(self):
+        pass
+
+    def check(self):
+        pass
+
+    def query_echo(self, text):
+        return text
+
+    def query_regex(self, expr):
+        return re.compile(expr).pattern
+
+class ConnectionTest(helpers.TempDirTestCase):
+    def setUp(self):
+        super(ConnectionTest, self).setUp()
+        self.socket_path = self.path("daemon.sock")
+        self.daemon = EchoDaemon(helpers.Config(), self.socket_path)
+        self.server = _ThreadingServer(self.socket_path, _RequestHandler)
+        self.server.daemon = self.daemon
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.05, ))
+        self.thread.daemon = True
+        self.thread.start()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        super(ConnectionTest, self).tearDown()
+
+    def client(self):
+        client = QueryClient(self.socket_path, timeout=5)
+        self.clients.append(client)
+        return client
+
+    def test_idle_client_blocks_nobody(self):
+        idle = self.client()
+        self.assertEqual(idle.query("echo", text="first"), "first")
+        # idle keeps its connection open, the next one is answered anyway
+        self.assertEqual(self.client().query("echo", text="second"), "second")
+        self.assertEqual(idle.query("echo", text="third"), "third")
+
+    def test_errors_are_answered(self):
+        client = self.client()
+        try:
+            client.query("regex", expr="(unbalanced")
+        except DaemonError as e:
+            self.assertTrue(str(e).startswith("error: "), str(e))
+        else:
+            self.fail("no DaemonError raised")
+        # the same connection keeps working
+        self.assertEqual(client.query("regex", expr="x+"), "x+")
+
+    def test_requests_are_serialized(self):
+        self.daemon.lock.acquire()
+        replies = []
+        thread = threading.Thread(
+            target=lambda: replies.append(self.client().query("echo", text="x")))
+        thread.start()
+        thread.join(0.2)
+        self.assertEqual(replies, [])
+        self.daemon.lock.release()
+        thread.join(5)
+        self.assertEqual(replies, ["x"])
+
+class SignatureTest(helpers.TempDirTestCase):
+    def setUp(self):
+        super(SignatureTest, self).setUp()
+        for path in ("local", "sync/core"):
+            os.makedirs(self.path("db", path))
+        self.daemon = EchoDaemon(helpers.Config(local_db_path=self.path("db")),
+                                 self.path("daemon.sock"))
+
+    def test_search_index_is_ignored(self):
+        before = self.daemon._db_signature()
+        open(self.path("db", "sync", "core.trgm.tmp"), "w").close()
+        os.rename(self.path("db", "sync", "core.trgm.tmp"),
+                  self.path("db", "sync", "core.trgm"))
+        os.utime(self.path("db", "sync"), (1, 1))
+        self.assertEqual(self.daemon._db_signature(), before)
+
+    def test_database_changes_are_seen(self):
+        before = self.daemon._db_signature()
+        os.utime(self.path("db", "sync", "core"), (1, 1))
+        self.assertNotEqual(self.daemon._db_signature(), before)
+
+        before = self.daemon._db_signature()
+        os.makedirs(self.path("db", "sync", "extra"))
+        self.assertNotEqual(self.daemon._db_signature(), before)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+
+test_download.py
+----------------
+
+Tests for :mod:`pyalpmm.download` against a local HTTP stand-in for the
+mirrors.
+"""
+
+import os
+import unittest
+
+from helpers import StubServer, RecordingEvents, Config, TempDirTestCase, \
+     unused_url
+from pyalpmm.download import Downloader, FETCH_OK, FETCH_UP_TO_DATE, \
+     FETCH_FAILED
+
+class DownloaderTestCase(TempDirTestCase):
+    """Serves `files` (path -> body) with an ETag per file"""
+    files = {"core.db": "c" * 5000, "extra.db": "e" * 7000}
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.server = StubServer(self.respond)
+        self.events = RecordingEvents()
+        os.mkdir(self.path("sync"))
+
+    def tearDown(self):
+        self.server.stop()
+        TempDirTestCase.tearDown(self)
+
+    def respond(self, path, headers):
+        body = self.files.get(path.lstrip("/"))
+        if body is None:
+            return 404, {}, ""
+        etag = '"{0}"'.format(len(body))
+        if headers.get("if-none-match") == etag:
+            return 304, {"ETag": etag}, ""
+        return 200, {"ETag": etag}, body
+
+    def downloader(self):
+        return Downloader(Config(
+            events=self.events, download_workers=4, download_timeout=5,
+            download_per_mirror=2, download_state=self.path("state"),
+            mirror_cache=self.path("mirrors"), mirror_ttl=3600,
+            mirror_spread=2))
+
+    def read(self, fn):
+        with open(self.path("sync", fn), "rb") as fd:
+            return fd.read()
+
+class FetchCallbackTest(DownloaderTestCase):
+    def test_staged_files_are_moved(self):
+        d = self.downloader()
+        urls = [self.server.url(fn) for fn in sorted(self.files)]
+        d.stage([[url] for url in urls], self.path("sync"))
+        self.assertEqual(len(self.server.requests), 2)
+
+        for url, fn in zip(urls, sorted(self.files)):
+            self.assertEqual(d.fetch(url, self.path("sync"), 0), FETCH_OK)
+            self.assertEqual(self.read(fn), self.files[fn])
+        # nothing was requested again
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.events.names().count("ProgressDownload"), 2)
+        d.clear()
+
+    def test_unstaged_file_is_downloaded(self):
+        d = self.downloader()
+        url = self.server.url("core.db")
+        self.assertEqual(d.fetch(url, self.path("sync"), 0), FETCH_OK)
+        self.assertEqual(self.read("core.db"), self.files["core.db"])
+
+    def test_dead_mirror_is_skipped(self):
+        d = self.downloader()
+        dead, good = unused_url("core.db"), self.server.url("core.db")
+        d.stage([[dead, good]], self.path("sync"))
+        self.assertEqual(d.fetch(dead, self.path("sync"), 0), FETCH_OK)
+        self.assertEqual(self.read("core.db"), self.files["core.db"])
+        # libalpm's own retry on the dead mirror fails right away
+        self.assertFalse(d.mirrors.alive(dead))
+        d.clear()
+
+    def test_missing_file_fails(self):
+        d = self.downloader()
+        url = self.server.url("community.db")
+        self.assertEqual(d.fetch(url, self.path("sync"), 0), FETCH_FAILED)
+
+class ConditionalTest(DownloaderTestCase):
+    def test_unchanged_file_is_not_transfered(self):
+        d = self.downloader()
+        url = self.server.url("core.db")
+        self.assertEqual(d.fetch(url, self.path("sync"), 0), FETCH_OK)
+        self.assertEqual(d.fetch(url, self.path("sync"), 0), FETCH_UP_TO_DATE)
+        path, headers = self.server.requests[-1]
+        self.assertEqual(headers.get("if-none-match"), '"5000"')
+        self.assertEqual(self.read("core.db"), self.files["core.db"])
+
+    def test_validators_survive_a_restart(self):
+        url = self.server.url("core.db")
+        self.downloader().stage([[url]], self.path("sync"))
+        os.rename(self.path("state"), self.path("state.old"))
+        d = self.downloader()
+        self.assertEqual(d.fetch(url, self.path("sync"), 0), FETCH_OK)
+
+        os.rename(self.path("state.old"), self.path("state"))
+        d = self.downloader()
+        self.assertEqual(d.fetch(url, self.path("sync"), 0), FETCH_UP_TO_DATE)
+
+class ResumeTest(DownloaderTestCase):
+    """The file changed from "v1" to "v2", the server supports ranges"""
+    body = "".join(chr(i % 251) for i in xrange(20000))
+    etag = '"v2"'
+    # added to the start of the returned range
+    range_error = 0
+
+    def respond(self, path, headers):
+        body = self.body
+        rng, if_range = headers.get("range"), headers.get("if-range")
+        if rng and if_range == self.etag:
+            start = int(rng.split("=")[1].rstrip("-")) + self.range_error
+            return 206, {"ETag": self.etag, "Content-Range":
+                         "bytes {0}-{1}/{2}".format(start, len(body) - 1,
+                                                    len(body))}, body[start:]
+        return 200, {"ETag": self.etag}, body
+
+    def prepare(self, validator, size=3000):
+        """An old local copy, the validators of the old file and a partial
+        file started with `validator`
+        """
+        with open(self.path("sync", "core.db"), "wb") as fd:
+            fd.write("old")
+        with open(self.path("sync", "core.db.part"), "wb") as fd:
+            fd.write(self.body[:size])
+        with open(self.path("sync", "core.db.part.validator"), "wb") as fd:
+            fd.write(validator)
+        d = self.downloader()
+        d.state["urls"][self.server.url("core.db")] = {
+            "etag": '"v1"', "modified": None, "size": 3}
+        return d
+
+    def fetch(self, d):
+        return d.fetch(self.server.url("core.db"), self.path("sync"), 0)
+
+    def test_resume_uses_the_validator_of_the_partial_file(self):
+        d = self.prepare(self.etag)
+        self.assertEqual(self.fetch(d), FETCH_OK)
+        path, headers = self.server.requests[-1]
+        self.assertEqual(headers.get("range"), "bytes=3000-")
+        self.assertEqual(headers.get("if-range"), self.etag)
+        self.assertEqual(self.read("core.db"), self.body)
+        self.assertEqual(d.stats["transfered"], len(self.body) - 3000)
+        self.assertEqual(os.listdir(self.path("sync")), ["core.db"])
+
+    def test_partial_file_of_another_version_is_replaced(self):
+        d = self.prepare('"v0"')
+        self.assertEqual(self.fetch(d), FETCH_OK)
+        self.assertEqual(self.read("core.db"), self.body)
+        self.assertEqual(d.stats["transfered"], len(self.body))
+
+    def test_unexpected_range_starts_over(self):
+        self.range_error = 100
+        d = self.prepare(self.etag)
+        self.assertEqual(self.fetch(d), FETCH_OK)
+        self.assertEqual(self.read("core.db"), self.body)
+        # the second request asked for the whole file
+        path, headers = self.server.requests[-1]
+        self.assertEqual(headers.get("range"), None)
+
+    def test_started_transfer_keeps_its_validator(self):
+        d = self.downloader()
+        partial = self.path("sync", "core.db.part")
+        # moving to the target fails, so the transfer counts as interrupted
+        ret = d._download(self.server.url("core.db"),
+                          self.path("missing", "core.db"), partial=partial)
+        self.assertEqual(ret[0], FETCH_FAILED)
+        with open(partial + ".validator", "rb") as fd:
+            self.assertEqual(fd.read(), self.etag)
+
+class PrefetchTest(DownloaderTestCase):
+    def test_packages_are_downloaded(self):
+        d = self.downloader()
+        jobs = [([self.server.url(fn)], self.path("sync"), len(body)) \
+                for fn, body in self.files.items()]
+        out = d.prefetch(jobs)
+        self.assertEqual(out, dict((fn, FETCH_OK) for fn in self.files))
+        for fn in self.files:
+            self.assertEqual(self.read(fn), self.files[fn])
+        self.assertEqual(self.events.names().count("ProgressDownload"), 2)
+
+    def test_crashing_job_fails_instead_of_hanging(self):
+        d = self.downloader()
+        def crash(*args, **kw):
+            raise OSError("crashed")
+        d._download = crash
+        jobs = [([self.server.url("core.db")], self.path("sync"), 5000),
+                ([], self.path("sync"), 0)]
+        self.assertEqual(d.prefetch(jobs), {"core.db": FETCH_FAILED})
+
+if __name__ == "__main__":
+    unittest.main()
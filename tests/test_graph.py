@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+
+test_graph.py
+-------------
+
+Tests for the orphan detection of :class:`pyalpmm.graph.PackageGraph` and
+the graph over the sync repositories of :class:`pyalpmm.session.System`.
+"""
+
+import unittest
+from collections import OrderedDict
+
+import helpers
+import pyalpmm_raw as p
+from pyalpmm.graph import PackageGraph
+from pyalpmm.database import DatabaseManager, AbstractDatabase
+from pyalpmm.session import System
+
+class Reason(object):
+    def __init__(self, raw):
+        self.raw = raw
+
+class Dependency(object):
+    def __init__(self, name):
+        self.name = name
+
+class Package(object):
+    """Just the attributes the graph looks at"""
+    def __init__(self, name, explicit=False, depends=(), provides=()):
+        self.name = name
+        self.reason = Reason(p.PM_PKG_REASON_EXPLICIT if explicit \
+                             else p.PM_PKG_REASON_DEPEND)
+        self.depends = [Dependency(dep) for dep in depends]
+        self.provides, self.replaces = list(provides), []
+
+def graph(*packages):
+    return PackageGraph(packages)
+
+class OrphanTest(unittest.TestCase):
+    def test_transitive_chain(self):
+        g = graph(Package("app", True, ["liba"]),
+                  Package("liba", depends=["libb"]),
+                  Package("libb"),
+                  # nobody needs old, so its whole chain goes
+                  Package("old", depends=["libc"]),
+                  Package("libc", depends=["libd"]),
+                  Package("libd"))
+        self.assertEqual(sorted(g.orphans()), ["libc", "libd", "old"])
+        # only the direct leaf without transitive
+        self.assertEqual(g.unneeded(), ["old"])
+
+    def test_cycle(self):
+        g = graph(Package("app", True),
+                  Package("cyc1", depends=["cyc2"]),
+                  Package("cyc2", depends=["cyc1"]))
+        # both are required by each other, still nobody wants them
+        self.assertEqual(g.unneeded(), [])
+        self.assertEqual(sorted(g.orphans()), ["cyc1", "cyc2"])
+
+    def test_reachable_cycle_is_kept(self):
+        g = graph(Package("app", True, ["cyc1"]),
+                  Package("cyc1", depends=["cyc2"]),
+                  Package("cyc2", depends=["cyc1"]))
+        self.assertEqual(g.orphans(), [])
+
+    def test_provides(self):
+        g = graph(Package("app", True, ["sh"]),
+                  Package("bash", provides=["sh=4.1"]),
+                  Package("zsh"))
+        self.assertEqual(g.orphans(), ["zsh"])
+
+    def test_explicit_packages_are_never_orphans(self):
+        g = graph(Package("tool", True), Package("other", True, ["tool"]))
+        self.assertEqual(g.orphans(), [])
+
+class ListDatabase(AbstractDatabase):
+    """A database holding the given packages"""
+    def __init__(self, *packages):
+        self.packages = packages
+
+    def get_packages(self, prefetch=None):
+        return list(self.packages)
+
+class SyncGraphTest(unittest.TestCase):
+    def make_system(self, order):
+        db_man = DatabaseManager(None)
+        db_man.register("local", ListDatabase())
+        # registered the other way round than configured
+        db_man.register("extra", ListDatabase(Package("foo", depends=["b"]),
+                                              Package("b")))
+        db_man.register("core", ListDatabase(Package("foo", depends=["a"]),
+                                             Package("a")))
+        config = helpers.Config(events=helpers.RecordingEvents(),
+            available_repositories=OrderedDict((repo, []) for repo in order))
+        return System(helpers.Config(config=config, db_man=db_man))
+
+    def dependencies(self, graph, name):
+        return [graph.names[nid] for nid in graph.depends_on(graph.node(name))]
+
+    def test_earlier_repositories_shadow_later_ones(self):
+        system = self.make_system(["core", "extra"])
+        self.assertEqual(self.dependencies(system.sync_graph, "foo"), ["a"])
+        system = self.make_system(["extra", "core"])
+        self.assertEqual(self.dependencies(system.sync_graph, "foo"), ["b"])
+
+    def test_update_drops_the_graph(self):
+        system = self.make_system(["core", "extra"])
+        system._handle_transaction = lambda tcls: None
+        graph = system.sync_graph
+        self.assertTrue(system.sync_graph is graph)
+        system.update_databases()
+        self.assertFalse(system.sync_graph is graph)
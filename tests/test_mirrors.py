@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+
+test_mirrors.py
+---------------
+
+Tests for the probing and ranking of :mod:`pyalpmm.mirrors`, every mirror is
+a local HTTP stand-in answering after its own delay.
+"""
+
+import time
+import marshal
+import unittest
+
+from helpers import StubServer, RecordingEvents, Config, TempDirTestCase, \
+     unused_url
+from pyalpmm.download import Downloader
+from pyalpmm.mirrors import DEAD, mirror_host
+
+class MirrorRankerTest(TempDirTestCase):
+    # the answer delay of each mirror in seconds
+    delays = [0.2, 0.0, 0.1, 0.0, 0.0]
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.servers = [StubServer(self.responder(delay)) \
+                        for delay in self.delays]
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+        TempDirTestCase.tearDown(self)
+
+    def responder(self, delay):
+        def respond(path, headers):
+            time.sleep(delay)
+            return 206, {}, "x" * 1024
+        return respond
+
+    def ranker(self, spread=2):
+        return Downloader(Config(
+            events=RecordingEvents(), download_workers=8, download_timeout=5,
+            download_per_mirror=2, download_state=self.path("state"),
+            mirror_cache=self.path("mirrors"), mirror_ttl=3600,
+            mirror_spread=spread)).mirrors
+
+    def urls(self):
+        return [server.url("core.db") for server in self.servers]
+
+    def probed(self):
+        return [i for i, server in enumerate(self.servers) if server.requests]
+
+    def test_probed_mirrors_are_ranked(self):
+        urls = self.urls()
+        dead = unused_url("core.db")
+        ranked = self.ranker(spread=3).order([dead] + urls, probe=True)
+        # the first six are probed, the fastest come first, dead ones last
+        self.assertEqual(self.probed(), [0, 1, 2, 3, 4])
+        self.assertEqual(ranked[3:5], [urls[2], urls[0]])
+        self.assertEqual(ranked[-1], dead)
+
+    def test_only_the_first_mirrors_are_probed(self):
+        urls = self.urls()
+        ranked = self.ranker(spread=1).order(urls, probe=True)
+        self.assertEqual(self.probed(), [0, 1])
+        # the unprobed ones follow in the mirrorlist order
+        self.assertEqual(ranked, [urls[1], urls[0]] + urls[2:])
+
+    def test_scores_are_cached(self):
+        urls = self.urls()
+        self.ranker(spread=1).order(urls, probe=True)
+        for server in self.servers:
+            del server.requests[:]
+        ranked = self.ranker(spread=1).order(urls, probe=True)
+        self.assertEqual(self.probed(), [])
+        self.assertEqual(ranked[:2], [urls[1], urls[0]])
+
+    def test_dead_scores_expire_soon(self):
+        urls = self.urls()
+        ranker = self.ranker()
+        old = time.time() - ranker.dead_ttl - 1
+        with open(self.path("mirrors"), "wb") as fd:
+            marshal.dump({mirror_host(urls[0]): (DEAD, old),
+                          mirror_host(urls[1]): (0.5, old)}, fd)
+        scores = self.ranker().scores
+        self.assertEqual(scores.keys(), [mirror_host(urls[1])])
+
+    def test_penalized_mirror_is_not_remembered(self):
+        urls = self.urls()
+        ranker = self.ranker()
+        ranker.order(urls[:2], probe=True)
+        ranker.penalize(urls[0])
+        self.assertFalse(ranker.alive(urls[0]))
+        ranker._save()
+        self.assertTrue(self.ranker().alive(urls[0]))
+
+if __name__ == "__main__":
+    unittest.main()
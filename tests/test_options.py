@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+
+test_options.py
+---------------
+
+Tests for the configuration classes of :mod:`pyalpmm.options`.
+"""
+
+import helpers
+from pyalpmm.options import PyALPMMConfiguration, StringConfigItem, \
+     IntegerConfigItem
+
+CONFIG = """
+[repositories]
+repos = extra, core
+zeta = http://zeta.example/
+alpha = http://alpha.example/, http://alpha2.example/
+"""
+
+class ConfigTestCase(helpers.TempDirTestCase):
+    """Points the mirrorlist and the snapshot of PyALPMMConfiguration into
+    the temporary directory
+    """
+    def setUp(self):
+        super(ConfigTestCase, self).setUp()
+        with open(self.path("pyalpmm.conf"), "w") as fd:
+            fd.write(CONFIG)
+        with open(self.path("mirrorlist"), "w") as fd:
+            fd.write("Server = http://mirror.example/$repo/os/$arch\n")
+        self.saved = PyALPMMConfiguration.mirror_fn, \
+                     PyALPMMConfiguration.snapshot_fn
+        PyALPMMConfiguration.mirror_fn = self.path("mirrorlist")
+        PyALPMMConfiguration.snapshot_fn = self.path("config.cache")
+
+    def tearDown(self):
+        PyALPMMConfiguration.mirror_fn, \
+            PyALPMMConfiguration.snapshot_fn = self.saved
+        super(ConfigTestCase, self).tearDown()
+
+    def make_config(self, cls=PyALPMMConfiguration):
+        return cls(helpers.RecordingEvents(), self.path("pyalpmm.conf"))
+
+class RepositoryOrderTest(ConfigTestCase):
+    def test_config_order(self):
+        config = self.make_config()
+        self.assertEqual(list(config.available_repositories),
+                         ["extra", "core", "zeta", "alpha"])
+        self.assertEqual(config.available_repositories["alpha"],
+                         ["http://alpha.example/", "http://alpha2.example/"])
+
+    def test_snapshot_keeps_order(self):
+        self.make_config()
+        config = self.make_config()
+        self.assertEqual(config.events.names(), ["DoneReadingConfigFile"])
+        self.assertEqual(list(config.available_repositories),
+                         ["extra", "core", "zeta", "alpha"])
+
+class SubclassTest(ConfigTestCase):
+    def test_items_are_inherited(self):
+        class Config(PyALPMMConfiguration):
+            build_jobs = IntegerConfigItem("aur", 8)
+            extra_option = StringConfigItem("general", "foo")
+
+        config = self.make_config(Config)
+        self.assertEqual(list(config.available_repositories),
+                         ["extra", "core", "zeta", "alpha"])
+        self.assertEqual(config.build_jobs, 8)
+        self.assertEqual(config.extra_option, "foo")
+        self.assertEqual(config.download_workers, 4)
+        self.assertTrue("repos" in config and "extra_option" in config)
+        # the base class keeps its own items
+        self.assertEqual(self.make_config().build_jobs, 2)
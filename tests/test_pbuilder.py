@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+
+test_pbuilder.py
+----------------
+
+Tests for the tarball handling of :class:`pyalpmm.pbuilder.PackageBuilder`,
+the AUR tarballs are untrusted and extracted as root.
+"""
+
+import os
+import tarfile
+import hashlib
+import unittest
+from StringIO import StringIO
+
+from helpers import RecordingEvents, Config, TempDirTestCase
+from pyalpmm.pbuilder import PackageBuilder, BuildError
+
+def make_tarball(members):
+    """A .tar.gz with `members`, a list of (name, type, data or linkname)"""
+    buf = StringIO()
+    to = tarfile.open(fileobj=buf, mode="w:gz")
+    for name, kind, data in members:
+        info = tarfile.TarInfo(name)
+        info.type = kind
+        if kind == tarfile.REGTYPE:
+            info.size = len(data)
+            to.addfile(info, StringIO(data))
+        else:
+            info.linkname = data
+            to.addfile(info)
+    to.close()
+    return buf.getvalue()
+
+class ExtractTest(TempDirTestCase):
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        os.mkdir(self.path("cache"))
+        config = Config(events=RecordingEvents(), build_dir=self.path("build"),
+                        aur_cache_dir=self.path("cache"), aur_max_size=1 << 20)
+        pkg = Config(repo="aur", name="foo", version="1.0-1")
+        self.builder = PackageBuilder(Config(config=config), pkg)
+        os.makedirs(os.path.dirname(self.builder.path))
+
+    def extract(self, members):
+        self.builder._extract(StringIO(make_tarball(members)))
+
+    def cache(self, data, checksum=None):
+        with open(self.builder.cache_path, "wb") as fd:
+            fd.write(data)
+        with open(self.builder.cache_path + ".sha256", "w") as fd:
+            fd.write((checksum or hashlib.sha256(data).hexdigest()) + "\n")
+
+    def test_regular_tarball(self):
+        self.extract([("foo", tarfile.DIRTYPE, ""),
+                      ("foo/PKGBUILD", tarfile.REGTYPE, "pkgname=foo\n"),
+                      ("foo/link", tarfile.SYMTYPE, "PKGBUILD")])
+        with open(self.path("build", "aur", "foo", "link")) as fd:
+            self.assertEqual(fd.read(), "pkgname=foo\n")
+
+    def test_escaping_members_are_refused(self):
+        for members in (
+            [("../evil", tarfile.REGTYPE, "x")],
+            [("/tmp/evil", tarfile.REGTYPE, "x")],
+            [("foo/link", tarfile.SYMTYPE, "../../../outside")],
+            [("foo/link", tarfile.SYMTYPE, "/etc")],
+            [("foo/hard", tarfile.LNKTYPE, "../outside")],
+            [("foo/dev", tarfile.CHRTYPE, "")]):
+            self.assertRaises(BuildError, self.extract, members)
+
+    def test_write_through_a_link_is_refused(self):
+        self.assertRaises(BuildError, self.extract,
+                          [("foo/etc", tarfile.SYMTYPE, "/etc"),
+                           ("foo/etc/evil", tarfile.REGTYPE, "x")])
+        self.assertFalse(os.path.exists(self.path("build", "aur", "foo",
+                                                  "etc")))
+
+    def test_link_chains_are_resolved(self):
+        # "b/.." looks harmless, but "b" points to the parent directory
+        self.assertRaises(BuildError, self.extract,
+                          [("foo", tarfile.DIRTYPE, ""),
+                           ("foo/b", tarfile.SYMTYPE, ".."),
+                           ("foo/c", tarfile.SYMTYPE, "b/..")])
+        self.assertRaises(BuildError, self.extract,
+                          [("foo/b/../../evil", tarfile.REGTYPE, "x")])
+
+    def test_valid_cache_entry_is_extracted(self):
+        self.cache(make_tarball([("foo/PKGBUILD", tarfile.REGTYPE, "x")]))
+        self.assertTrue(self.builder._extract_cached())
+        self.assertTrue(os.path.exists(self.path("build", "aur", "foo",
+                                                 "PKGBUILD")))
+
+    def test_cache_entry_is_verified_before_extracting(self):
+        self.cache(make_tarball([("foo/PKGBUILD", tarfile.REGTYPE, "x")]),
+                   checksum="0" * 64)
+        self.assertFalse(self.builder._extract_cached())
+        self.assertFalse(os.path.exists(self.path("build", "aur", "foo")))
+        self.assertFalse(os.path.exists(self.builder.cache_path))
+
+if __name__ == "__main__":
+    unittest.main()
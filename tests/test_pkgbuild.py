@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+
+test_pkgbuild.py
+----------------
+
+Tests for the PKGBUILD and .SRCINFO parsers of :mod:`pyalpmm.pkgbuild`.
+"""
+
+import unittest
+
+import helpers
+from pyalpmm.pkgbuild import parse_pkgbuild, parse_srcinfo, \
+     split_dependency, PKGBUILDCache
+
+PKGBUILD = """
+pkgname=foo
+pkgver=1.2
+depends=('' "bar>=$pkgver"   # a comment
+         baz)
+makedepends=()
+"""
+
+class ParseTest(unittest.TestCase):
+    def test_empty_entries_are_skipped(self):
+        meta = parse_pkgbuild(PKGBUILD)
+        self.assertEqual(meta["depends"], ["bar>=1.2", "baz"])
+        self.assertEqual(meta["makedepends"], [])
+
+    def test_srcinfo(self):
+        meta = parse_srcinfo("pkgbase = foo\n\tpkgver = 1\n"
+                             "\tdepends = bar\n\tdepends = \n")
+        self.assertEqual(meta["depends"], ["bar"])
+        self.assertEqual(meta["pkgver"], "1")
+
+    def test_split_dependency(self):
+        self.assertEqual(split_dependency("bar>=1.2"), ("bar", ">=", "1.2"))
+        self.assertEqual(split_dependency(" baz "), ("baz", None, None))
+
+    def test_dependencies_skip_empty_cached_entries(self):
+        cache = PKGBUILDCache(helpers.Config(aur_cache_dir="/nonexistent"))
+        pkg = helpers.Config(name="foo", version="1.2-1")
+        cache.memory[cache._path(pkg)] = {"depends": ["", "bar>=1"],
+                                          "makedepends": [" "]}
+        self.assertEqual(cache.dependencies(pkg), [("bar", ">=", "1")])
+
+if __name__ == "__main__":
+    unittest.main()
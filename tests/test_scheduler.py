@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+
+test_scheduler.py
+-----------------
+
+Tests for the level grouping and the concurrent builds of
+:class:`pyalpmm.scheduler.BuildScheduler`, the builders are stand-ins.
+"""
+
+import time
+import threading
+import unittest
+
+from helpers import RecordingEvents, Config
+from pyalpmm.pbuilder import BuildError
+from pyalpmm.scheduler import BuildScheduler
+
+class StubBuilder(object):
+    """Counts the builds running at the same time, raises `error` if set"""
+    def __init__(self, scheduler, name, error=None):
+        self.scheduler = scheduler
+        self.pkg = Config(name=name)
+        self.error = error
+        self.built = False
+
+    def makepkg(self):
+        s = self.scheduler
+        with s.lock:
+            s.running += 1
+            s.max_running = max(s.max_running, s.running)
+        try:
+            time.sleep(0.05)
+            if self.error is not None:
+                raise self.error
+            self.built = True
+        finally:
+            with s.lock:
+                s.running -= 1
+
+class StubScheduler(BuildScheduler):
+    """Hands out a :class:`StubBuilder` for each package
+
+    :param errors: a dict mapping package names to the exception their
+                   build raises (optional)
+    """
+    def __init__(self, names, deps, build_jobs=2, errors=None):
+        session = Config(config=Config(events=RecordingEvents(),
+                                       build_jobs=build_jobs))
+        BuildScheduler.__init__(self, session,
+                                [Config(name=name) for name in names], deps)
+        self.errors = errors or {}
+        self.lock = threading.Lock()
+        self.running = self.max_running = 0
+        self.builders = {}
+
+    def _prepare(self, name):
+        builder = self.builders[name] = StubBuilder(self, name,
+                                                    self.errors.get(name))
+        return builder
+
+class LevelsTest(unittest.TestCase):
+    def levels(self, names, deps):
+        return StubScheduler(names, deps).levels()
+
+    def test_grouping(self):
+        deps = {"app": ["libb", "liba"], "libb": ["liba"],
+                "tool": ["not-from-aur"], "liba": ["liba"]}
+        self.assertEqual(self.levels(["app", "libb", "liba", "tool"], deps),
+                         [["liba", "tool"], ["libb"], ["app"]])
+
+    def test_independent_packages_share_a_level(self):
+        self.assertEqual(self.levels(["b", "a", "c"], {}), [["a", "b", "c"]])
+
+    def test_cycle(self):
+        deps = {"a": ["b"], "b": ["c"], "c": ["a"], "d": []}
+        self.assertRaises(BuildError, self.levels, ["a", "b", "c", "d"], deps)
+
+class BuildLevelTest(unittest.TestCase):
+    def build(self, scheduler, names):
+        """Run build_level() in a thread, so a hang fails the test"""
+        outcome = []
+        def run():
+            try:
+                outcome.append(scheduler.build_level(names))
+            except BuildError as e:
+                outcome.append(e)
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), "build_level() hangs")
+        return outcome[0]
+
+    def test_jobs_limit(self):
+        names = ["pkg{0}".format(i) for i in xrange(6)]
+        scheduler = StubScheduler(names, {}, build_jobs=2)
+        builders = self.build(scheduler, names)
+        self.assertEqual([b.pkg.name for b in builders], names)
+        self.assertTrue(all(b.built for b in builders))
+        self.assertEqual(scheduler.max_running, 2)
+        events = scheduler.session.config.events.names()
+        self.assertEqual(events.count("StartBuild"), 6)
+        self.assertEqual(events.count("DoneBuild"), 6)
+
+    def test_worker_exception(self):
+        names = ["good1", "broken", "good2"]
+        scheduler = StubScheduler(names, {}, build_jobs=1,
+                                  errors={"broken": OSError("no makepkg")})
+        error = self.build(scheduler, names)
+        self.assertTrue(isinstance(error, BuildError))
+        self.assertTrue("broken: no makepkg" in str(error), str(error))
+        # the other builds were not given up
+        self.assertTrue(scheduler.builders["good1"].built)
+        self.assertTrue(scheduler.builders["good2"].built)
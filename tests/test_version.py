@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+
+test_version.py
+---------------
+
+The version comparison of :mod:`pyalpmm.tools` against the cases of pacman's
+vercmptest.sh.
+"""
+
+import unittest
+
+import helpers
+from pyalpmm import tools
+from pyalpmm.tools import FancyVersion, vercmp, compare_versions, \
+     parse_version
+
+# (version a, version b, expected result), each case is checked reversed, too
+VERCMP_CASES = [
+    # all similar length, no pkgrel
+    ("1.5.0", "1.5.0", 0),
+    ("1.5.1", "1.5.0", 1),
+    # mixed length
+    ("1.5.1", "1.5", 1),
+    # with pkgrel, simple
+    ("1.5.0-1", "1.5.0-1", 0),
+    ("1.5.0-1", "1.5.0-2", -1),
+    ("1.5.0-1", "1.5.1-1", -1),
+    ("1.5.0-2", "1.5.1-1", -1),
+    # with pkgrel, mixed lengths
+    ("1.5-1", "1.5.1-1", -1),
+    ("1.5-2", "1.5.1-1", -1),
+    ("1.5-2", "1.5.1-2", -1),
+    # mixed pkgrel inclusion
+    ("1.5", "1.5-1", 0),
+    ("1.5-1", "1.5", 0),
+    ("1.1-1", "1.1", 0),
+    ("1.0-1", "1.1", -1),
+    ("1.1-1", "1.0", 1),
+    # alphanumeric versions
+    ("1.5b-1", "1.5-1", -1),
+    ("1.5b", "1.5", -1),
+    ("1.5b-1", "1.5", -1),
+    ("1.5b", "1.5.1", -1),
+    # from the manpage
+    ("1.0a", "1.0alpha", -1),
+    ("1.0alpha", "1.0b", -1),
+    ("1.0b", "1.0beta", -1),
+    ("1.0beta", "1.0rc", -1),
+    ("1.0rc", "1.0", -1),
+    # going crazy? alpha-dotted versions
+    ("1.5.a", "1.5", 1),
+    ("1.5.b", "1.5.a", 1),
+    ("1.5.1", "1.5.b", 1),
+    # alpha dots and dashes
+    ("1.5.b-1", "1.5.b", 0),
+    ("1.5-1", "1.5.b", -1),
+    # same/similar content, differing separators
+    ("2.0", "2_0", 0),
+    ("2.0_a", "2_0.a", 0),
+    ("2.0a", "2.0.a", -1),
+    ("2___a", "2_a", 1),
+    # epoch included version comparisons
+    ("0:1.0", "0:1.0", 0),
+    ("0:1.0", "0:1.1", -1),
+    ("1:1.0", "0:1.0", 1),
+    ("1:1.0", "0:1.1", 1),
+    ("1:1.0", "2:1.1", -1),
+    # epoch + sometimes present pkgrel
+    ("1:1.0", "0:1.0-1", 1),
+    ("1:1.0-1", "0:1.1-1", 1),
+    # epoch included on one version
+    ("0:1.0", "1.0", 0),
+    ("0:1.0", "1.1", -1),
+    ("0:1.1", "1.0", 1),
+    ("1:1.0", "1.0", 1),
+    ("1:1.0", "1.1", 1),
+    ("1:1.1", "1.1", 1),
+]
+
+class VercmpTest(unittest.TestCase):
+    def check(self, compare):
+        for a, b, expected in VERCMP_CASES:
+            self.assertEqual(compare(a, b), expected, (a, b))
+            self.assertEqual(compare(b, a), -expected, (b, a))
+
+    def test_vercmp(self):
+        self.check(vercmp)
+
+    def test_fallback(self):
+        self.check(lambda a, b: compare_versions(parse_version(a),
+                                                 parse_version(b)))
+
+    def test_fancy_version(self):
+        self.check(lambda a, b: (FancyVersion(a) > FancyVersion(b)) - \
+                                (FancyVersion(a) < FancyVersion(b)))
+
+class RoutingTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = tools._alpm_vercmp
+        self.calls = []
+
+    def tearDown(self):
+        tools._alpm_vercmp = self.saved
+
+    def test_libalpm_decides(self):
+        # a deliberately wrong comparator shows who answered
+        tools._alpm_vercmp = lambda a, b: self.calls.append((a, b)) or -5
+        self.assertTrue(FancyVersion("2.0") < FancyVersion("1.0"))
+        self.assertEqual(self.calls, [("2.0", "1.0")])
+        self.assertEqual(vercmp("2.0", "1.0"), -1)
+
+    def test_fallback_without_libalpm(self):
+        tools._alpm_vercmp = None
+        self.assertTrue(FancyVersion("2.0") > FancyVersion("1.0"))
+        self.assertTrue(FancyVersion("1:1.0") > "2.0")